@@ -0,0 +1,9 @@
+"""ASGI entry point for Scholarship App, the read-only pages are served by
+async handlers and every other request by run.py's WSGI app
+
+    uvicorn asgi:application --host 0.0.0.0 --port 7225
+"""
+from run import app, parent_app
+from scholarship_graph.asgi import AsyncApp
+
+application = AsyncApp(app, parent_app, mount="/scholarship-graph")
@@ -0,0 +1,103 @@
+"""Compares one sync worker with one ASGI process when the triplestore is
+slow. Both serve run.py's parent_app pages against the local SPARQL
+stand-in with a delay added to every query: the sync worker is a single
+threaded WSGI server, like a gunicorn sync worker, and the ASGI process is
+asgi.py under uvicorn. GET requests only, the read-only pages.
+
+instance/config.py must point the datastore connection at a localhost URL
+as for benchmarks.loadtest.
+
+    python -m benchmarks.asgi_concurrency --delay 0.2 --concurrency 32
+"""
+__author__ = "Jeremy Nelson"
+
+import logging
+import subprocess
+import sys
+import threading
+import time
+
+import click
+import requests
+
+from benchmarks.loadtest import MOUNT, datastore_address, load_graph, plan
+from benchmarks.loadtest import report, run_plan, summarize, targets
+from benchmarks.sparql_endpoint import serve
+from benchmarks.worker_memory import free_port
+
+DEFAULT_MIX = "home=1,person=6,org=2,subject=1"
+
+def wait_for(base_url, process=None, timeout=60):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            requests.get(base_url + "/metrics", timeout=5)
+            return
+        except requests.ConnectionError:
+            if time.time() > deadline or \
+               (process is not None and process.poll() is not None):
+                raise click.ClickException("Server did not start")
+            time.sleep(0.25)
+
+def run_sync(requests_plan, concurrency):
+    from werkzeug.serving import make_server
+    from run import parent_app
+
+    server = make_server("127.0.0.1", 0, parent_app, threaded=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:{}{}".format(server.server_port, MOUNT)
+    try:
+        run_plan(base_url, requests_plan[:concurrency], concurrency)
+        return run_plan(base_url, requests_plan, concurrency)
+    finally:
+        server.shutdown()
+
+def run_async(requests_plan, concurrency):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "asgi:application",
+         "--port", str(port), "--log-level", "warning"])
+    base_url = "http://127.0.0.1:{}{}".format(port, MOUNT)
+    try:
+        wait_for(base_url, process)
+        run_plan(base_url, requests_plan[:concurrency], concurrency)
+        return run_plan(base_url, requests_plan, concurrency)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@click.command()
+@click.option("--data", multiple=True, default=["data/*.ttl"],
+    help="Turtle files to load, may be given more than once")
+@click.option("--people", default=400, help="People in the synthetic graph")
+@click.option("--delay", default=0.2, help="Seconds added to every query")
+@click.option("--requests", "count", default=200, help="Requests to send")
+@click.option("--concurrency", default=32, help="Concurrent clients")
+@click.option("--mix", default=DEFAULT_MIX,
+    help="Weights of home, person, org and subject requests")
+@click.option("--seed", default=0)
+def main(data, people, delay, count, concurrency, mix, seed):
+    from scholarship_graph.app import app
+
+    app.config.from_pyfile("config.py")
+    host, port = datastore_address(app.config)
+    graph = load_graph(data, people, 20, 3, seed)
+    endpoint = serve(graph, host, port, delay)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    requests_plan = plan(mix, count, targets(graph), seed)
+    summaries = dict()
+    for name, runner in [("sync worker", run_sync),
+                         ("asgi", run_async)]:
+        click.echo("\n{}, {:.0f} ms per query, {} clients".format(
+            name, delay * 1000, concurrency))
+        summaries[name] = summarize(*runner(requests_plan, concurrency))
+        report(summaries[name])
+    endpoint.shutdown()
+    click.echo("\nasgi throughput {:.1f}x the sync worker".format(
+        summaries["asgi"]["total"]["throughput"] /
+        summaries["sync worker"]["total"]["throughput"]))
+
+
+if __name__ == "__main__":
+    main()
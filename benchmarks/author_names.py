@@ -0,0 +1,112 @@
+"""Throughput of author name parsing over every cite:authorString in
+data/creative-works.ttl, the regular expressions utilities.Citation used to
+run for each name against scholarship_graph.authors with and without its
+parse cache. Every name must parse to the same given and family names.
+
+    python -m benchmarks.author_names --data data/creative-works.ttl
+"""
+__author__ = "Jeremy Nelson"
+
+import re
+import timeit
+
+import click
+import rdflib
+
+from scholarship_graph import authors
+
+CITE = rdflib.Namespace("https://www.coloradocollege.edu/library/ns/citation/")
+
+def legacy_parse(author_string):
+    """Given and family names as Citation.__CC_author__ parsed them, None
+    for names it failed on"""
+    output = []
+    default = " and "
+    for row in [";", ",", " and "]:
+        if row in author_string:
+            default = row
+            break
+    for name in author_string.split(default):
+        name_parsed = ""
+        name = name.strip()
+        if name.endswith("."):
+            name = name[:-1]
+        if "." in name:
+            try:
+                name_parsed = re.search(r"(\w+)\s\w?\.\s(\w+\-?\w+)",name).groups()
+            except:
+                if re.search(r"w?\.\s(\w+)\s(\w+\-?\w+)",name) != None:
+                    name_parsed = re.search(r"w?\.\s(\w+)\s(\w+\-?\w+)",name).groups()
+                elif re.search(r"(\w+\.)\s(\w+\.)\s(\w+)",name) != None:
+                    name_parsed = re.search(r"(\w+\.)\s(\w+\.)\s(\w+)",name).groups()
+                elif re.search(r"(\w+)\s\w?\.\s\w?\.\s(\w+\-?\w+)",name) !=None:
+                    name_parsed = re.search(r"(\w+)\s\w?\.\s\w?\.\s(\w+\-?\w+)",name).groups()
+                elif re.search(r"(\w+\.)\s(\w+)",name) != None:
+                    name_parsed = re.search(r"(\w+\.)\s(\w+)",name).groups()
+            else:
+                name_parsed = []
+                for word in name.split(" "):
+                    word = word.strip()
+                    if word != None or word != "":
+                        name_parsed.append(word)
+        else:
+            name_parsed = []
+            for word in name.split(" "):
+                name_parsed.append(word)
+        if len(name_parsed) < 1:
+            output.append(None)
+            continue
+        output.append((name_parsed[0], name_parsed[len(name_parsed)-1]))
+    return output
+
+def uncached_parse(author_string):
+    return [authors.parse_name.__wrapped__(name)
+            for name in authors.split_authors(author_string)]
+
+def parsed(author_string):
+    return [(name.given, name.family)
+            for name in authors.parse_authors(author_string)]
+
+
+@click.command()
+@click.option("--data", default="data/creative-works.ttl",
+    help="Turtle file with cite:authorString values")
+@click.option("--repeat", default=5, help="Timed passes over the strings")
+def main(data, repeat):
+    graph = rdflib.Graph()
+    graph.parse(data, format="turtle")
+    author_strings = [str(value) for value in
+                      graph.objects(predicate=CITE.authorString)]
+    names = sum(len(authors.split_authors(value)) for value in author_strings)
+    click.echo("{:,} author strings, {:,} names".format(len(author_strings),
+                                                       names))
+    mismatches, failed = 0, 0
+    for author_string in author_strings:
+        for before, after in zip(legacy_parse(author_string),
+                                 parsed(author_string)):
+            if before is None:
+                failed += 1
+            elif before != after:
+                mismatches += 1
+                click.echo("Mismatch {!r}: {} {}".format(author_string,
+                                                          before, after))
+    click.echo("{} names the old parser failed on, {} mismatches".format(
+        failed, mismatches))
+    timings = dict()
+    for label, function in [("regex per name", legacy_parse),
+                            ("combined, no cache", uncached_parse),
+                            ("combined, cached", authors.parse_authors)]:
+        authors.parse_name.cache_clear()
+        seconds = min(timeit.repeat(
+            lambda: [function(value) for value in author_strings],
+            number=1, repeat=repeat))
+        timings[label] = seconds
+        click.echo("{:<20} {:>10,.0f} names/s".format(label, names / seconds))
+    click.echo("{:,} distinct names cached".format(
+        authors.parse_name.cache_info().currsize))
+    click.echo("cached parser {:.1f}x the old parser".format(
+        timings["regex per name"] / timings["combined, cached"]))
+
+
+if __name__ == "__main__":
+    main()
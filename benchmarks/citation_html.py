@@ -0,0 +1,150 @@
+"""Benchmark of the string-built citation_html against the BeautifulSoup
+renderer it replaced, reporting per-call latency and peak memory
+
+    python -m benchmarks.citation_html --calls 2000
+
+Requires beautifulsoup4 and lxml for the comparison.
+"""
+__author__ = "Jeremy Nelson"
+
+import importlib.util
+import timeit
+import tracemalloc
+
+import click
+
+from scholarship_graph.citations import citation_html
+
+ARTICLE = {"ENTRYTYPE": "article",
+           "iri": "http://catalog.coloradocollege.edu/example-article",
+           "author": "Jane C. Doe, John Smith",
+           "year": "2018",
+           "journal_title": "Journal of Library Metadata",
+           "article_title": "Linked data & the <scholarship> graph",
+           "url": "https://doi.org/10.1000/example",
+           "volume_number": "18",
+           "issue_number": "2",
+           "page_start": "101",
+           "page_end": "120"}
+
+BOOK = {"ENTRYTYPE": "book",
+        "iri": "https://tiger.coloradocollege.edu/record=b1671273~s5",
+        "author": "David Mason",
+        "year": "2003",
+        "title": "Along these lines",
+        "isbn": "",
+        "edition": ""}
+
+
+def soup_citation_html(citation):
+    """generate_citation_html as it was before citation_html replaced it"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup("", 'lxml')
+    div = soup.new_tag("div", **{"class": "row"})
+    col_1 = soup.new_tag("div", **{"class": "col-1"})
+    citation_type = citation.get("ENTRYTYPE")
+    if citation_type.startswith("article"):
+       col_1.append(soup.new_tag("i", **{"class": "fas fa-file-alt"}))
+    elif citation_type.endswith("book"):
+        col_1.append(soup.new_tag("i", **{"class": "fas fa-book"}))
+    under_review = soup.new_tag("em")
+    under_review.string = "In Review"
+    col_1.append(under_review)
+    div.append(col_1)  
+    col_2 = soup.new_tag("div", **{"class": "col-7"})
+    if "article_title" in citation:
+        name = citation.get("article_title")
+    elif "title" in citation:
+        name = citation.get("title")
+    if "url" in citation:
+        work_link = soup.new_tag("a", href=citation.get("url"))
+        work_link.string = name
+        col_2.append(work_link)
+    else:
+        span = soup.new_tag("span")
+        span.string = name
+        col_2.append(span)
+    if "journal_title" in citation:
+        em = soup.new_tag("em")
+        em.string = citation.get("journal_title")
+        col_2.append(em)
+    if "year" in citation:
+        span = soup.new_tag("span")
+        span.string = "({0})".format(citation.get("year"))
+        col_2.append(span)
+    vol_number = citation.get("volume_number")
+    if vol_number and len(vol_number) > 0:
+        span = soup.new_tag("span")
+        span.string = "v. {}".format(vol_number)
+        col_2.append(span)
+    issue_number = citation.get("issue_number")
+    if issue_number and len(issue_number ) > 0:
+        span = soup.new_tag("span")
+        span.string = " no. {}".format(issue_number)
+        col_2.append(span)
+    page_start = citation.get("page_start")
+    if page_start and len(page_start) > 0:
+        span = soup.new_tag("span")
+        span.string = "p. {}".format(page_start)
+        col_2.append(span)
+    page_end = citation.get("page_end")
+    if page_end and len(page_end) > 0:
+        span = soup.new_tag("span")
+        if "page_start" in citation: 
+            page_string = "- {}."
+        else:
+            page_string = "{}."
+        span.string = page_string.format(page_end)
+        col_2.append(span)
+    div.append(col_2)
+    col_3 = soup.new_tag("div", **{"class": "col-4"})
+    iri = citation.get("iri")
+    if iri:
+        edit_click = "editCitation('{}');".format(iri)
+        delete_click = "deleteCitation('{}');".format(iri)
+    edit_a = soup.new_tag("a", **{"class": "btn btn-warning disabled",
+                                 "onclick": edit_click,
+                                 "type=": "input"})
+    edit_a.append(soup.new_tag("i", **{"class": "fas fa-edit"}))
+    col_3.append(edit_a)
+    delete_a = soup.new_tag("a", **{"class": "btn btn-danger",
+                                   "onclick": delete_click,
+                                   "type=": "input"})
+    delete_a.append(soup.new_tag("i", **{"class": "fas fa-trash-alt"}))
+    col_3.append(delete_a)
+    div.append(col_3)
+    return div.prettify()
+
+
+def measure(function, citation, calls):
+    seconds = min(timeit.repeat(lambda: function(citation),
+                                number=calls,
+                                repeat=5)) / calls
+    tracemalloc.start()
+    function(citation)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+@click.command()
+@click.option("--calls", default=2000, help="Calls per timed run")
+def main(calls):
+    renderers = [("citation_html", citation_html)]
+    if all(importlib.util.find_spec(name) is not None
+           for name in ["bs4", "lxml"]):
+        renderers.append(("BeautifulSoup", soup_citation_html))
+    else:
+        click.echo("beautifulsoup4 and lxml are not installed, "
+                   "only timing citation_html")
+    click.echo("{:<16}{:<10}{:>14}{:>16}".format(
+        "renderer", "citation", "usec/call", "peak KiB/call"))
+    for name, function in renderers:
+        for label, citation in [("article", ARTICLE), ("book", BOOK)]:
+            seconds, peak = measure(function, citation, calls)
+            click.echo("{:<16}{:<10}{:>14.1f}{:>16.1f}".format(
+                name, label, seconds * 1e6, peak / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Concurrent logins through the directory layer with and without the
+connection pool. The directory is ldap3's MOCK_SYNC stand-in loaded from a
+generated JSON export of people, so no LDAP server is needed; every seventh
+login uses a wrong password and must fail.
+
+    python -m benchmarks.ldap_logins --people 500 --logins 2000
+"""
+__author__ = "Jeremy Nelson"
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+import click
+from flask import Flask
+
+from scholarship_graph.directory import PooledLDAP3LoginManager
+
+BASE_DN = "dc=coloradocollege,dc=edu"
+SERVICE_DN = "cn=scholarship,{}".format(BASE_DN)
+
+def mock_directory(path, people):
+    entries = [{"dn": SERVICE_DN,
+                "raw": {"objectClass": ["person"],
+                        "cn": ["scholarship"],
+                        "userPassword": ["service"]}}]
+    for number in range(people):
+        entries.append({
+            "dn": "uid=user{0},ou=people,{1}".format(number, BASE_DN),
+            "raw": {"objectClass": ["person"],
+                    "uid": ["user{}".format(number)],
+                    "mail": ["user{}@coloradocollege.edu".format(number)],
+                    "userPassword": ["password{}".format(number)]}})
+    with open(path, "w") as directory:
+        json.dump({"entries": entries}, directory)
+
+def run(mock_data, pool_size, people, logins, concurrency, search_bind):
+    app = Flask(__name__)
+    app.config.update(LDAP_HOST="localhost",
+                      LDAP_MOCK_DATA=mock_data,
+                      LDAP_BASE_DN=BASE_DN,
+                      LDAP_USER_DN="ou=people",
+                      LDAP_USER_SEARCH_SCOPE="SUBTREE",
+                      LDAP_BIND_USER_DN=SERVICE_DN,
+                      LDAP_BIND_USER_PASSWORD="service",
+                      LDAP_SEARCH_FOR_GROUPS=False,
+                      LDAP_ALWAYS_SEARCH_BIND=search_bind,
+                      LDAP_POOL_SIZE=pool_size)
+    manager = PooledLDAP3LoginManager(app)
+    attempts = iter(range(logins))
+    lock = threading.Lock()
+    outcomes = {"success": 0, "fail": 0, "wrong": 0}
+
+    def worker():
+        while True:
+            with lock:
+                attempt = next(attempts, None)
+            if attempt is None:
+                return
+            number = attempt % people
+            password = "password{}".format(number)
+            if attempt % 7 == 0:
+                password = "wrong"
+            with app.app_context():
+                response = manager.authenticate("user{}".format(number),
+                                                password)
+            status = response.status.name
+            with lock:
+                outcomes[status] += 1
+                if (status == "success") == (password == "wrong"):
+                    outcomes["wrong"] += 1
+
+    start = time.time()
+    threads = [threading.Thread(target=worker) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, outcomes, manager.stats()
+
+
+@click.command()
+@click.option("--people", default=500, help="People in the directory")
+@click.option("--logins", default=2000, help="Login attempts")
+@click.option("--concurrency", default=32, help="Concurrent logins")
+@click.option("--pool-size", default=10, help="Pooled connections")
+@click.option("--search-bind", is_flag=True,
+    help="Find users with the service account before binding as them")
+def main(people, logins, concurrency, pool_size, search_bind):
+    handle, mock_data = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    try:
+        mock_directory(mock_data, people)
+        for size in [0, pool_size]:
+            elapsed, outcomes, stats = run(mock_data, size, people, logins,
+                                           concurrency, search_bind)
+            click.echo("{:<12} {:>8.1f} logins/s {:>6} ok {:>6} failed "
+                       "{:>4} wrong {:>6} connections opened".format(
+                "pool {}".format(size) if size else "no pool",
+                logins / elapsed, outcomes["success"], outcomes["fail"],
+                outcomes["wrong"],
+                sum(pool["opened"] for pool in stats.values()) if size
+                else "-"))
+    finally:
+        os.remove(mock_data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Load test of run.py's parent_app against a local SPARQL stand-in loaded
+from data/*.ttl and a synthetic people and academic-year graph.
+
+instance/config.py must point the datastore connection at a localhost
+URL, the stand-in listens on that port. Latency percentiles, throughput
+and queries per page (from the Server-Timing header) are reported for
+each kind of page and can be saved as a baseline for later runs.
+
+The page, JSON response, search result and query caches are off unless
+--caches is given, so every request reaches the triplestore and a run
+measures the pages rather than the cache hit rate. Runs are only compared
+with a baseline taken with the same setting.
+
+    python -m benchmarks.loadtest --requests 1000 --concurrency 8
+    python -m benchmarks.loadtest --save-baseline
+    python -m benchmarks.loadtest --data "/tmp/graph-10x/*.ttl"
+"""
+__author__ = "Jeremy Nelson"
+
+import glob
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import click
+import rdflib
+import requests
+
+from benchmarks.sparql_endpoint import serve
+from benchmarks.synthetic import BF, SCHEMA, people_graph
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines",
+                        "loadtest.json")
+MOUNT = "/scholarship-graph"
+QUERIES_RE = re.compile(r'sparql;[^,]*desc="(\d+) queries')
+DEFAULT_MIX = "home=1,person=6,org=2,subject=1,search=2"
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if len(values) < 1:
+        return 0.0
+    rank = max(1, int(round(fraction * len(values) + 0.5)))
+    return values[min(rank, len(values)) - 1]
+
+def datastore_address(config):
+    """Host and port of the datastore connection in the app's config"""
+    for connection in config.get("CONNECTIONS", []):
+        if connection.get("name", "").startswith("datastore"):
+            url = urlparse(connection.get("url"))
+            return url.hostname, url.port or 80
+    raise click.ClickException("No datastore connection in CONNECTIONS")
+
+def load_graph(data, people, departments, years, seed):
+    graph = rdflib.Graph()
+    for pattern in data:
+        for path in sorted(glob.glob(pattern)):
+            graph.parse(path, format="turtle")
+    # Graphs from benchmarks.synthetic already describe their people
+    if (None, rdflib.RDF.type, BF.Person) in graph:
+        return graph
+    authors = set(graph.objects(None, SCHEMA.author))
+    authors.update(graph.objects(None, SCHEMA.accountablePerson))
+    graph += people_graph(authors, max(people, len(authors)),
+                          departments, years, seed)
+    return graph
+
+def targets(graph):
+    """IRIs and names the request mix is drawn from"""
+    return {
+        "person": sorted(graph.subjects(rdflib.RDF.type, BF.Person)),
+        "org": sorted(graph.subjects(rdflib.RDF.type,
+                                     SCHEMA.CollegeDepartment)),
+        "subject": sorted(graph.subjects(rdflib.RDF.type, BF.Topic)),
+        "search": sorted(set(str(name) for name in
+                             graph.objects(None, SCHEMA.familyName)))}
+
+def plan(mix, count, pool, seed):
+    """Returns count (kind, method, path, data) requests drawn from the
+    weighted mix"""
+    rng = random.Random(seed)
+    kinds, weights = [], []
+    for entry in mix.split(","):
+        kind, weight = entry.split("=")
+        if kind != "home" and len(pool.get(kind, [])) < 1:
+            continue
+        kinds.append(kind)
+        weights.append(float(weight))
+    requests_plan = []
+    for kind in rng.choices(kinds, weights, k=count):
+        if kind == "home":
+            requests_plan.append((kind, "GET", "/", None))
+            continue
+        target = str(rng.choice(pool[kind]))
+        if kind == "person":
+            requests_plan.append((kind, "GET", "/person", {"iri": target}))
+        elif kind == "org":
+            requests_plan.append((kind, "GET", "/org", {"uri": target}))
+        elif kind == "subject":
+            requests_plan.append((kind, "GET", "/subject", {"iri": target}))
+        else:
+            requests_plan.append((kind, "POST", "/search",
+                                  {"person": target, "keywords": ""}))
+    return requests_plan
+
+def disable_caches(views):
+    """Turns off the caches of scholarship_graph.app that would answer
+    repeated requests without rendering or querying"""
+    for cache in [views.FRAGMENT_CACHE, views.JSON_RESPONSES,
+                  views.SEARCH_RESULTS]:
+        cache.max_entries = 0
+        cache.clear()
+    views.CONNECTION.cache = None
+
+def run_plan(base_url, requests_plan, concurrency):
+    """Sends every request with concurrency sessions and returns
+    (kind, status, seconds, queries) tuples and the wall time"""
+    local = threading.local()
+
+    def __send__(entry):
+        kind, method, path, data = entry
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        if method == "GET":
+            response = local.session.get(base_url + path, params=data)
+        else:
+            response = local.session.post(base_url + path, data=data)
+        elapsed = time.perf_counter() - start
+        queries = 0
+        for hop in response.history + [response]:
+            match = QUERIES_RE.search(hop.headers.get("Server-Timing", ""))
+            if match is not None:
+                queries += int(match.group(1))
+        return kind, response.status_code, elapsed, queries
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(__send__, requests_plan))
+    return results, time.perf_counter() - start
+
+def summarize(results, wall_time):
+    summary = dict()
+    for kind in sorted(set(result[0] for result in results)):
+        rows = [result for result in results if result[0] == kind]
+        latencies = sorted(result[2] for result in rows)
+        summary[kind] = {
+            "requests": len(rows),
+            "errors": len([row for row in rows if row[1] >= 400]),
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "queries": sum(row[3] for row in rows) / len(rows)}
+    summary["total"] = {"requests": len(results),
+                        "seconds": wall_time,
+                        "throughput": len(results) / wall_time}
+    return summary
+
+def report(summary, baseline=None, tolerance=0.2):
+    """Prints the summary and returns the regressions against baseline"""
+    regressions = []
+    click.echo("{:<10}{:>8}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+        "page", "reqs", "errors", "p50 ms", "p95 ms", "p99 ms", "queries"))
+    for kind, stats in sorted(summary.items()):
+        if kind == "total":
+            continue
+        click.echo("{:<10}{:>8}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}".format(
+            kind, stats["requests"], stats["errors"], stats["p50"] * 1000,
+            stats["p95"] * 1000, stats["p99"] * 1000, stats["queries"]))
+        previous = (baseline or {}).get(kind)
+        if previous is None:
+            continue
+        if stats["p95"] > previous["p95"] * (1 + tolerance):
+            regressions.append("{} p95 {:.1f} ms, baseline {:.1f} ms".format(
+                kind, stats["p95"] * 1000, previous["p95"] * 1000))
+        if stats["queries"] > previous["queries"] + 0.5:
+            regressions.append("{} {:.1f} queries per page, baseline {:.1f}"
+                .format(kind, stats["queries"], previous["queries"]))
+    total = summary["total"]
+    click.echo("caches {}".format("on" if total.get("caches") else "off"))
+    click.echo("{:,} requests in {:.1f}s, {:.1f} requests/s".format(
+        total["requests"], total["seconds"], total["throughput"]))
+    return regressions
+
+
+@click.command()
+@click.option("--data", multiple=True, default=["data/*.ttl"],
+    help="Turtle files to load, may be given more than once")
+@click.option("--people", default=400, help="People in the synthetic graph")
+@click.option("--departments", default=20)
+@click.option("--years", default=3, help="Academic years of appointments")
+@click.option("--requests", "count", default=500, help="Requests to send")
+@click.option("--concurrency", default=8, help="Concurrent clients")
+@click.option("--mix", default=DEFAULT_MIX,
+    help="Weights of home, person, org, subject and search requests")
+@click.option("--seed", default=0)
+@click.option("--baseline", default=BASELINE, help="Baseline JSON file")
+@click.option("--save-baseline", is_flag=True,
+    help="Store this run as the baseline")
+@click.option("--tolerance", default=0.2,
+    help="Allowed p95 increase over the baseline")
+@click.option("--caches", is_flag=True,
+    help="Keep the page, response and query caches on")
+def main(data, people, departments, years, count, concurrency, mix, seed,
+         baseline, save_baseline, tolerance, caches):
+    from werkzeug.serving import make_server
+    from scholarship_graph import app as views
+
+    views.app.config.from_pyfile("config.py")
+    host, port = datastore_address(views.app.config)
+    if not host in ("localhost", "127.0.0.1"):
+        raise click.ClickException(
+            "Point the datastore connection at localhost, not {}".format(host))
+    graph = load_graph(data, people, departments, years, seed)
+    click.echo("Loaded {:,} triples, SPARQL stand-in on port {}".format(
+        len(graph), port))
+    endpoint = serve(graph, host, port)
+    # run.py calls create_app, which connects to the stand-in
+    from run import parent_app
+    if not caches:
+        disable_caches(views)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, parent_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:{}{}".format(server.server_port, MOUNT)
+    requests_plan = plan(mix, count, targets(graph), seed)
+    # One pass at low volume warms the indexes and connections
+    run_plan(base_url, requests_plan[:concurrency], concurrency)
+    results, wall_time = run_plan(base_url, requests_plan, concurrency)
+    server.shutdown()
+    endpoint.shutdown()
+    summary = summarize(results, wall_time)
+    summary["total"]["caches"] = caches
+    previous = None
+    if os.path.exists(baseline) and not save_baseline:
+        with open(baseline) as baseline_file:
+            previous = json.load(baseline_file)
+        if previous["total"].get("caches", False) != caches:
+            click.echo("Baseline was taken with caches {}, not comparing"
+                .format("on" if previous["total"].get("caches") else "off"),
+                err=True)
+            previous = None
+    regressions = report(summary, previous, tolerance)
+    if save_baseline:
+        os.makedirs(os.path.dirname(baseline), exist_ok=True)
+        with open(baseline, "w") as baseline_file:
+            json.dump(summary, baseline_file, indent=2, sort_keys=True)
+        click.echo("Saved baseline to {}".format(baseline))
+    for regression in regressions:
+        click.echo("REGRESSION {}".format(regression), err=True)
+    if len(regressions) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
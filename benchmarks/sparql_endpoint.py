@@ -0,0 +1,126 @@
+"""Local SPARQL 1.1 protocol endpoint over an in-memory rdflib graph, a
+stand-in for Blazegraph when benchmarking
+
+    python -m benchmarks.sparql_endpoint --port 9999 data/*.ttl
+"""
+__author__ = "Jeremy Nelson"
+
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import click
+import rdflib
+
+RESULT_TYPES = {"SELECT": "application/sparql-results+json",
+                "ASK": "application/sparql-results+json",
+                "CONSTRUCT": "text/turtle",
+                "DESCRIBE": "text/turtle"}
+
+
+class SparqlHandler(BaseHTTPRequestHandler):
+    """Answers query and update requests on any path, which covers the
+    namespace URLs rdfframework builds for Blazegraph"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def __params__(self):
+        params = parse_qs(urlparse(self.path).query)
+        if self.command == "POST":
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length).decode("utf-8")
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("application/sparql-query"):
+                params["query"] = [body]
+            elif content_type.startswith("application/sparql-update"):
+                params["update"] = [body]
+            else:
+                params.update(parse_qs(body))
+        return {key: values[0] for key, values in params.items()}
+
+    def __send__(self, status, body, content_type="text/plain"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __handle__(self):
+        params = self.__params__()
+        server = self.server
+        try:
+            if "update" in params:
+                with server.lock:
+                    server.graph.update(params["update"])
+                return self.__send__(200, "OK")
+            if not "query" in params:
+                return self.__send__(200, "SPARQL endpoint")
+            if server.delay > 0:
+                time.sleep(server.delay)
+            # rdflib's query parser isn't thread-safe, results are evaluated
+            # lazily so errors surface when they're serialized
+            with server.lock:
+                result = server.dataset.query(params["query"])
+                if result.type in ("CONSTRUCT", "DESCRIBE"):
+                    body = result.serialize(format="turtle")
+                else:
+                    body = result.serialize(format="json")
+                server.queries += 1
+        except Exception as error:
+            return self.__send__(400, str(error))
+        self.__send__(200, body, RESULT_TYPES[result.type])
+
+    do_GET = __handle__
+    do_POST = __handle__
+
+
+class SparqlServer(ThreadingHTTPServer):
+    # Room for the connection pools of many concurrent clients
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def serve(graph, host="127.0.0.1", port=9999, delay=0.0):
+    """Starts an endpoint for graph in a daemon thread and returns the
+    server, call shutdown() to stop it
+
+    Args:
+        graph(rdflib.Graph): Graph to query
+        host(str): Interface to bind
+        port(int): Port to bind, 0 picks a free port
+        delay(float): Seconds added to every query, like a slow or
+            distant triplestore
+    """
+    server = SparqlServer((host, port), SparqlHandler)
+    server.graph = graph
+    # GRAPH patterns, like rdfframework's load times query, need a dataset
+    server.dataset = rdflib.ConjunctiveGraph(store=graph.store)
+    server.lock = threading.Lock()
+    server.queries = 0
+    server.delay = delay
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+@click.command()
+@click.option("--port", default=9999, help="Port to listen on")
+@click.option("--delay", default=0.0, help="Seconds added to every query")
+@click.argument("turtle", nargs=-1)
+def main(port, delay, turtle):
+    graph = rdflib.Graph()
+    for path in turtle:
+        graph.parse(path, format="turtle")
+    click.echo("Serving {:,} triples on port {}".format(len(graph), port))
+    serve(graph, port=port, delay=delay)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
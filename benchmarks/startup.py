@@ -0,0 +1,78 @@
+"""Worker startup cost: time to import scholarship_graph.app, time for
+create_app and time to the first response, each in a fresh interpreter
+like a newly forked gunicorn worker. Also lists the slowest imports and
+which heavy optional dependencies were loaded at import.
+
+    python -m benchmarks.startup --repeat 5
+"""
+__author__ = "Jeremy Nelson"
+
+import json
+import statistics
+import subprocess
+import sys
+
+import click
+
+HEAVY_MODULES = ["bibcat", "bibtexparser", "bs4", "github", "ldap3", "lxml",
+                 "rdfframework", "requests"]
+
+TIMING_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import scholarship_graph.app as module
+imported = time.perf_counter()
+loaded = [name for name in {heavy} if name in sys.modules]
+app = module.create_app()
+created = time.perf_counter()
+response = app.test_client().get("/metrics")
+responded = time.perf_counter()
+print(json.dumps({{"import": imported - start,
+                  "create_app": created - imported,
+                  "first_request": responded - created,
+                  "status": response.status_code,
+                  "loaded": loaded}}))
+"""
+
+def time_startup():
+    output = subprocess.run(
+        [sys.executable, "-c", TIMING_SCRIPT.format(heavy=HEAVY_MODULES)],
+        stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def slowest_imports(count):
+    """Cumulative microseconds by top level module from -X importtime"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import scholarship_graph.app"],
+        stderr=subprocess.PIPE, check=True, universal_newlines=True)
+    cumulative = dict()
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[12:].split("|")
+        # Nested imports are indented past the separator's single space
+        if name[1:] == name[1:].lstrip():
+            cumulative[name.strip()] = int(cumulative_us)
+    return sorted(cumulative.items(), key=lambda x: -x[1])[:count]
+
+
+@click.command()
+@click.option("--repeat", default=5, help="Fresh interpreters to time")
+@click.option("--top", default=15, help="Slowest imports to list")
+def main(repeat, top):
+    runs = [time_startup() for i in range(repeat)]
+    for key in ["import", "create_app", "first_request"]:
+        values = [run[key] * 1000 for run in runs]
+        click.echo("{:<16}median {:>8.1f} ms  min {:>8.1f} ms".format(
+            key, statistics.median(values), min(values)))
+    click.echo("first response status {}".format(runs[-1]["status"]))
+    click.echo("heavy modules loaded at import: {}".format(
+        ", ".join(runs[-1]["loaded"]) or "none"))
+    click.echo("\nslowest imports")
+    for name, microseconds in slowest_imports(top):
+        click.echo("{:<40}{:>10.1f} ms".format(name, microseconds / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""Synthetic scholarship graphs in the shapes of data/*.ttl and the
+sparql.py templates, for load tests and profiling at larger sizes. The
+people and academic-year graphs live outside this repository so they are
+always synthetic.
+
+    python -m benchmarks.synthetic --scale 10 --output /tmp/graph-10x
+    python -m benchmarks.synthetic --scale 100 --skew 1.2 --output /tmp/100x
+"""
+__author__ = "Jeremy Nelson"
+
+import bisect
+import datetime
+import itertools
+import os
+import random
+import uuid
+
+import click
+import rdflib
+
+BF = rdflib.Namespace("http://id.loc.gov/ontologies/bibframe/")
+CC_FAC = rdflib.Namespace("https://www.coloradocollege.edu/ns/faculty/")
+CITE = rdflib.Namespace("https://www.coloradocollege.edu/library/ns/citation/")
+PROV = rdflib.Namespace("http://www.w3.org/ns/prov#")
+SCHEMA = rdflib.Namespace("http://schema.org/")
+
+# Entity counts in data/*.ttl, --scale multiplies them
+CURRENT_SIZE = {"people": 240,
+                "departments": 20,
+                "articles": 1256,
+                "journals": 709,
+                "books": 194,
+                "chapters": 80,
+                "creative_works": 8,
+                "statements": 191,
+                "subjects": 9}
+
+GIVEN_NAMES = ["Ada", "Bea", "Carlos", "Dana", "Eli", "Farah", "Gus",
+               "Hana", "Ivan", "Jo", "Kai", "Lena", "Milo", "Nia", "Omar",
+               "Priya", "Quinn", "Rosa", "Sam", "Tariq", "Uma", "Vic",
+               "Wen", "Xavi", "Yara", "Zeke"]
+FAMILY_NAMES = ["Abbott", "Baker", "Chen", "Diaz", "Evans", "Fischer",
+                "Garcia", "Huang", "Ibarra", "Jensen", "Kim", "Lopez",
+                "Moreno", "Nguyen", "Okafor", "Patel", "Quintero", "Rossi",
+                "Schmidt", "Tanaka", "Ueda", "Varga", "Wong", "Yilmaz",
+                "Zhou"]
+DEPARTMENTS = ["Anthropology", "Art", "Biology", "Chemistry", "Classics",
+               "Computer Science", "Economics", "English", "Geology",
+               "History", "Mathematics", "Music", "Philosophy", "Physics",
+               "Political Science", "Psychology", "Religion", "Sociology",
+               "Theatre and Dance"]
+RANKS = [("professor", "Professor"),
+         ("associate-professor", "Associate Professor"),
+         ("assistant-professor", "Assistant Professor"),
+         ("visiting-professor", "Visiting Professor")]
+
+WORDS = ["adaptive", "analysis", "archive", "bayesian", "boundary", "carbon",
+         "climate", "cognition", "colonial", "community", "curves",
+         "dynamics", "ecology", "empire", "equations", "evolution", "field",
+         "frontier", "graph", "identity", "landscape", "language", "memory",
+         "migration", "models", "networks", "performance", "policy",
+         "quantum", "ritual", "rivers", "sediment", "signals", "social",
+         "spectral", "structure", "theory", "trade", "urban", "water"]
+
+def new_iri(rng):
+    """Mints a catalog IRI from rng so a seed gives the same IRIs"""
+    return rdflib.URIRef("http://catalog.coloradocollege.edu/{}".format(
+        uuid.UUID(int=rng.getrandbits(128), version=1)))
+
+def academic_year_bounds(start_year):
+    return (datetime.datetime(start_year, 7, 1),
+            datetime.datetime(start_year + 1, 6, 30, 23, 59, 59))
+
+def current_start_year(now=None):
+    now = now or datetime.datetime.utcnow()
+    if now.month < 7:
+        return now.year - 1
+    return now.year
+
+def skewed_picker(rng, items, skew):
+    """Returns a function picking from items with Zipf weights 1/rank**skew,
+    a skew of 0 picks uniformly"""
+    cumulative = list(itertools.accumulate(
+        1.0 / (rank ** skew) for rank in range(1, len(items) + 1)))
+    total = cumulative[-1]
+    return lambda: items[bisect.bisect_left(cumulative, rng.random() * total)]
+
+def title(rng, words=5):
+    return " ".join(rng.choice(WORDS) for i in range(words)).capitalize()
+
+def literal(value, lang="en"):
+    return rdflib.Literal(value, lang=lang)
+
+def people_graph(person_iris=(), people=200, departments=12, years=3,
+                 seed=0):
+    """Returns a graph of people, departments and department-year events
+    ending with the current academic year
+
+    Args:
+        person_iris(iterable): Existing IRIs to describe, for example the
+            authors in creative-works.ttl, more are minted up to people
+        people(int): Total number of people
+        departments(int): Number of departments
+        years(int): Number of academic years
+        seed(int): Random seed, the same seed gives the same graph
+    """
+    rng = random.Random(seed)
+    graph = rdflib.Graph()
+    graph.namespace_manager.bind("bf", BF)
+    graph.namespace_manager.bind("cc_fac", CC_FAC)
+    graph.namespace_manager.bind("schema", SCHEMA)
+    for slug, label in RANKS:
+        graph.add((CC_FAC[slug], rdflib.RDFS.label,
+                   rdflib.Literal(label, lang="en")))
+    person_iris = [rdflib.URIRef(iri) for iri in sorted(set(person_iris))]
+    while len(person_iris) < people:
+        person_iris.append(new_iri(rng))
+    orgs = []
+    for i in range(departments):
+        org = new_iri(rng)
+        name = DEPARTMENTS[i % len(DEPARTMENTS)]
+        if i >= len(DEPARTMENTS):
+            name = "{} {}".format(name, i // len(DEPARTMENTS) + 1)
+        graph.add((org, rdflib.RDF.type, SCHEMA.CollegeDepartment))
+        graph.add((org, rdflib.RDFS.label, rdflib.Literal(name, lang="en")))
+        orgs.append((org, name))
+    members = dict()
+    for i, person in enumerate(person_iris):
+        given = rng.choice(GIVEN_NAMES)
+        family = "{}{}".format(rng.choice(FAMILY_NAMES),
+                               "" if i < len(FAMILY_NAMES) else i)
+        graph.add((person, rdflib.RDF.type, BF.Person))
+        graph.add((person, SCHEMA.givenName, rdflib.Literal(given)))
+        graph.add((person, SCHEMA.familyName, rdflib.Literal(family)))
+        graph.add((person, rdflib.RDFS.label,
+                   rdflib.Literal("{} {}".format(given, family), lang="en")))
+        graph.add((person, SCHEMA.email, rdflib.Literal(
+            "{}{}@coloradocollege.edu".format(given[0], family).lower())))
+        members.setdefault(rng.randrange(len(orgs)), []).append(
+            (person, CC_FAC[rng.choice(RANKS)[0]]))
+    last_year = current_start_year()
+    for start_year in range(last_year - years + 1, last_year + 1):
+        start, end = academic_year_bounds(start_year)
+        academic_year = new_iri(rng)
+        graph.add((academic_year, rdflib.RDF.type, SCHEMA.Event))
+        graph.add((academic_year, rdflib.RDFS.label, rdflib.Literal(
+            "{}-{} Academic Year".format(start_year, start_year + 1))))
+        graph.add((academic_year, SCHEMA.startDate,
+                   rdflib.Literal(start, datatype=rdflib.XSD.dateTime)))
+        graph.add((academic_year, SCHEMA.endDate,
+                   rdflib.Literal(end, datatype=rdflib.XSD.dateTime)))
+        for i, (org, name) in enumerate(orgs):
+            event = new_iri(rng)
+            graph.add((event, rdflib.RDF.type, SCHEMA.Event))
+            graph.add((event, rdflib.RDFS.label, rdflib.Literal(
+                "{} {}-{}".format(name, start_year, start_year + 1))))
+            graph.add((event, SCHEMA.organizer, org))
+            graph.add((event, SCHEMA.superEvent, academic_year))
+            for person, rank in members.get(i, []):
+                graph.add((event, rank, person))
+    return graph
+
+def add_generation(graph, rng, entity, agent):
+    generation = rdflib.BNode()
+    graph.add((entity, PROV.qualifiedGeneration, generation))
+    graph.add((generation, rdflib.RDF.type, PROV.Generation))
+    graph.add((generation, PROV.atTime, rdflib.Literal(
+        datetime.datetime(2017, 1, 1) + datetime.timedelta(
+            seconds=rng.randrange(3 * 365 * 86400)),
+        datatype=rdflib.XSD.dateTime)))
+    graph.add((generation, PROV.wasGeneratedBy, agent))
+
+def subjects_graph(rng, count):
+    """FAST subject headings"""
+    graph = rdflib.Graph()
+    topics = []
+    for i in range(count):
+        topic = rdflib.URIRef("http://id.worldcat.org/fast/{:08d}".format(
+            rng.randrange(10 ** 8)))
+        graph.add((topic, rdflib.RDF.type, BF.Topic))
+        graph.add((topic, rdflib.RDFS.label, literal(title(rng, 2))))
+        topics.append(topic)
+    return graph, topics
+
+def statements_graph(rng, people, topics, count, skew):
+    """Research statements about skewed choices of subjects"""
+    graph = rdflib.Graph()
+    pick_topic = skewed_picker(rng, topics, skew) if topics else None
+    for person in rng.sample(people, min(count, len(people))):
+        statement = new_iri(rng)
+        graph.add((statement, rdflib.RDF.type, SCHEMA.DigitalDocument))
+        graph.add((statement, rdflib.RDFS.label,
+                   literal("Research Statement for {}".format(person))))
+        graph.add((statement, SCHEMA.accountablePerson, person))
+        graph.add((statement, SCHEMA.description, literal(
+            ". ".join(title(rng, 12) for i in range(rng.randint(2, 8))))))
+        if pick_topic is not None:
+            for i in range(rng.randint(1, 3)):
+                graph.add((statement, SCHEMA.about, pick_topic()))
+        add_generation(graph, rng, statement, person)
+    return graph
+
+def works_graph(rng, people, names, size, skew):
+    """Articles in journal volumes and issues, books, chapters in books and
+    other creative works, authors are picked with Zipf skew so a few people
+    have most of the citations
+
+    Args:
+        rng(random.Random): Source of randomness
+        people(list): Person IRIs
+        names(dict): Person IRI to name for cite:authorString
+        size(dict): Counts of journals, articles, books, chapters and
+            creative_works
+        skew(float): Zipf exponent of works per author
+    """
+    graph = rdflib.Graph()
+    pick_author = skewed_picker(rng, people, skew)
+
+    def __authors__(work):
+        authors = set([pick_author() for i in range(rng.choice([1, 1, 2, 3]))])
+        for author in authors:
+            graph.add((work, SCHEMA.author, author))
+        author_string = [names[author] for author in authors]
+        author_string.extend("{} {}".format(rng.choice(GIVEN_NAMES),
+            rng.choice(FAMILY_NAMES)) for i in range(rng.randint(0, 3)))
+        graph.add((work, CITE.authorString,
+                   literal(", ".join(author_string))))
+
+    def __pages__(work):
+        start = rng.randint(1, 900)
+        graph.add((work, SCHEMA.pageStart, rdflib.Literal(str(start))))
+        graph.add((work, SCHEMA.pageEnd,
+                   rdflib.Literal(str(start + rng.randint(5, 40)))))
+
+    issues = []
+    for i in range(max(1, size["journals"])):
+        journal = new_iri(rng)
+        graph.add((journal, rdflib.RDF.type, SCHEMA.Periodical))
+        graph.add((journal, SCHEMA.name,
+                   literal("Journal of {}".format(title(rng, 2)))))
+        graph.add((journal, SCHEMA.issn, rdflib.Literal(
+            "{:04d}-{:04d}".format(rng.randrange(10000),
+                                   rng.randrange(10000)))))
+        # data/creative-works.ttl types volumes and issues with the
+        # volumeNumber and issueNumber properties
+        volume = new_iri(rng)
+        graph.add((volume, rdflib.RDF.type, SCHEMA.volumeNumber))
+        graph.add((volume, SCHEMA.volumeNumber,
+                   rdflib.Literal(str(rng.randint(1, 150)))))
+        graph.add((volume, SCHEMA.partOf, journal))
+        issue = new_iri(rng)
+        graph.add((issue, rdflib.RDF.type, SCHEMA.issueNumber))
+        graph.add((issue, SCHEMA.issueNumber,
+                   rdflib.Literal(str(rng.randint(1, 12)))))
+        graph.add((issue, SCHEMA.partOf, volume))
+        issues.append(issue)
+    pick_issue = skewed_picker(rng, issues, skew)
+    for i in range(size["articles"]):
+        article = new_iri(rng)
+        graph.add((article, rdflib.RDF.type, SCHEMA.ScholarlyArticle))
+        graph.add((article, SCHEMA.name, literal(title(rng))))
+        graph.add((article, SCHEMA.datePublished,
+                   rdflib.Literal(str(rng.randint(1990, 2018)))))
+        graph.add((article, SCHEMA.partOf, pick_issue()))
+        graph.add((article, SCHEMA.url, rdflib.Literal(
+            "https://doi.org/10.{}/{}".format(rng.randint(1000, 9999), i))))
+        graph.add((article, CITE.citationType, rdflib.Literal("article")))
+        __authors__(article)
+        __pages__(article)
+    books = []
+    for i in range(size["books"] + size["chapters"] // 2):
+        book = rdflib.URIRef(
+            "https://tiger.coloradocollege.edu/record=b{}~s5".format(
+                1000000 + rng.randrange(10 ** 6)))
+        graph.add((book, rdflib.RDF.type, BF.Book))
+        graph.add((book, BF.title, literal(title(rng, 6))))
+        graph.add((book, BF.isbn, rdflib.Literal(
+            "978{:010d}".format(rng.randrange(10 ** 10)))))
+        graph.add((book, BF.provisionActivityStatement,
+                   literal("New York : Example Press, {}".format(
+                       rng.randint(1990, 2018)))))
+        graph.add((book, BF.editionStatement, literal("")))
+        graph.add((book, SCHEMA.publicationDate,
+                   rdflib.Literal(str(rng.randint(1990, 2018)))))
+        graph.add((book, CITE.citationType, literal("book")))
+        if i < size["books"]:
+            __authors__(book)
+        else:
+            graph.add((book, SCHEMA.editor, literal("edited by {} {}".format(
+                rng.choice(GIVEN_NAMES), rng.choice(FAMILY_NAMES)))))
+        books.append(book)
+    for i in range(size["chapters"]):
+        chapter = new_iri(rng)
+        graph.add((chapter, rdflib.RDF.type, SCHEMA.Chapter))
+        graph.add((chapter, SCHEMA.name, literal(title(rng))))
+        graph.add((chapter, SCHEMA.partOf, rng.choice(books)))
+        graph.add((chapter, CITE.citationType,
+                   rdflib.Literal("book chapter")))
+        __authors__(chapter)
+        __pages__(chapter)
+    for i in range(size["creative_works"]):
+        work = rdflib.URIRef(
+            "https://tiger.coloradocollege.edu/record=b{}~s5".format(
+                2000000 + rng.randrange(10 ** 6)))
+        graph.add((work, rdflib.RDF.type, SCHEMA.CreativeWork))
+        graph.add((work, SCHEMA.name, literal(title(rng))))
+        graph.add((work, SCHEMA.datePublished,
+                   rdflib.Literal(str(rng.randint(1990, 2018)))))
+        graph.add((work, SCHEMA.url, work))
+        __authors__(work)
+    return graph
+
+def generate(size, years=3, skew=0.7, seed=0):
+    """Returns the synthetic graphs by the data/ file name they stand in for
+
+    Args:
+        size(dict): Entity counts, see CURRENT_SIZE
+        years(int): Academic years of department appointments
+        skew(float): Zipf exponent for works per author, journals and
+            subjects, 0 for uniform, 0.7 is close to creative-works.ttl
+        seed(int): Random seed, the same seed gives the same graphs
+    """
+    rng = random.Random(seed)
+    people = people_graph(people=size["people"],
+                          departments=size["departments"],
+                          years=years,
+                          seed=seed)
+    person_iris = sorted(people.subjects(rdflib.RDF.type, BF.Person))
+    names = {iri: str(people.value(iri, rdflib.RDFS.label))
+             for iri in person_iris}
+    subjects, topics = subjects_graph(rng, size["subjects"])
+    return {"cc-people-years.ttl": people,
+            "cc-fast-subjects.ttl": subjects,
+            "cc-research-statements.ttl": statements_graph(
+                rng, person_iris, topics, size["statements"], skew),
+            "creative-works.ttl": works_graph(
+                rng, person_iris, names, size, skew)}
+
+
+@click.command()
+@click.option("--output", required=True, help="Directory for the turtle files")
+@click.option("--scale", default=1.0,
+    help="Multiple of the current data/ size")
+@click.option("--skew", default=0.7,
+    help="Zipf exponent for works per author, 0 for uniform")
+@click.option("--years", default=3, help="Academic years of appointments")
+@click.option("--seed", default=0)
+@click.option("--count", multiple=True,
+    help="Override one entity count, for example articles=50000")
+def main(output, scale, skew, years, seed, count):
+    size = {key: max(1, int(round(value * scale)))
+            for key, value in CURRENT_SIZE.items()}
+    for override in count:
+        key, value = override.split("=")
+        if not key in size:
+            raise click.BadParameter("Unknown entity {}".format(key))
+        size[key] = int(value)
+    os.makedirs(output, exist_ok=True)
+    for file_name, graph in generate(size, years, skew, seed).items():
+        for prefix, namespace in [("bf", BF), ("cite", CITE),
+                                  ("prov", PROV), ("schema", SCHEMA)]:
+            graph.namespace_manager.bind(prefix, namespace)
+        graph.serialize(destination=os.path.join(output, file_name),
+                        format="turtle")
+        click.echo("{:<28}{:>12,} triples".format(file_name, len(graph)))
+
+
+if __name__ == "__main__":
+    main()
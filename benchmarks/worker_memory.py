@@ -0,0 +1,130 @@
+"""Per-worker memory of gunicorn with and without preload. Each run starts
+gunicorn with gunicorn.conf.py against the local SPARQL stand-in, sends a
+request mix so the workers touch the graph snapshot and caches, then reads
+/proc/<pid>/smaps_rollup for every worker. Set SNAPSHOT_INDEXES = True in
+instance/config.py so the snapshot is built in the master when preloading.
+
+Pss splits shared pages between the processes sharing them, so the sum of
+worker Pss is the memory the workers really cost; Private_Dirty is what
+copy-on-write has copied into each worker.
+
+    python -m benchmarks.worker_memory --workers 4 --requests 400
+"""
+__author__ = "Jeremy Nelson"
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import click
+import requests
+
+from benchmarks.loadtest import MOUNT, datastore_address, load_graph, plan
+from benchmarks.loadtest import run_plan, targets
+from benchmarks.sparql_endpoint import serve
+
+FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Dirty"]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def smaps_rollup(pid):
+    """Memory totals in kB for a process"""
+    totals = dict()
+    with open("/proc/{}/smaps_rollup".format(pid)) as rollup:
+        for line in rollup:
+            parts = line.split()
+            if parts[0].rstrip(":") in FIELDS:
+                totals[parts[0].rstrip(":")] = int(parts[1])
+    return totals
+
+def children(pid):
+    output = []
+    for task in os.listdir("/proc/{}/task".format(pid)):
+        with open("/proc/{}/task/{}/children".format(pid, task)) as tasks:
+            output.extend(int(child) for child in tasks.read().split())
+    return output
+
+def measure(preload, workers, requests_plan, concurrency, timeout=120):
+    """Starts gunicorn, runs the request plan and returns the master's and
+    each worker's smaps_rollup totals"""
+    port = free_port()
+    env = dict(os.environ,
+               GUNICORN_BIND="127.0.0.1:{}".format(port),
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_PRELOAD="1" if preload else "0")
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+         "run:parent_app"], env=env)
+    base_url = "http://127.0.0.1:{}{}".format(port, MOUNT)
+    try:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                requests.get(base_url + "/metrics", timeout=5)
+                break
+            except requests.ConnectionError:
+                if time.time() > deadline or master.poll() is not None:
+                    raise click.ClickException("gunicorn did not start")
+                time.sleep(0.5)
+        run_plan(base_url, requests_plan, concurrency)
+        return (smaps_rollup(master.pid),
+                [smaps_rollup(pid) for pid in children(master.pid)])
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+
+def report(label, master, workers):
+    click.echo("\n{} ({} workers)".format(label, len(workers)))
+    click.echo("{:<10}".format("") + "".join(
+        "{:>15}".format(field) for field in FIELDS))
+    click.echo("{:<10}".format("master") + "".join(
+        "{:>12,} kB".format(master.get(field, 0)) for field in FIELDS))
+    for position, worker in enumerate(workers):
+        click.echo("{:<10}".format("worker {}".format(position)) + "".join(
+            "{:>12,} kB".format(worker.get(field, 0)) for field in FIELDS))
+    click.echo("{:<10}".format("workers") + "".join(
+        "{:>12,} kB".format(sum(worker.get(field, 0) for worker in workers))
+        for field in FIELDS))
+
+
+@click.command()
+@click.option("--data", multiple=True, default=["data/*.ttl"],
+    help="Turtle files to load, may be given more than once")
+@click.option("--people", default=400, help="People in the synthetic graph")
+@click.option("--workers", default=4, help="Gunicorn workers")
+@click.option("--requests", "count", default=400,
+    help="Requests to send before measuring")
+@click.option("--concurrency", default=8, help="Concurrent clients")
+@click.option("--seed", default=0)
+def main(data, people, workers, count, concurrency, seed):
+    from scholarship_graph.app import app
+
+    app.config.from_pyfile("config.py")
+    host, port = datastore_address(app.config)
+    if not app.config.get("SNAPSHOT_INDEXES", False):
+        click.echo("SNAPSHOT_INDEXES is not set, no snapshot will be built",
+                   err=True)
+    graph = load_graph(data, people, 20, 3, seed)
+    endpoint = serve(graph, host, port)
+    requests_plan = plan("home=1,person=6,org=2,subject=1,search=2", count,
+                         targets(graph), seed)
+    results = dict()
+    for preload in [False, True]:
+        results[preload] = measure(preload, workers, requests_plan,
+                                   concurrency)
+        report("preload" if preload else "no preload", *results[preload])
+    endpoint.shutdown()
+    before = sum(worker.get("Pss", 0) for worker in results[False][1])
+    after = sum(worker.get("Pss", 0) for worker in results[True][1])
+    click.echo("\nworker Pss {:,} kB without preload, {:,} kB with".format(
+        before, after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Gunicorn settings for Scholarship App
+
+With preload the master imports run.py and builds the graph snapshot once
+(set SNAPSHOT_INDEXES in instance/config.py), then forks the workers which
+share those pages copy-on-write. Freezing the garbage collector before
+each fork keeps collections in the workers from touching the inherited
+objects and copying their pages.
+
+Runs one worker unless GUNICORN_WORKERS says otherwise. More than one
+worker needs QUERY_CACHE_PATH in instance/config.py, the workers then
+share a datastore generation through that SQLite file so a reload in one
+worker invalidates the cached pages, JSON responses and query results of
+all of them; gunicorn refuses to start without it.
+
+    GUNICORN_WORKERS=4 gunicorn -c gunicorn.conf.py run:app
+"""
+__author__ = "Jeremy Nelson"
+
+import gc
+import os
+
+from flask import Config
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:7225")
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+def on_starting(server):
+    if server.num_workers < 2:
+        return
+    from scholarship_graph.app import app
+    config = Config(app.instance_path)
+    config.from_pyfile("config.py", silent=True)
+    if not config.get("QUERY_CACHE_PATH"):
+        raise RuntimeError(
+            "{} workers need QUERY_CACHE_PATH set in {} to share the "
+            "datastore generation".format(server.num_workers,
+                os.path.join(app.instance_path, "config.py")))
+
+def pre_fork(server, worker):
+    if hasattr(gc, "freeze"):
+        gc.freeze()
@@ -0,0 +1,12 @@
+SECRET_KEY = "bench"
+SITE_NAME = "Scholarship Graph"
+BASE_URL = "http://127.0.0.1/"
+TURN_ON_VOCAB = False
+LDAP_HOST = "localhost"
+LDAP_BASE_DN = "dc=example"
+SNAPSHOT_INDEXES = True
+QUERY_CACHE_PATH = "/tmp/bench-query-cache.sqlite"
+CONNECTIONS = [{"name": "datastore", "conn_type": "triplestore",
+                "vendor": "blazegraph", "namespace": "kb",
+                "url": "http://127.0.0.1:18889/blazegraph"}]
+DIRECTORIES = [{"name": "base", "path": "/tmp/rdfw-bench"}]
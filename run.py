@@ -1,7 +1,9 @@
-from scholarship_graph.app import app
+from scholarship_graph.app import create_app
 from werkzeug.wsgi import DispatcherMiddleware
 from werkzeug.serving import run_simple
 
+app = create_app()
+
 def simple(env, resp):
     resp(b'200 OK', [('Content-Type', b'text/plain')])
     return [b'SCHOLARSHIP GRAPH']
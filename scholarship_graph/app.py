@@ -2,20 +2,21 @@
 __author__ = "Jeremy Nelson","Diane Westerfield"
 
 
+import base64
 import datetime
 import hashlib
+import json
 import os
 import re
 import xml.etree.ElementTree as etree
 from collections import OrderedDict
 import click
-import requests
 import rdflib
 import sys
 import threading
+import time
 import traceback
 import uuid
-import utilities
 
 
 import email.mime.text as email_text
@@ -23,46 +24,170 @@ import mimetypes
 
 from types import SimpleNamespace
 from flask import Flask, jsonify, render_template, redirect, request, session 
-from flask import abort, current_app, url_for, flash
+from flask import abort, current_app, g, url_for, flash
+from flask import Response, stream_with_context
 from flask_login import login_required, login_user, logout_user, current_user
 from flask_login import LoginManager, UserMixin
-from flask_ldap3_login import LDAP3LoginManager
 from flask_ldap3_login import log as ldap_manager_log
 from flask_ldap3_login.forms import LDAPLoginForm
 
 from jinja2 import contextfilter
+from werkzeug.datastructures import MultiDict
 
 from .forms import ProfileForm, SearchForm, ArticleForm, BookForm, BookChapterForm
-from github import Github
 from .sparql import add_qualified_generation, add_qualified_revision
-from .sparql import CITATION, BOOK_CITATION,BOOK_CHAPTER_CITATION,CREATIVE_WORK_CITATION,EMAIL_LOOKUP, ORG_INFO, ORG_LISTING, ORG_PEOPLE
-from .sparql import PERSON_HISTORY, PERSON_INFO, PERSON_LABEL, PREFIX, PROFILE
-from .sparql import RESEARCH_STMT, SUBJECTS, SUBJECTS_IRI
+from .sparql import CITATION, BOOK_CITATION,BOOK_CHAPTER_CITATION,CREATIVE_WORK_CITATION,EMAIL_LOOKUP, ORG_LISTING, ORG_YEARS_PEOPLE
+from .sparql import PEOPLE_PREFETCH, PERSON_HISTORY, PERSON_INFO, PERSON_LABEL, PREFIX, PROFILE
+from .sparql import RESEARCH_STMT, SUBJECTS, SUBJECTS_IRI, SUBJECT_LABEL
+from .sparql import SUBJECT_PEOPLE
 from .sparql import COUNT_ARTICLES, COUNT_BOOKS, COUNT_JOURNALS, COUNT_ORGS, COUNT_PEOPLE, COUNT_CHAPTERS
 from .sparql import COUNT_BOOK_AUTHORS, WORK_INFO
+from .cache import LRUCache, QueryCache, SharedStore, UserStore
+from .directory import PooledLDAP3LoginManager
+from .citations import article_link, book_edition, book_title
+from .citations import creative_work_title, page_number, volume_issue
+from .export import FORMATS, NT_ESCAPES, export_rows, gzip_stream
+from .export import serialize
+from .indexes import AcademicYearIndex, ChangeIndex, parse_datetime
+from .metrics import METRICS, SMTP_SECONDS
+from .profiling import ProfiledConnections, debug_footer, request_queries
+from .profiling import server_timing
+from .responses import JSON_RESPONSES, json_response
+from .snapshot import GraphSnapshot
+from .submissions import SubmissionStore, Submissions
 from .profiles import add_creative_work, add_profile, delete_creative_work
 from .profiles import edit_creative_work, generate_citation_html, update_profile
-from rdfframework.configuration import RdfConfigManager
+from .profiles import lookup_person
 
 
 
 app = Flask(__name__, instance_relative_config=True)
-app.config.from_pyfile('config.py')
-CONFIG_MANAGER = RdfConfigManager(app.config, 
-    verify=False, 
-    delay_check=True)
-CONNECTION = CONFIG_MANAGER.conns
-BF = CONFIG_MANAGER.nsm.bf
-SCHEMA = CONFIG_MANAGER.nsm.schema
+# Set up by create_app once the instance configuration is loaded
+CONFIG_MANAGER = None
+CONFIGURE_LOCK = threading.RLock()
+# Triplestore SELECT results, shared with the other workers through a
+# SQLite file when QUERY_CACHE_PATH is set. create_app turns it on with
+# QUERY_CACHE_PATH, an in-process only cache would keep serving results
+# other workers have reloaded, so without one it needs QUERY_CACHE = True.
+QUERY_CACHE = QueryCache(LRUCache(max_entries=4096,
+    max_bytes=64 * 1024 * 1024,
+    ttl=3600))
+# Configured by create_app, which runs on first use for entry points that
+# import the app without calling it
+CONNECTION = ProfiledConnections(None, loader=lambda: create_app())
+# New works and profiles processed in the background, None when
+# ASYNC_SUBMISSIONS is off and they are processed in the request
+SUBMISSIONS = None
+BF = rdflib.Namespace("http://id.loc.gov/ontologies/bibframe/")
+SCHEMA = rdflib.Namespace("http://schema.org/")
 
-login_manager = LoginManager(app)
-ldap_manager = LDAP3LoginManager(app)
+login_manager = LoginManager()
+ldap_manager = PooledLDAP3LoginManager()
 
 PROJECT_BASE = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
-USERS = OrderedDict()
 
 BACKEND_THREAD = None
 
+# Rendered pages for anonymous visitors, invalidated when the triplestore
+# generation changes. Reloads in other workers are only seen through the
+# shared generation of QUERY_CACHE_PATH, without it each worker serves its
+# pages until FRAGMENT_CACHE_TTL.
+FRAGMENT_CACHE = LRUCache(max_entries=256,
+    max_bytes=32 * 1024 * 1024,
+    ttl=3600)
+
+ACADEMIC_YEAR_INDEX = AcademicYearIndex()
+CHANGE_INDEX = ChangeIndex()
+# Built by create_app when SNAPSHOT_INDEXES is set and shared by forked
+# workers, a worker rebuilds its own after a reload
+SNAPSHOT = GraphSnapshot()
+
+# Search queries by short query id, results are cached separately so that
+# they are recomputed after the triplestore reloads. The searcher's latest
+# query is also kept in their session for workers that didn't see it.
+SEARCH_QUERIES = LRUCache(max_entries=1024, ttl=86400, generation=None)
+SEARCH_RESULTS = LRUCache(max_entries=1024, ttl=900)
+
+REQUEST_SECONDS = METRICS.histogram("http_request_duration_seconds",
+    "Time to handle a request, until the first chunk for streamed pages",
+    labels=("endpoint", "method", "status"))
+QUERY_SECONDS = METRICS.histogram("sparql_query_duration_seconds",
+    "Triplestore query time by sparql.py template",
+    labels=("template",))
+QUERY_ROWS = METRICS.counter("sparql_query_rows_total",
+    "Rows returned by the triplestore by sparql.py template",
+    labels=("template",))
+
+QUERY_CACHE_HITS = METRICS.counter("sparql_query_cache_hits_total",
+    "Queries answered from the query cache by sparql.py template",
+    labels=("template",))
+
+def __observe_query__(profile):
+    if profile.cached:
+        QUERY_CACHE_HITS.inc(template=profile.template)
+        return
+    QUERY_SECONDS.observe(profile.elapsed, template=profile.template)
+    QUERY_ROWS.inc(profile.rows, template=profile.template)
+
+CONNECTION.listeners.append(__observe_query__)
+
+def __caches__():
+    return [("query_results", QUERY_CACHE),
+            ("users", USERS),
+            ("ldap_user_info", ldap_manager.user_info),
+            ("fragments", FRAGMENT_CACHE),
+            ("search_results", SEARCH_RESULTS),
+            ("json_responses", JSON_RESPONSES)]
+
+def __cache_stat__(key):
+    return lambda: [((name,), cache.stats()[key])
+                    for name, cache in __caches__()]
+
+METRICS.callback("cache_hits_total", "Cache lookups that were hits",
+    labels=("cache",), callback=__cache_stat__("hits"), metric_type="counter")
+METRICS.callback("cache_misses_total", "Cache lookups that were misses",
+    labels=("cache",), callback=__cache_stat__("misses"),
+    metric_type="counter")
+METRICS.callback("cache_entries", "Entries held by each cache",
+    labels=("cache",), callback=__cache_stat__("entries"))
+METRICS.callback("query_cache_shared_hits_total",
+    "Query results found in the cache shared by the workers",
+    callback=lambda: [((), QUERY_CACHE.stats()["shared_hits"])],
+    metric_type="counter")
+
+def __ldap_pool_stat__(*keys):
+    return lambda: [((name, key) if len(keys) > 1 else (name,), stats[key])
+                    for name, stats in sorted(ldap_manager.stats().items())
+                    for key in keys]
+
+METRICS.callback("ldap_connections", "Pooled LDAP connections by state",
+    labels=("pool", "state"), callback=__ldap_pool_stat__("idle", "in_use"))
+METRICS.callback("ldap_connections_opened_total",
+    "LDAP connections opened by each pool", labels=("pool",),
+    callback=__ldap_pool_stat__("opened"), metric_type="counter")
+
+def __background_jobs__():
+    jobs = dict()
+    for thread in threading.enumerate():
+        # Plain threads belong to the server, jobs are Thread subclasses
+        name = type(thread).__name__
+        if type(thread) is not threading.Thread and \
+           not name.startswith("_"):
+            jobs[name] = jobs.get(name, 0) + 1
+    return [((name,), count) for name, count in sorted(jobs.items())]
+
+METRICS.callback("background_jobs", "Running background job threads",
+    labels=("job",), callback=__background_jobs__)
+
+def __submission_counts__():
+    if SUBMISSIONS is None:
+        return []
+    return [((status,), count) for status, count in
+            sorted(SUBMISSIONS.store.counts().items())]
+
+METRICS.callback("submissions", "Saved submissions by status",
+    labels=("status",), callback=__submission_counts__)
+
 class EmailThread(threading.Thread):
 
     def __init__(self, **kwargs):
@@ -76,10 +201,12 @@ class EmailThread(threading.Thread):
 
 class Scholar(UserMixin):
 
-    def __init__(self, dn, username, data):
+    def __init__(self, dn, username, data, person_iri=None):
         self.dn = dn
         self.username = username
         self.data = data
+        # Resolved from the user's email at login, None without a profile
+        self.person_iri = person_iri
 
     def __repr__(self):
         return self.dn
@@ -87,18 +214,111 @@ class Scholar(UserMixin):
     def get_id(self):
         return self.dn
 
+    def as_dict(self):
+        data = dict()
+        for name, value in self.data.items():
+            # Binary attributes such as photos aren't kept
+            if isinstance(value, (list, tuple)):
+                value = [row for row in value if isinstance(row, str)]
+            elif not isinstance(value, (str, int, float, type(None))):
+                continue
+            data[name] = value
+        person_iri = None
+        if self.person_iri is not None:
+            person_iri = str(self.person_iri)
+        return {"dn": self.dn,
+                "username": self.username,
+                "data": data,
+                "person_iri": person_iri}
+
+    @classmethod
+    def from_dict(cls, fields):
+        person_iri = fields.get("person_iri")
+        if person_iri is not None:
+            person_iri = rdflib.URIRef(person_iri)
+        return cls(fields["dn"], fields["username"], fields["data"],
+                   person_iri)
+
+# Logged-in users by dn with their LDAP attributes, create_app sets the
+# limits and the file shared by the workers
+USERS = UserStore(Scholar, LRUCache(max_entries=1024,
+    ttl=8 * 3600,
+    generation=None))
+
 # LDAP decorators
 @ldap_manager.save_user
 def save_user(dn, username, data, memberships):
-    user = Scholar(dn, username, data)
-    USERS[dn] = user
+    try:
+        person_iri = lookup_person(CONNECTION, data.get("mail"))
+    except Exception as error:
+        # Looked up again on the user's first change
+        app.logger.warning("Person lookup for {} failed: {}".format(
+            dn, error))
+        person_iri = None
+    user = Scholar(dn, username, data, person_iri)
+    USERS.set(dn, user)
     return user
 
 @login_manager.user_loader
 def user_loader(user_id):
-    if user_id in USERS:
-        return USERS[user_id]
-    return None
+    user = USERS.get(user_id)
+    if user is None and app.config.get("USER_DIRECTORY_REFRESH", True):
+        user = __refresh_user__(user_id)
+    return user
+
+def __refresh_user__(dn):
+    """Reads the attributes of a logged-in user who has expired from
+    USERS from the directory again, None if they are no longer there"""
+    try:
+        data = ldap_manager.get_user_info(dn)
+    except Exception as error:
+        app.logger.warning("Directory lookup for {} failed: {}".format(
+            dn, error))
+        return None
+    if data is None:
+        return None
+    username = data.get(app.config.get("LDAP_USER_LOGIN_ATTR"), dn)
+    if isinstance(username, (list, tuple)):
+        username = username[0]
+    return save_user(dn, username, data, [])
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def sync_datastore_generation():
+    """Picks up a triplestore reload made by another worker before any
+    in-process cache is read"""
+    QUERY_CACHE.sync()
+
+@app.after_request
+def record_request_metrics(response):
+    if "request_start" in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+            endpoint=request.endpoint or "unknown",
+            method=request.method,
+            status=response.status_code)
+    return response
+
+@app.after_request
+def add_query_profile(response):
+    """Adds a Server-Timing header and, when SPARQL_DEBUG_FOOTER is set, a
+    footer listing the request's SPARQL queries. Streamed pages run most of
+    their queries after the headers are sent so they are skipped."""
+    profiles = request_queries()
+    if len(profiles) < 1 or response.is_streamed:
+        return response
+    if app.config.get("SERVER_TIMING", True):
+        response.headers["Server-Timing"] = server_timing(profiles)
+    if app.config.get("SPARQL_DEBUG_FOOTER", False) and \
+       response.mimetype == "text/html":
+        html = response.get_data(as_text=True)
+        position = html.rfind("</body>")
+        if position > -1:
+            response.set_data(html[:position] + debug_footer(profiles) +
+                html[position:])
+    return response
 
 @app.errorhandler(404)
 def page_not_found(e):
@@ -121,17 +341,18 @@ Subject: {2}
         text)
     message = email_text.MIMEText(message, _charset="UTF-8")
     #try:
-    server = smtplib.SMTP(app.config.get('EMAIL')['host'],
-                              app.config.get('EMAIL')['port'])
-
-    server.ehlo()
-    if app.config.get('EMAIL')['tls']:
-        server.starttls()
-    server.ehlo()
-    server.login(sender,
-                 app.config.get("EMAIL")["password"])
-    server.sendmail(sender, recipients, message.as_string())
-    server.close()
+    with SMTP_SECONDS.time(message="error"):
+        server = smtplib.SMTP(app.config.get('EMAIL')['host'],
+                                  app.config.get('EMAIL')['port'])
+
+        server.ehlo()
+        if app.config.get('EMAIL')['tls']:
+            server.starttls()
+        server.ehlo()
+        server.login(sender,
+                     app.config.get("EMAIL")["password"])
+        server.sendmail(sender, recipients, message.as_string())
+        server.close()
     #except:
     #    print("Error trying to send email")
     #    return False
@@ -152,14 +373,79 @@ def server_error(e):
     return render_template("500.html", scholar=current_user), 500 
     
 
+def academic_years(date=None):
+    """Returns the academic year IRIs containing date, defaults to now, as
+    terms for a SPARQL VALUES block"""
+    if date is None:
+        date = datetime.datetime.utcnow()
+    ACADEMIC_YEAR_INDEX.refresh(CONNECTION)
+    return ACADEMIC_YEAR_INDEX.values(date)
+
+def stream_template(template_name, **context):
+    """Renders a template as a stream of chunks, the page head is sent to 
+    the client before the rest of the template has been rendered"""
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(app.config.get("STREAM_BUFFER_SIZE", 5))
+    return stream
+
+def __cache_stream__(cache_key, chunks):
+    """Passes streamed chunks through and caches the complete page, unless
+    it grows past the fragment cache's byte bound"""
+    html, size = [], 0
+    for chunk in chunks:
+        yield chunk
+        if html is None:
+            continue
+        html.append(chunk)
+        size += len(chunk)
+        if FRAGMENT_CACHE.max_bytes is not None and \
+           size > FRAGMENT_CACHE.max_bytes:
+            html = None
+    if html is not None:
+        FRAGMENT_CACHE.set(cache_key, "".join(html))
+
+def prefetch_sparql(person_iris):
+    return PEOPLE_PREFETCH.format(
+        " ".join(["<{}>".format(iri) for iri in person_iris]),
+        academic_years())
+
+def prefetch_people(person_iris, results=None):
+    """Fetches the CC affiliations and research statements for every person
+    on a page in one query and stores them for the request so the 
+    get_history and get_statement filters don't query per person
+
+    Args:
+        person_iris(list): Person IRIs that will be rendered on the page
+        results(list): Rows of prefetch_sparql for person_iris if they were
+            already fetched
+    """
+    histories = g.setdefault("person_histories", dict())
+    statements = g.setdefault("research_statements", dict())
+    person_iris = [iri for iri in set(person_iris) if not iri in histories]
+    if len(person_iris) < 1:
+        return
+    for person_iri in person_iris:
+        histories[person_iri] = []
+        statements[person_iri] = ''
+    if results is None:
+        results = CONNECTION.datastore.query(prefetch_sparql(person_iris))
+    for row in results:
+        person_iri = row.get("person").get("value")
+        if "statement" in row:
+            if len(statements[person_iri]) < 1:
+                statements[person_iri] = row.get("statement").get("value")
+        else:
+            histories[person_iri].append(row)
+
 @app.template_filter("get_history")
 def person_history(person_iri):
-    current_date = datetime.datetime.utcnow()
+    results = g.get("person_histories", dict()).get(person_iri)
+    if results is None:
+        results = CONNECTION.datastore.query(
+            PERSON_HISTORY.format(person_iri, academic_years()))
     ul = etree.Element("ul")
-    
-    results = CONNECTION.datastore.query(
-        PERSON_HISTORY.format(person_iri,
-                              current_date.isoformat()))
     for row in results:
         li = etree.SubElement(ul, "li")
         li.text = "{} ".format(row.get("rank").get("value"))
@@ -180,31 +466,35 @@ def extract_iri(row):
         return row.get("person").get("value")
     return ''
 
+# Statistics on the home page by the prefix of their get_stat name
+STATISTICS = [("articles", COUNT_ARTICLES),
+              ("authors", COUNT_BOOK_AUTHORS),
+              ("book", COUNT_BOOKS),
+              ("journal", COUNT_JOURNALS),
+              ("org", COUNT_ORGS),
+              ("users", COUNT_PEOPLE),
+              ("chapters", COUNT_CHAPTERS)]
+
 @app.template_filter("get_stat")
 @contextfilter
 def generate_statistic(context, type_of):
     type_of = type_of.lower()
-    if type_of.startswith("articles"):
-        result = CONNECTION.datastore.query(COUNT_ARTICLES)
-    elif type_of.startswith("authors"):
-        result = CONNECTION.datastore.query(COUNT_BOOK_AUTHORS)
-    elif type_of.startswith("book"):
-        result = CONNECTION.datastore.query(COUNT_BOOKS)
-    elif type_of.startswith("journal"):
-        result = CONNECTION.datastore.query(COUNT_JOURNALS)
-    elif type_of.startswith("org"):
-        result = CONNECTION.datastore.query(COUNT_ORGS)
-    elif type_of.startswith("users"):
-        result = CONNECTION.datastore.query(COUNT_PEOPLE)
-    elif type_of.startswith("chapters"):
-        result = CONNECTION.datastore.query(COUNT_CHAPTERS)
-    else:
-        result = None
+    result = None
+    for prefix, sparql in STATISTICS:
+        if type_of.startswith(prefix):
+            # Counts already fetched for the request are stored on g
+            result = g.get("statistics", dict()).get(prefix)
+            if result is None:
+                result = CONNECTION.datastore.query(sparql)
+            break
     if result:
         return "{:,}".format(int(result[0].get("count").get("value")))
 
 @app.template_filter("get_statement")
 def research_statement(person_iri):
+    statements = g.get("research_statements", dict())
+    if person_iri in statements:
+        return statements[person_iri]
     sparql = RESEARCH_STMT.format(person_iri)
     results = CONNECTION.datastore.query(sparql)
     for row in results:
@@ -225,6 +515,9 @@ def academic_profile():
     fields = dict()
     if request.method.startswith("POST"):
         if len(request.form.get("iri", "")) < 1:
+            if SUBMISSIONS is not None:
+                return __submit__("profile",
+                    "New profile has been submitted for review")
             msg = add_profile(
                 form=request.form,
                 config=app.config,
@@ -255,14 +548,21 @@ def academic_profile():
         fields["family_name"] = current_user.data.get("sn")
         fields["given_name"] = current_user.data.get("givenName")
         fields["display_label"] = current_user.data.get("displayName")
-    results = CONNECTION.datastore.query(
-        PROFILE.format(fields.get("family_name"), 
-            fields.get("given_name"), 
-            fields.get("email")))
-    if len(results) == 1:
-        fields["iri"] = results[0].get("person").get("value")
-        if "statement" in results[0]:
-            fields["research_stmt"] = results[0].get('statement').get('value')
+        if current_user.person_iri is not None:
+            fields["iri"] = str(current_user.person_iri)
+    if "iri" in fields:
+        statement = research_statement(fields["iri"])
+        if len(statement) > 0:
+            fields["research_stmt"] = statement
+    else:
+        results = CONNECTION.datastore.query(
+            PROFILE.format(fields.get("family_name"), 
+                fields.get("given_name"), 
+                fields.get("email")))
+        if len(results) == 1:
+            fields["iri"] = results[0].get("person").get("value")
+            if "statement" in results[0]:
+                fields["research_stmt"] = results[0].get('statement').get('value')
     profile_form = ProfileForm(**fields)
     citations = []
     if "iri" in fields:
@@ -301,6 +601,11 @@ def academic_profile():
 
 @app.route("/fast")
 def fast_suggest():
+    import requests
+    fast_result = requests.get(__fast_url__())
+    return jsonify(fast_result.json().get("response").get('docs'))
+
+def __fast_url__():
     term = request.args.get('q')
     start = request.args.get("start", 0)
     oclc_fast_base = "http://fast.oclc.org/searchfast/fastsuggest"
@@ -309,63 +614,107 @@ def fast_suggest():
         term)
     if int(start) > 0:
         url += "&start={}".format(start)
-    fast_result = requests.get(url)
-    return jsonify(fast_result.json().get("response").get('docs'))
+    return url
     
     
 @app.route("/org")
 def org_browsing():
     org_iri = request.args.get("uri")
     date = request.args.get("date") # Should be in ISO format YYYY-MM-DDTHH:MM:00.0000
+    cache_key = ("org", org_iri, date)
+    if current_user.is_anonymous:
+        html = FRAGMENT_CACHE.get(cache_key)
+        if html is not None:
+            return html
+    try:
+        years = academic_years(date)
+    except ValueError:
+        abort(400)
+    results = CONNECTION.datastore.query(
+        ORG_YEARS_PEOPLE.format(org_iri, years))
+    return __render_org__(cache_key, __org_info__(org_iri, results))
+
+def __org_info__(org_iri, results):
+    """People of an organization by academic year from ORG_YEARS_PEOPLE
+    rows"""
     org_info = {"people":dict(),
                 "url": org_iri, 
                 "years": dict()}
-    if date is None:
-        date = datetime.datetime.utcnow().isoformat()
-    org_sparql =  ORG_INFO.format(org_iri, 
-        date)
-    results = CONNECTION.datastore.query(org_sparql)
+    year_people = dict()
     for row in results:
         if not "name" in org_info:
             org_info["name"] = row.get("label").get("value")
         year_iri = row.get("year").get("value")
-        org_info["years"][year_iri] = {"label": row.get("year_label"),
-                                       "people": []}
-    event_uri = list(org_info["years"].keys())[0]
-    org_people_sparql = ORG_PEOPLE.format(event_uri)
-    people_results = CONNECTION.datastore.query(org_people_sparql)
-    for row in people_results:
+        if not year_iri in org_info["years"]:
+            org_info["years"][year_iri] = {"label": row.get("year_label"),
+                                           "people": []}
+            year_people[year_iri] = set()
+        if not "person" in row:
+            continue
         person_iri = row.get("person").get("value")
-        org_info["years"][event_uri]["people"].append(person_iri)
-        org_info["people"][person_iri] = {
-            "name": row.get("name").get("value"),
-            "rank": row.get("rank").get("value"),
-            "statement": ""
-        }
-        if "statement" in row:
+        year_people[year_iri].add(person_iri)
+        if not person_iri in org_info["people"]:
+            name = row.get("name").get("value")
+            org_info["people"][person_iri] = {
+                "name": name,
+                "rank": row.get("rank").get("value"),
+                "statement": "",
+                "sort_key": (row.get("family").get("value").lower(),
+                             name.lower())
+            }
+        if "statement" in row and \
+           len(org_info["people"][person_iri]["statement"]) < 1:
             org_info["people"][person_iri]["statement"] = \
                 row.get('statement').get('value')
-    # Dedup and Sort
-    for event in org_info["years"]:
-        org_info["years"][event]["people"] = list(
-            set(org_info["years"][event]["people"]))
-    org_info["years"][event]["people"].sort(
-        key=lambda x: org_info["people"][x]["name"])
-    return render_template("organization.html",
+    # Sort every year's people by family name then full name
+    for year_iri, people in year_people.items():
+        org_info["years"][year_iri]["people"] = sorted(
+            people,
+            key=lambda x: org_info["people"][x]["sort_key"])
+    return org_info
+
+def __render_org__(cache_key, org_info):
+    html = render_template("organization.html",
         scholar=current_user, 
-        info=org_info)    
+        info=org_info)
+    if current_user.is_anonymous:
+        FRAGMENT_CACHE.set(cache_key, html)
+    return html
 
 
 @app.route("/person")
 def person_view():
     person_iri = request.args.get("iri")
-    person_info = {"url": person_iri,
-                   "citations":[],
-                   "book_citations": [],
-                   "book_chapter_citations": [],
-                   "creative_work_citations": []}
+    cache_key = ("person", person_iri)
+    if current_user.is_anonymous:
+        html = FRAGMENT_CACHE.get(cache_key)
+        if html is not None:
+            return html
     sparql = PERSON_INFO.format(person_iri)
-    results = CONNECTION.datastore.query(sparql)
+    person_info = __person_info__(person_iri,
+        CONNECTION.datastore.query(sparql))
+    email = person_info["email"][-1]
+    # person.html has its Recent Works section commented out, so a person's
+    # citations aren't queried for the page
+    subjects = CONNECTION.datastore.query(
+        SUBJECTS.format(email))
+    if len(subjects) > 0:
+        person_info["subjects"] = subjects
+    if app.config.get("STREAM_PERSON_PAGES", False):
+        # The page head and name are sent before the research statement
+        # and affiliations, which are queried as the template reaches them
+        chunks = stream_template("person.html",
+            scholar=current_user,
+            info=person_info)
+        if current_user.is_anonymous:
+            chunks = __cache_stream__(cache_key, chunks)
+        return Response(stream_with_context(chunks))
+    prefetch_people([person_iri])
+    return __render_person__(cache_key, person_info)
+
+def __person_info__(person_iri, results):
+    """Names and emails of a person from PERSON_INFO rows"""
+    person_info = {"url": person_iri}
     for row in results:
         email = row.get('email').get('value')
         if "email" in person_info:
@@ -374,44 +723,184 @@ def person_view():
         person_info["givenName"] = row.get("given").get("value")
         person_info["familyName"] = row.get("family").get("value")
         person_info["email"] = [email,]
-        
-    citation_sparql = CITATION.format(person_iri)
-    citations_result = CONNECTION.datastore.query(citation_sparql)
-    for row in citations_result:
-        person_info["citations"].append(row)
-
-    book_citations_sparql = BOOK_CITATION.format(person_iri)
-    book_citations_result = CONNECTION.datastore.query(book_citations_sparql)
-    for row in book_citations_result:
-        person_info["book_citations"].append(row)
-
-    book_chapter_citations_sparql = BOOK_CHAPTER_CITATION.format(person_iri)
-    book_chapter_citations_result = CONNECTION.datastore.query(book_chapter_citations_sparql)
-    for row in book_chapter_citations_result:
-        person_info["book_chapter_citations"].append(row)
-
-    creative_work_citations_sparql = CREATIVE_WORK_CITATION.format(person_iri)
-    creative_work_citations_result = CONNECTION.datastore.query(creative_work_citations_sparql)
-    for row in creative_work_citations_result:
-        person_info["creative_work_citations"].append(row)
-    
-    subjects = CONNECTION.datastore.query(
-        SUBJECTS.format(email))
-    if len(subjects) > 0:
-        person_info["subjects"] = subjects
-    return render_template("person.html",
+    return person_info
+
+def __render_person__(cache_key, person_info):
+    html = render_template("person.html",
         scholar=current_user,
         info=person_info)
+    if current_user.is_anonymous:
+        FRAGMENT_CACHE.set(cache_key, html)
+    return html
+
+def __is_directory_search__(query):
+    """Wildcard people search without keywords, paged from the triplestore
+    instead of being cached whole"""
+    return query['person'] == ["*"] and len(query['keywords']) < 1
+
+def __encode_cursor__(row):
+    return base64.urlsafe_b64encode(
+        json.dumps([row["family"], row["iri"]]).encode()).decode()
+
+def __decode_cursor__(cursor):
+    if cursor is None:
+        return None
+    try:
+        family, iri = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        abort(400)
+    if not isinstance(family, str) or not isinstance(iri, str):
+        abort(400)
+    return family, iri
+
+def __search__(query_id, query):
+    results = SEARCH_RESULTS.get(query_id)
+    if results is None:
+        results = __people_search__(query['person'])
+        results.extend(__keyword_search__(query['keywords']))
+        SEARCH_RESULTS.set(query_id, results)
+    return results
+
+def __search_query__():
+    """The id and query of the search being shown, from the q argument or
+    the session"""
+    query_id = request.args.get("q", session.get("query_id"))
+    query = SEARCH_QUERIES.get(query_id)
+    if query is None and query_id is not None and \
+       query_id == session.get("query_id"):
+        # The search was made through another worker
+        query = session.get("query")
+        if query is not None:
+            SEARCH_QUERIES.set(query_id, query)
+    return query_id, query
 
 @app.route("/results")
 def search_results():
-    query = session.get("query", {})
-    results = __people_search__(query['person'])
-    results.extend(__keyword_search__(query['keywords']))
+    query_id, query = __search_query__()
+    if query is None:
+        flash("Search has expired, please search again")
+        return redirect(url_for("home"))
+    page_size = app.config.get("SEARCH_PAGE_SIZE", 50)
+    if __is_directory_search__(query):
+        people = __people_search__(query['person'],
+            limit=page_size + 1,
+            after=__decode_cursor__(request.args.get("after")))
+        return __render_directory__(query_id, query, people)
+    return __render_results__(query_id, query, __search__(query_id, query))
+
+def __render_directory__(query_id, query, people):
+    """Renders a page of a directory search, people holds one more person
+    than a page when there is a next page"""
+    page_size = app.config.get("SEARCH_PAGE_SIZE", 50)
+    next_cursor = None
+    if len(people) > page_size:
+        people = people[:page_size]
+        next_cursor = __encode_cursor__(people[-1])
+    return render_template("search-results.html",
+        scholar=current_user,
+        query=query,
+        query_id=query_id,
+        people=people,
+        total=None,
+        page=1,
+        pages=1,
+        next_cursor=next_cursor)
+
+def __render_results__(query_id, query, results):
+    page_size = app.config.get("SEARCH_PAGE_SIZE", 50)
+    pages = max(1, (len(results) + page_size - 1) // page_size)
+    page = min(max(request.args.get("page", 1, type=int), 1), pages)
+    offset = (page - 1) * page_size
     return render_template("search-results.html",
         scholar=current_user, 
         query=query,
-        people=results)
+        query_id=query_id,
+        people=results[offset:offset + page_size],
+        total=len(results),
+        page=page,
+        pages=pages)
+
+@app.route("/results.json")
+def search_results_json():
+    """Streams all results for a search as a JSON array, directory searches
+    are fetched from the triplestore one page at a time"""
+    query_id, query = __search_query__()
+    if query is None:
+        abort(404)
+    page_size = app.config.get("SEARCH_PAGE_SIZE", 50)
+
+    def __rows__():
+        if not __is_directory_search__(query):
+            for row in __search__(query_id, query):
+                yield row
+            return
+        after = None
+        while True:
+            people = __people_search__(query['person'],
+                limit=page_size,
+                after=after)
+            for row in people:
+                yield row
+            if len(people) < page_size:
+                break
+            after = people[-1]["family"], people[-1]["iri"]
+
+    def __generate__():
+        yield '{{"query": {}, "results": ['.format(json.dumps(query))
+        for i, row in enumerate(__rows__()):
+            if i > 0:
+                yield ","
+            yield json.dumps(row)
+        yield "]}"
+    return Response(stream_with_context(__generate__()),
+                    mimetype="application/json")
+
+def __export_lines__(export_format, since):
+    # Each page is read once, caching them would only evict other results
+    rows = export_rows(
+        lambda sparql: CONNECTION.datastore.query(sparql, use_cache=False),
+        since,
+        app.config.get("EXPORT_PAGE_SIZE", 1000))
+    return serialize(rows, export_format)
+
+@app.route("/export")
+def export_graph():
+    """Streams every creative work, author and subject as N-Triples or JSON
+    Lines, since limits the export to entities changed after a dateTime"""
+    export_format = request.args.get("format", "ntriples")
+    if not export_format in FORMATS:
+        abort(400)
+    try:
+        lines = __export_lines__(export_format, request.args.get("since"))
+    except ValueError:
+        abort(400)
+    headers = {"Content-Disposition": 
+        "attachment; filename=scholarship-graph.{}".format(
+            "nt" if export_format == "ntriples" else export_format)}
+    if "gzip" in request.accept_encodings:
+        lines = gzip_stream(lines)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return Response(stream_with_context(lines),
+                    mimetype=FORMATS[export_format],
+                    headers=headers)
+
+@app.cli.command("export")
+@click.option("--format", "export_format", default="ntriples",
+    type=click.Choice(sorted(FORMATS)))
+@click.option("--since", default=None,
+    help="Only entities generated or revised after this ISO dateTime")
+@click.option("--output", type=click.File("wb"), default="-")
+@click.option("--gzip", "compress", is_flag=True, help="Gzip the output")
+def export_command(export_format, since, output, compress):
+    """Exports the scholarship graph to a file or stdout"""
+    lines = __export_lines__(export_format, since)
+    if compress:
+        for chunk in gzip_stream(lines):
+            output.write(chunk)
+    else:
+        for line in lines:
+            output.write(line.encode())
 
 @app.route("/search", methods=["POST"])
 def search_triplestore():
@@ -424,8 +913,12 @@ def search_triplestore():
     for token in [kw.strip() for kw in search_form.keywords.raw_data]:
         if len(token) < 1: continue
         query['keywords'].append(token)
+    query_id = hashlib.sha1(
+        json.dumps(query, sort_keys=True).encode()).hexdigest()[:12]
+    SEARCH_QUERIES.set(query_id, query)
+    session['query_id'] = query_id
     session['query'] = query
-    return redirect(url_for("search_results"))
+    return redirect(url_for("search_results", q=query_id))
 
 def __keyword_search__(keywords):
     output = dict()
@@ -489,36 +982,55 @@ WHERE {
     return sorted(output.values(), key=lambda x: x['weight'])
          
 
-def __people_search__(people):
-    output = []
+def __people_search__(people, limit=None, after=None):
+    """Searches current people by name tokens, ["*"] matches everyone
+
+    Args:
+        people(list): Name tokens
+        limit(int): Maximum number of people to return, None for all
+        after(tuple): Keyset cursor of (family name, person IRI), only
+            people sorting after it are returned
+    """
     if len(people) < 1:
-        return output
-    now = datetime.datetime.utcnow()
+        return []
+    return __people_rows__(CONNECTION.datastore.query(
+        __people_search_sparql__(people, limit, after)))
+
+def __people_search_sparql__(people, limit=None, after=None):
     sparql = PREFIX
     sparql += """
-SELECT DISTINCT ?person ?label
+SELECT DISTINCT ?person ?label ?family_key
 WHERE {{
+    VALUES ?academic_year {{ {0} }}
     ?person rdf:type bf:Person;
            schema:familyName ?family;
            rdfs:label ?label . 
     ?event schema:superEvent ?academic_year ;
            ?role ?person .
-    ?academic_year schema:startDate ?start ;
-                   schema:endDate ?end . 
-    FILTER(?start < "{0}"^^xsd:dateTime)
-    FILTER(?end >= "{0}"^^xsd:dateTime) 
-    FILTER(?role != cc_staff:department-staff-assistant)""".format(now.isoformat())
-    if people == ["*"]:
-        sparql += "} "
-    else:
+    BIND(STR(?family) as ?family_key)
+    FILTER(?role != cc_staff:department-staff-assistant)""".format(
+        academic_years())
+    if people != ["*"]:
         for token in people:
             sparql += """\nFILTER(CONTAINS(lcase(str(?label)), "{0}"))""".format(
                 token.lower())
-    sparql += "} ORDER BY ?family"
-    results = CONNECTION.datastore.query(sparql)
+    if after is not None:
+        # SPARQL string literals take the same escapes as N-Triples
+        family, iri = [value.translate(NT_ESCAPES) for value in after]
+        sparql += """\nFILTER(?family_key > "{0}" || 
+       (?family_key = "{0}" && STR(?person) > "{1}"))""".format(
+            family, iri)
+    sparql += "} ORDER BY ?family_key ?person"
+    if limit is not None:
+        sparql += " LIMIT {}".format(int(limit))
+    return sparql
+
+def __people_rows__(results):
+    output = []
     for row in results:
         output.append({"iri": row.get("person").get("value"),
-                       "name": row.get("label").get("value")})
+                       "name": row.get("label").get("value"),
+                       "family": row.get("family_key").get("value")})
     return output
 
 @app.route("/subject")
@@ -526,26 +1038,23 @@ def subject_view():
     subject_iri = request.args.get("iri")
     info = {"subject": subject_iri, 
             "assignments": []}
-    subject_prefix = PREFIX + """
-SELECT ?label
-WHERE {{
-    BIND(<{0}> as ?subject)""".format(subject_iri)
-    subject_sparql = subject_prefix + """
-    ?subject rdfs:label ?label . }"""
-    info["label"] = CONNECTION.datastore.query(subject_sparql)[0].get("label").get("value")
-    person_sparql = PREFIX + """
-SELECT ?person 
-WHERE {{
-    BIND(<{0}> as ?subject)
-    ?stmt schema:about ?subject ;
-          schema:accountablePerson ?person .}}""".format(subject_iri)
-    for row in CONNECTION.datastore.query(person_sparql):
+    if SNAPSHOT.refresh(CONNECTION):
+        info["label"] = SNAPSHOT.subject_label(subject_iri)
+    if info.get("label") is None:
+        info["label"] = CONNECTION.datastore.query(
+            SUBJECT_LABEL.format(subject_iri))[0].get("label").get("value")
+    for row in CONNECTION.datastore.query(SUBJECT_PEOPLE.format(subject_iri)):
         person_iri = row.get("person").get("value")
         person_info = {"iri": person_iri}
         person_info.update(CONNECTION.datastore.query(
             PERSON_INFO.format(person_iri))[0])
         
         info["assignments"].append(person_info)
+    # The template shows each person's history and research statement
+    prefetch_people([person_info["iri"] for person_info in info["assignments"]])
+    return __render_subject__(info)
+
+def __render_subject__(info):
     return render_template("subject.html",
         scholar=current_user,
         subject=info)
@@ -624,24 +1133,98 @@ def add_work():
             current_user=current_user)
     else:
         citation_type = request.form['citation_type']
-
-        if citation_type.startswith("article"):
-            work_form = ArticleForm(request.form)
-        elif citation_type.startswith("book chapter"):
-            work_form = BookChapterForm(request.form)
-        elif citation_type.startswith("book"):
-            work_form = BookForm(request.form)
-        if work_form.validate():
+        work_form = __work_form__(citation_type, request.form)
+        if not work_form.validate():
+            output = {"message": "Invalid fields",
+                      "status": False,
+                      "errors": work_form.errors}
+        elif SUBMISSIONS is not None:
+            return __submit__("work", "New work has been submitted for review")
+        else:
             output = add_creative_work(
                 config=app.config,
                 config_manager=CONFIG_MANAGER,
                 current_user=current_user,
                 work_form=work_form,
                 work_type=citation_type)
-        else:
-            output = {"message": "Invalid fields",
-                      "status": False,
-                      "errors": work_form.errors}
+    return jsonify(output)
+
+def __work_form__(citation_type, formdata, **kwargs):
+    if citation_type.startswith("article"):
+        return ArticleForm(formdata, **kwargs)
+    elif citation_type.startswith("book chapter"):
+        return BookChapterForm(formdata, **kwargs)
+    elif citation_type.startswith("book"):
+        return BookForm(formdata, **kwargs)
+    abort(400)
+
+def __submit__(kind, message):
+    """Saves the request's form for the background worker and returns
+    its tracking id and where to poll its status"""
+    submission_id = SUBMISSIONS.submit(kind,
+        {"id": current_user.get_id(),
+         "mail": current_user.data.get("mail"),
+         "person_iri": current_user.person_iri},
+        [(name, value) for name, value in request.form.items(multi=True)
+         if name != "csrf_token"])
+    return jsonify({"message": message,
+                    "status": True,
+                    "submission": submission_id,
+                    "status_url": url_for("submission_status",
+                                          id=submission_id)}), 202
+
+def __submitted_by__(submission):
+    """Stands in for the submitter's current_user in the worker"""
+    person_iri = submission["user"].get("person_iri")
+    return SimpleNamespace(data={"mail": submission["user"]["mail"]},
+        person_iri=None if person_iri is None else rdflib.URIRef(person_iri))
+
+def __process_work__(submission):
+    form = MultiDict(submission["form"])
+    with app.app_context():
+        # Validated with its CSRF token in the request
+        work_form = __work_form__(form["citation_type"], form,
+                                  meta={"csrf": False})
+        return add_creative_work(
+            config=app.config,
+            config_manager=CONFIG_MANAGER,
+            current_user=__submitted_by__(submission),
+            work_form=work_form,
+            work_type=form["citation_type"],
+            before_send=submission["mark_sent"])
+
+def __process_profile__(submission):
+    with app.app_context():
+        add_profile(
+            form=MultiDict(submission["form"]),
+            config=app.config,
+            config_manager=CONFIG_MANAGER,
+            current_user=__submitted_by__(submission),
+            before_send=submission["mark_sent"])
+    return {"message": "New profile has been submitted for review",
+            "status": True}
+
+@app.route("/submission")
+@login_required
+def submission_status():
+    """Status of a new work or profile, and its result once processed,
+    for the submitter or an administrator"""
+    if SUBMISSIONS is None:
+        abort(404)
+    submission = SUBMISSIONS.status(request.args.get("id", ""))
+    if submission is None or \
+       (submission["user"]["id"] != current_user.get_id() and
+        not is_administrator(current_user)):
+        abort(404)
+    output = {"submission": submission["id"],
+              "kind": submission["kind"],
+              "status": submission["status"],
+              "created": submission["created"],
+              "updated": submission["updated"]}
+    if submission["result"] is not None:
+        output["result"] = submission["result"]
+    if submission["error"] is not None:
+        output["error"] = submission["error"]
     return jsonify(output)
 
 #! We may move this logic to a add_work route and add a 
@@ -706,6 +1289,7 @@ def edit_work():
             function=edit_creative_work,
             citation=raw_citation,
             current_user_email=current_user.data.get("mail"),
+            revised_by=current_user.person_iri,
             work_type=work_type)
         BACKEND_THREAD.start()
         output =  {"message": """Your work is being processed. 
@@ -719,112 +1303,299 @@ You should receive an email when your edits are being reviewed""",
 
 @app.route("/")
 def home():
-    search_form = SearchForm()
+    if SNAPSHOT.refresh(CONNECTION):
+        departments = SNAPSHOT.org_listing()
+    else:
+        departments = __departments__(CONNECTION.datastore.query(ORG_LISTING))
+    return __render_home__(departments)
+
+def __departments__(results):
     departments = []
-    results = CONNECTION.datastore.query(ORG_LISTING)
     for row in results:
         departments.append(
                 (row.get('iri').get('value'),
                  row.get('label').get('value')))
+    return departments
+
+def __render_home__(departments):
+    search_form = SearchForm()
     search_form.department.choices = departments
     return render_template("index.html", 
         login=LDAPLoginForm(),
         search_form=search_form,
         scholar=current_user)
 
-@app.template_filter("article_link_filter")
-def article_link(citation):
-	url = str(citation["url"]["value"])
-	if url.startswith("http"):
-		link = "<a href='" + url + "' target='_blank'>" + citation["name"]["value"]+"</a>"
-	else:
-		link = citation["name"]["value"]
-	return(link)
-
-@app.template_filter("volume_issue_filter")
-def volume_issue(citation):
-	volume_issue_string = ""
-	volume_number = ""
-	issue_number = ""
-	if "volume_number" in citation.keys():
-		volume_number = str(citation["volume_number"]["value"])
-	if "issue_number" in citation.keys():
-		issue_number = str(citation["issue_number"]["value"])
-		
-	if volume_number != "":
-		volume_issue_string = "v." + volume_number
-		if issue_number != "":
-			volume_issue_string = volume_issue_string + " no." + issue_number
-	if volume_number == "" and issue_number != "":
-		volume_issue_string = "no." + issue_number
-	
-	return(volume_issue_string)
-	
-@app.template_filter("page_number_filter")
-def page_number(citation):
-	page_string = ""
-	page_start = ""
-	page_end = ""
-	if "page_start" in citation.keys():
-		page_start = str(citation["page_start"]["value"])
-	if "page_end" in citation.keys():
-		page_end = str(citation["page_end"]["value"])
-	if page_start != "":
-		page_string = "p." + page_start
-	if page_end != "":
-		page_string = page_string + "-" + page_end
-	if page_string != "":
-		page_string = page_string + "."
-	return(page_string)
-
-@app.template_filter("book_title_filter")
-def book_title(book_citation):
-    title_string=""
-    if "title" in book_citation:
-        title = book_citation["title"]["value"]
-    #elif "book_chapter_title" in book_citation:
-    #    title = book_citation["book_chapter_title"]["value"]
-    uri = str(book_citation["book"]["value"])
-    if "url" in book_citation.keys():
-        if book_citation["url"]["value"] != None and book_citation["url"]["value"] != "":
-            url = str(book_citation["url"]["value"])
-        else:
-            url = ""
-    if uri.startswith("https://tiger.coloradocollege.edu/"):
-        title_string = "<a href='" + uri + "', target='_blank'>" + title + "</a>"
-    elif uri.startswith("http"):
-        title_string = "<a href='" + uri + "', target='_blank'>" + title + "</a>"
-    #elif book_citation["url"]["value"] != None and book_citation["url"]["value"] != "":
-    #    title_string = "<a href='" + book_citation["url"]["value"] + ",target= 'blank'>" + title + "</a>"
+def __plain_row__(row):
+    """Flattens a SPARQL JSON row into a dict of variable to value"""
+    return {key: binding.get("value") for key, binding in row.items()}
+
+def __api_response__(build, *args):
+    """JSON API response keyed on the route and its arguments"""
+    if args[0] is None:
+        abort(400)
+    return json_response((request.path,) + args,
+        lambda: build(*args),
+        max_age=app.config.get("API_MAX_AGE", 300))
+
+def __person_json__(person_iri):
+    results = CONNECTION.datastore.query(PERSON_INFO.format(person_iri))
+    if len(results) < 1:
+        return None
+    person = {"iri": person_iri,
+              "givenName": results[0].get("given").get("value"),
+              "familyName": results[0].get("family").get("value"),
+              "label": results[0].get("label").get("value"),
+              "email": sorted(set([row.get("email").get("value")
+                                   for row in results]))}
+    for key, template in [("articles", CITATION),
+                          ("books", BOOK_CITATION),
+                          ("book_chapters", BOOK_CHAPTER_CITATION),
+                          ("creative_works", CREATIVE_WORK_CITATION)]:
+        person[key] = [__plain_row__(row) for row in
+            CONNECTION.datastore.query(template.format(person_iri))]
+    person["subjects"] = []
+    for email in person["email"]:
+        for row in CONNECTION.datastore.query(SUBJECTS.format(email)):
+            person["subjects"].append(__plain_row__(row))
+    prefetch_people([person_iri])
+    person["statement"] = g.research_statements.get(person_iri, '')
+    person["affiliations"] = [__plain_row__(row)
+        for row in g.person_histories.get(person_iri, [])]
+    return person
+
+def __org_json__(org_iri, date):
+    results = CONNECTION.datastore.query(
+        ORG_YEARS_PEOPLE.format(org_iri, academic_years(date)))
+    if len(results) < 1:
+        return None
+    org = {"iri": org_iri,
+           "name": results[0].get("label").get("value"),
+           "years": []}
+    years = OrderedDict()
+    for row in results:
+        year_iri = row.get("year").get("value")
+        if not year_iri in years:
+            years[year_iri] = {"iri": year_iri,
+                               "label": row.get("year_label").get("value"),
+                               "people": OrderedDict()}
+        if not "person" in row:
+            continue
+        person_iri = row.get("person").get("value")
+        people = years[year_iri]["people"]
+        if not person_iri in people:
+            people[person_iri] = {"iri": person_iri,
+                                  "name": row.get("name").get("value"),
+                                  "familyName": row.get("family").get("value"),
+                                  "rank": row.get("rank").get("value"),
+                                  "statement": ""}
+        if "statement" in row and len(people[person_iri]["statement"]) < 1:
+            people[person_iri]["statement"] = \
+                row.get("statement").get("value")
+    for year in years.values():
+        year["people"] = sorted(year["people"].values(),
+            key=lambda x: (x["familyName"].lower(), x["name"].lower()))
+        org["years"].append(year)
+    return org
+
+def __subject_json__(subject_iri):
+    results = CONNECTION.datastore.query(PREFIX + """
+SELECT ?label
+WHERE {{
+    <{0}> rdfs:label ?label . }}""".format(subject_iri))
+    if len(results) < 1:
+        return None
+    subject = {"iri": subject_iri,
+               "label": results[0].get("label").get("value"),
+               "people": []}
+    people = CONNECTION.datastore.query(PREFIX + """
+SELECT DISTINCT ?person ?label
+WHERE {{
+    ?stmt schema:about <{0}> ;
+          schema:accountablePerson ?person .
+    ?person rdfs:label ?label .}}
+ORDER BY ?label""".format(subject_iri))
+    for row in people:
+        subject["people"].append({"iri": row.get("person").get("value"),
+                                  "label": row.get("label").get("value")})
+    return subject
+
+def __work_json__(work_iri):
+    results = CONNECTION.datastore.query(WORK_INFO.format(work_iri))
+    if len(results) < 1:
+        return None
+    # OPTIONAL patterns repeat the work once per combination of matches,
+    # collapse them into the distinct values of each variable
+    work = OrderedDict()
+    for row in results:
+        for key, value in __plain_row__(row).items():
+            values = work.setdefault(key, [])
+            if not value in values:
+                values.append(value)
+    work = {key: values[0] if len(values) == 1 else values
+            for key, values in work.items()}
+    work["iri"] = work_iri
+    return work
+
+def __changes_json__(since, after):
+    CHANGE_INDEX.refresh(CONNECTION)
+    changes = CHANGE_INDEX.changes_after(since, after,
+        app.config.get("CHANGES_PAGE_SIZE", 500))
+    feed = {"since": since,
+            "changes": [],
+            "next": None}
+    for changed, entity, kind in changes:
+        feed["changes"].append({"iri": entity,
+                                "kind": kind,
+                                "time": changed.isoformat()})
+    if len(changes) > 0:
+        changed, entity, kind = changes[-1]
+        feed["next"] = url_for("changes_feed",
+            since=changed.isoformat(),
+            after=entity)
+    return feed
+
+@app.route("/changes")
+def changes_feed():
+    """JSON feed of entities generated or revised after since, oldest first.
+    Follow next until it returns no changes to catch up"""
+    since = request.args.get("since")
+    after = request.args.get("after")
+    # The after cursor is the last entity at since, next links carry both
+    if since is None:
+        if after is not None:
+            abort(400)
     else:
-        title_string = title
-    return(title_string)
-
-@app.template_filter("creative_work_title_filter")
-def creative_work_title(creative_work_citation):
-    title_string=""
-    title = creative_work_citation["title"]["value"]
-    uri = str(creative_work_citation["creative_work"]["value"])
-    if "url" in creative_work_citation.keys():
-        if creative_work_citation["url"]["value"] != None and creative_work_citation["url"]["value"] != "":
-            url = str(creative_work_citation["url"]["value"])
-        else:
-            url = ""
-    if uri.startswith("https://tiger.coloradocollege.edu/"):
-        title_string = "<a href='" + uri + "', target='_blank'>" + title + "</a>"
-    elif uri.startswith("http"):
-        title_string = "<a href='" + uri + "', target='_blank'>" + title + "</a>"
+        try:
+            parse_datetime(since)
+        except ValueError:
+            abort(400)
+    return json_response((request.path, since, after),
+        lambda: __changes_json__(since, after),
+        max_age=app.config.get("API_MAX_AGE", 300))
+
+@app.route("/metrics")
+def metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return Response(METRICS.expose(),
+                    mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/person")
+def person_api():
+    return __api_response__(__person_json__, request.args.get("iri"))
+
+@app.route("/api/org")
+def org_api():
+    try:
+        academic_years(request.args.get("date"))
+    except ValueError:
+        abort(400)
+    return __api_response__(__org_json__,
+        request.args.get("iri"),
+        request.args.get("date"))
+
+@app.route("/api/subject")
+def subject_api():
+    return __api_response__(__subject_json__, request.args.get("iri"))
+
+@app.route("/api/work")
+def work_api():
+    return __api_response__(__work_json__, request.args.get("iri"))
+
+app.add_template_filter(article_link, "article_link_filter")
+app.add_template_filter(volume_issue, "volume_issue_filter")
+app.add_template_filter(page_number, "page_number_filter")
+app.add_template_filter(book_title, "book_title_filter")
+app.add_template_filter(creative_work_title, "creative_work_title_filter")
+app.add_template_filter(book_edition, "book_edition_filter")
+
+
+def create_app(config_filename="config.py"):
+    """Loads the instance configuration, then sets up the triplestore
+    connections, login managers and cache sizes. Heavy dependencies are
+    only imported here or on first use so workers import the module
+    quickly, calling it again returns the configured app. Entry points that
+    import app without calling it get it run before their first request or
+    triplestore query.
+
+    Args:
+        config_filename(str): Python configuration file in the instance 
+            folder
+    """
+    with CONFIGURE_LOCK:
+        if CONFIG_MANAGER is None:
+            __configure__(config_filename)
+    return app
+
+def __configure__(config_filename):
+    global CONFIG_MANAGER, SUBMISSIONS
+    from rdfframework.configuration import RdfConfigManager
+    app.config.from_pyfile(config_filename)
+    CONFIG_MANAGER = RdfConfigManager(app.config,
+        verify=False,
+        delay_check=True)
+    CONNECTION.conns = CONFIG_MANAGER.conns
+    CONNECTION.slow_seconds = app.config.get("SLOW_QUERY_SECONDS", 1.0)
+    login_manager.init_app(app)
+    ldap_manager.init_app(app)
+    FRAGMENT_CACHE.max_entries = app.config.get("FRAGMENT_CACHE_ENTRIES",
+        FRAGMENT_CACHE.max_entries)
+    FRAGMENT_CACHE.max_bytes = app.config.get("FRAGMENT_CACHE_BYTES",
+        FRAGMENT_CACHE.max_bytes)
+    FRAGMENT_CACHE.ttl = app.config.get("FRAGMENT_CACHE_TTL",
+        FRAGMENT_CACHE.ttl)
+    for cache in [SEARCH_QUERIES, SEARCH_RESULTS]:
+        cache.max_entries = app.config.get("SEARCH_CACHE_ENTRIES",
+            cache.max_entries)
+    SEARCH_QUERIES.ttl = app.config.get("SEARCH_QUERY_TTL",
+        SEARCH_QUERIES.ttl)
+    SEARCH_RESULTS.ttl = app.config.get("SEARCH_CACHE_TTL",
+        SEARCH_RESULTS.ttl)
+    QUERY_CACHE.local.max_entries = app.config.get("QUERY_CACHE_ENTRIES",
+        QUERY_CACHE.local.max_entries)
+    QUERY_CACHE.local.max_bytes = app.config.get("QUERY_CACHE_BYTES",
+        QUERY_CACHE.local.max_bytes)
+    QUERY_CACHE.local.ttl = app.config.get("QUERY_CACHE_TTL",
+        QUERY_CACHE.local.ttl)
+    if app.config.get("QUERY_CACHE_PATH"):
+        # Also shares the datastore generation when results aren't cached
+        QUERY_CACHE.shared = SharedStore(app.config["QUERY_CACHE_PATH"],
+            max_entries=app.config.get("QUERY_CACHE_SHARED_ENTRIES",
+                100000),
+            ttl=QUERY_CACHE.local.ttl)
+    if app.config.get("QUERY_CACHE",
+                      bool(app.config.get("QUERY_CACHE_PATH"))):
+        CONNECTION.cache = QUERY_CACHE
     else:
-        title_string = title
-    return(title_string)
-
-@app.template_filter("book_edition_filter")
-def book_edition(book_citation):
-    edition_string=""
-    if "editionStatement" in book_citation.keys():
-        if book_citation["editionStatement"]["value"] != "":
-            edition_string = book_citation["editionStatement"]["value"]
-            if "ed." or "edition" or "editor" or "edited" not in edition_string:
-                edition_string = edition_string + " ed. "
-    return(edition_string)
-    
+        CONNECTION.cache = None
+    USERS.local.max_entries = app.config.get("USER_CACHE_ENTRIES",
+        USERS.local.max_entries)
+    USERS.local.ttl = app.config.get("USER_CACHE_TTL", USERS.local.ttl)
+    if app.config.get("USER_CACHE_PATH"):
+        USERS.shared = SharedStore(app.config["USER_CACHE_PATH"],
+            max_entries=USERS.local.max_entries,
+            ttl=USERS.local.ttl,
+            prune_every=50)
+    if app.config.get("ASYNC_SUBMISSIONS", True):
+        os.makedirs(app.instance_path, exist_ok=True)
+        SUBMISSIONS = Submissions(
+            SubmissionStore(app.config.get("SUBMISSIONS_PATH",
+                os.path.join(app.instance_path, "submissions.sqlite"))),
+            {"work": __process_work__, "profile": __process_profile__})
+    if app.config.get("SNAPSHOT_INDEXES", False):
+        try:
+            SNAPSHOT.build(CONNECTION)
+            app.logger.info("Graph snapshot built, {:,} bytes".format(
+                SNAPSHOT.nbytes()))
+        except Exception as error:
+            # Pages fall back to querying the triplestore
+            app.logger.warning("Graph snapshot not built: {}".format(error))
+
+def __configured__(wsgi_app):
+    """Runs create_app before the request context, and its session, is
+    set up"""
+    def __wsgi__(environ, start_response):
+        create_app()
+        return wsgi_app(environ, start_response)
+    return __wsgi__
+
+app.wsgi_app = __configured__(app.wsgi_app)
@@ -0,0 +1,422 @@
+"""Optional ASGI serving for Scholarship App
+
+The read-only pages (/, /person, /org, /subject, /results and /fast) are
+served by coroutines that send their triplestore and fast.oclc.org
+requests through one pooled async HTTP client, running independent
+queries at the same time, so a single process can wait on many slow
+upstream requests. Pages are rendered with the Flask app's templates,
+request hooks and error handlers; every other request is passed to the
+WSGI app.
+
+Needs the httpx and asgiref packages, asgi.py serves it with any ASGI
+server."""
+__author__ = "Jeremy Nelson"
+
+import asyncio
+import functools
+import time
+
+from flask import abort, g, jsonify, request
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+
+from . import app as views
+from .cache import DATASTORE_GENERATION, is_select, query_key
+from .profiling import QueryProfile, log_slow_query, result_bytes
+from .profiling import template_name
+from .sparql import ORG_LISTING, ORG_YEARS_PEOPLE, PERSON_INFO, SUBJECTS
+from .sparql import SUBJECT_LABEL, SUBJECT_PEOPLE
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+# get_stat counts highlight.html shows on the home page
+HOME_STATISTICS = ["org", "users"]
+
+def sparql_url(config):
+    """SPARQL endpoint of the datastore connection in the app's config,
+    SPARQL_ENDPOINT overrides the URL built from CONNECTIONS"""
+    if config.get("SPARQL_ENDPOINT"):
+        return config["SPARQL_ENDPOINT"]
+    for connection in config.get("CONNECTIONS", []):
+        if connection.get("name", "").startswith("datastore"):
+            url = connection.get("url").rstrip("/")
+            namespace = connection.get("namespace")
+            if namespace and not url.endswith("/sparql"):
+                url = "{}/namespace/{}/sparql".format(url, namespace)
+            return url
+    raise ValueError("No datastore connection in CONNECTIONS")
+
+
+class AsyncDatastore(object):
+    """Sends SPARQL SELECT queries with an async HTTP client, profiling
+    them like ProfiledDatastore
+
+    Args:
+        url(str): SPARQL endpoint
+        client(httpx.AsyncClient): Pooled HTTP client
+        slow_seconds(float): Queries slower than this are logged
+        listeners(list): Functions called with every QueryProfile
+        cache(QueryCache): Query results shared with the sync views
+    """
+
+    def __init__(self, url, client, slow_seconds=1.0, listeners=None,
+                 cache=None):
+        self.url = url
+        self.client = client
+        self.slow_seconds = slow_seconds
+        self.listeners = listeners if listeners is not None else []
+        self.cache = cache
+
+    def __record__(self, profile, sparql, profiles, path):
+        if profiles is not None:
+            profiles.append(profile)
+        if not profile.cached and self.slow_seconds is not None and \
+           profile.elapsed >= self.slow_seconds:
+            log_slow_query(profile, sparql, path)
+        for listener in self.listeners:
+            listener(profile)
+
+    async def query(self, sparql, profiles=None, path="async"):
+        key, generation = None, None
+        if self.cache is not None and is_select(sparql):
+            key = query_key(sparql)
+            generation = self.cache.generation()
+            results = self.cache.get(key)
+            if results is not None:
+                self.__record__(QueryProfile(template_name(sparql),
+                                             0.0,
+                                             len(results),
+                                             result_bytes(results),
+                                             True),
+                                sparql, profiles, path)
+                return results
+        start = time.perf_counter()
+        response = await self.client.post(self.url,
+            data={"query": sparql},
+            headers={"Accept": "application/sparql-results+json"})
+        response.raise_for_status()
+        results = response.json().get("results", {}).get("bindings", [])
+        elapsed = time.perf_counter() - start
+        self.__record__(QueryProfile(template_name(sparql),
+                                     elapsed,
+                                     len(results),
+                                     result_bytes(results)),
+                        sparql, profiles, path)
+        if key is not None:
+            self.cache.set(key, results, generation)
+        return results
+
+
+def __raise__(error):
+    raise error
+
+def __cached__(cache_key):
+    views.QUERY_CACHE.sync()
+    if current_user.is_anonymous:
+        return views.FRAGMENT_CACHE.get(cache_key)
+    return None
+
+
+class Page(object):
+    """One request to an async handler. Queries are awaited outside of any
+    Flask context, view code runs synchronously in a request context built
+    from the ASGI scope so it never spans an await. Rendering runs in the
+    default executor to keep the event loop free."""
+
+    def __init__(self, server, scope):
+        self.server = server
+        self.scope = scope
+        self.start = time.perf_counter()
+        self.profiles = []
+        self.path = scope.get("path", "")[len(server.mount):] or "/"
+
+    async def query(self, sparql):
+        return await self.server.datastore.query(sparql,
+            self.profiles,
+            self.path)
+
+    async def gather(self, *queries):
+        return await asyncio.gather(*[self.query(sparql)
+                                      for sparql in queries])
+
+    def context(self):
+        scope = self.scope
+        headers = [(name.decode("latin-1"), value.decode("latin-1"))
+                   for name, value in scope.get("headers", [])]
+        host = dict(headers).get("host",
+            "{}:{}".format(*(scope.get("server") or ("localhost", 80))))
+        return self.server.app.test_request_context(self.path,
+            base_url="{}://{}{}".format(scope.get("scheme", "http"),
+                                        host,
+                                        self.server.mount),
+            query_string=scope.get("query_string", b"").decode("latin-1"),
+            method=scope["method"],
+            headers=headers,
+            environ_base={"REMOTE_ADDR": (scope.get("client") or ("",))[0]})
+
+    def call(self, view):
+        """Returns view's result, called in the request's context"""
+        with self.context():
+            return view()
+
+    def __respond__(self, view):
+        app = self.server.app
+        with self.context():
+            try:
+                rv = app.preprocess_request()
+                g.request_start = self.start
+                g.sparql_queries = self.profiles
+                if rv is None:
+                    rv = view()
+            except HTTPException as error:
+                rv = app.handle_http_exception(error)
+            except Exception as error:
+                # Renders the 500 page and runs after_request itself
+                return app.handle_exception(error)
+            return app.process_response(app.make_response(rv))
+
+    async def respond(self, view):
+        """Calls view in the request's context in a thread and returns its
+        response, with the app's before_request functions, error handlers
+        and after_request functions run around it as in a WSGI request"""
+        return await asyncio.get_event_loop().run_in_executor(None,
+            self.__respond__, view)
+
+
+async def refresh(page, index):
+    """GenerationIndex.refresh with the query awaited"""
+    generation = DATASTORE_GENERATION.value
+    if index.generation == generation:
+        return
+    results = await page.query(index.sparql)
+    with index.lock:
+        if index.generation != generation:
+            index.load(results)
+            index.generation = generation
+
+async def snapshot():
+    """GraphSnapshot.refresh in a thread, a rebuild runs its queries"""
+    if views.SNAPSHOT.current:
+        return True
+    return await asyncio.get_event_loop().run_in_executor(None,
+        views.SNAPSHOT.refresh, views.CONNECTION)
+
+async def home(page):
+    statistics = [(prefix, sparql) for prefix, sparql in views.STATISTICS
+                  if prefix in HOME_STATISTICS]
+    queries = [sparql for prefix, sparql in statistics]
+    if await snapshot():
+        departments = views.SNAPSHOT.org_listing()
+        counts = await page.gather(*queries)
+    else:
+        results = await page.gather(ORG_LISTING, *queries)
+        departments = views.__departments__(results[0])
+        counts = results[1:]
+
+    def __view__():
+        g.statistics = dict(zip([prefix for prefix, sparql in statistics],
+                                counts))
+        return views.__render_home__(departments)
+    return await page.respond(__view__)
+
+async def person(page):
+    person_iri = page.call(lambda: request.args.get("iri"))
+    cache_key = ("person", person_iri)
+    html = page.call(functools.partial(__cached__, cache_key))
+    if html is not None:
+        return await page.respond(lambda: html)
+    results = await page.query(PERSON_INFO.format(person_iri))
+    if len(results) < 1:
+        return None
+    person_info = views.__person_info__(person_iri, results)
+    await refresh(page, views.ACADEMIC_YEAR_INDEX)
+    subjects, prefetched = await page.gather(
+        SUBJECTS.format(person_info["email"][-1]),
+        views.prefetch_sparql([person_iri]))
+    if len(subjects) > 0:
+        person_info["subjects"] = subjects
+
+    def __view__():
+        views.prefetch_people([person_iri], prefetched)
+        return views.__render_person__(cache_key, person_info)
+    return await page.respond(__view__)
+
+async def org(page):
+    org_iri, date = page.call(lambda: (request.args.get("uri"),
+                                       request.args.get("date")))
+    cache_key = ("org", org_iri, date)
+    html = page.call(functools.partial(__cached__, cache_key))
+    if html is not None:
+        return await page.respond(lambda: html)
+    await refresh(page, views.ACADEMIC_YEAR_INDEX)
+    try:
+        years = views.academic_years(date)
+    except ValueError:
+        return await page.respond(lambda: abort(400))
+    results = await page.query(ORG_YEARS_PEOPLE.format(org_iri, years))
+    return await page.respond(lambda: views.__render_org__(cache_key,
+        views.__org_info__(org_iri, results)))
+
+async def subject(page):
+    subject_iri = page.call(lambda: request.args.get("iri"))
+    info = {"subject": subject_iri,
+            "assignments": []}
+    if await snapshot():
+        info["label"] = views.SNAPSHOT.subject_label(subject_iri)
+    queries = [SUBJECT_PEOPLE.format(subject_iri)]
+    if info.get("label") is None:
+        queries.append(SUBJECT_LABEL.format(subject_iri))
+    results = await page.gather(*queries)
+    if info.get("label") is None:
+        info["label"] = results[1][0].get("label").get("value")
+    person_iris = [row.get("person").get("value") for row in results[0]]
+    queries = [PERSON_INFO.format(person_iri) for person_iri in person_iris]
+    # The template shows each person's history and research statement
+    if len(person_iris) > 0:
+        await refresh(page, views.ACADEMIC_YEAR_INDEX)
+        queries.append(views.prefetch_sparql(person_iris))
+    results = await page.gather(*queries)
+    for person_iri, rows in zip(person_iris, results):
+        person_info = {"iri": person_iri}
+        person_info.update(rows[0])
+        info["assignments"].append(person_info)
+
+    def __view__():
+        if len(person_iris) > 0:
+            views.prefetch_people(person_iris, results[-1])
+        return views.__render_subject__(info)
+    return await page.respond(__view__)
+
+async def results(page):
+    def __search__():
+        query_id, query = views.__search_query__()
+        after = None
+        if query is not None and views.__is_directory_search__(query):
+            after = views.__decode_cursor__(request.args.get("after"))
+        return query_id, query, after
+    query_id, query, after = page.call(__search__)
+    if query is None:
+        # The app flashes a message and redirects home
+        return None
+    if views.__is_directory_search__(query):
+        await refresh(page, views.ACADEMIC_YEAR_INDEX)
+        people = views.__people_rows__(await page.query(
+            views.__people_search_sparql__(query['person'],
+                limit=page.server.app.config.get("SEARCH_PAGE_SIZE", 50) + 1,
+                after=after)))
+        return await page.respond(lambda: views.__render_directory__(query_id,
+            query,
+            people))
+    found = views.SEARCH_RESULTS.get(query_id)
+    if found is None:
+        # Keyword searches query once per person found, they stay
+        # synchronous and run in the default executor
+        found = await asyncio.get_event_loop().run_in_executor(None,
+            views.__search__, query_id, query)
+    return await page.respond(lambda: views.__render_results__(query_id,
+        query,
+        found))
+
+async def fast(page):
+    url = page.call(views.__fast_url__)
+    response = await page.server.client.get(url)
+    docs = response.json().get("response").get("docs")
+    return await page.respond(lambda: jsonify(docs))
+
+ROUTES = {"/": home,
+          "/person": person,
+          "/org": org,
+          "/subject": subject,
+          "/results": results,
+          "/fast": fast}
+
+
+class AsyncApp(object):
+    """ASGI application serving ROUTES with async handlers and passing
+    every other request to a WSGI application in a thread
+
+    Args:
+        app(Flask): Scholarship App after create_app
+        fallback: WSGI application for other requests, defaults to app
+        mount(str): Path prefix app is served under in fallback
+    """
+
+    def __init__(self, app, fallback=None, mount=""):
+        if httpx is None or WsgiToAsgi is None:
+            raise RuntimeError(
+                "ASGI serving needs the httpx and asgiref packages")
+        self.app = app
+        self.mount = mount
+        self.fallback = WsgiToAsgi(fallback or app)
+        self.client = None
+        self.datastore = None
+
+    def startup(self):
+        # The async handlers don't pass through app.wsgi_app
+        views.create_app()
+        config = self.app.config
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.get("ASGI_MAX_CONNECTIONS", 100),
+                max_keepalive_connections=config.get(
+                    "ASGI_KEEPALIVE_CONNECTIONS", 20)),
+            timeout=config.get("ASGI_UPSTREAM_TIMEOUT", 60))
+        self.datastore = AsyncDatastore(sparql_url(config),
+            self.client,
+            views.CONNECTION.slow_seconds,
+            views.CONNECTION.listeners,
+            views.CONNECTION.cache)
+
+    async def shutdown(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        path = scope.get("path", "")
+        handler = None
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD") \
+           and path.startswith(self.mount):
+            handler = ROUTES.get(path[len(self.mount):] or "/")
+        if handler is None:
+            return await self.fallback(scope, receive, send)
+        # Servers without lifespan events
+        if self.client is None:
+            self.startup()
+        page = Page(self, scope)
+        try:
+            response = await handler(page)
+        except Exception as error:
+            response = await page.respond(functools.partial(__raise__,
+                                                             error))
+        if response is None:
+            return await self.fallback(scope, receive, send)
+        body = response.get_data() if scope["method"] != "HEAD" else b""
+        await send({"type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": [(name.lower().encode("latin-1"),
+                                 value.encode("latin-1"))
+                                for name, value in
+                                response.headers.to_wsgi_list()]})
+        await send({"type": "http.response.body", "body": body})
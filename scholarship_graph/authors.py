@@ -0,0 +1,85 @@
+"""Author name parsing for citation ingest, splits a cite:authorString into
+names and each name into given and family names with any initials"""
+__author__ = "Jeremy Nelson"
+
+import functools
+import re
+from collections import namedtuple
+
+# The name forms in the order they are tried, the first form found anywhere
+# in a name wins. Each is a lookahead from the start of the name so one
+# match tries them in that order, an alternation of the bare forms would
+# take whichever matches leftmost instead.
+NAME_FORMS = [
+    # GivenName Initial FamilyName ex. Jane C. Doe, the words are used as
+    # written
+    ("words", r"\w+\s\w?\.\s\w+\-?\w+"),
+    # Initial GivenName FamilyName ex. C. Jane Doe
+    ("initial_given", r"\.\s(?P<ig_given>\w+)\s(?P<ig_family>\w+\-?\w+)"),
+    # Initial Initial FamilyName ex. J. C. Doe
+    ("initials", r"(?P<ii_given>\w+\.)\s\w+\.\s(?P<ii_family>\w+)"),
+    # GivenName Initial Initial FamilyName ex. Jane C. D. Doe
+    ("given_initials",
+     r"(?P<gi_given>\w+)\s\w?\.\s\w?\.\s(?P<gi_family>\w+\-?\w+)"),
+    # Initial FamilyName ex. J. Doe
+    ("initial_family", r"(?P<if_given>\w+\.)\s(?P<if_family>\w+)")]
+
+NAME_RE = re.compile("|".join("(?=.*?(?P<{0}>{1}))".format(form, pattern)
+                              for form, pattern in NAME_FORMS), re.DOTALL)
+
+GROUPS = {"initial_given": ("ig_given", "ig_family"),
+          "initials": ("ii_given", "ii_family"),
+          "given_initials": ("gi_given", "gi_family"),
+          "initial_family": ("if_given", "if_family")}
+
+DELIMITERS = [";", ",", " and "]
+
+
+class AuthorName(namedtuple("AuthorName", ["given", "family", "initials"])):
+    """Given and family names of an author with the initials that aren't
+    either of them"""
+    __slots__ = ()
+
+    @property
+    def label(self):
+        """Given and family name as looked up in the people graph"""
+        return (self.given + " " + self.family).strip()
+
+
+def split_authors(author_string):
+    """Splits an author string on the first of semicolons, commas or " and "
+    that it contains"""
+    for delimiter in DELIMITERS:
+        if delimiter in author_string:
+            return author_string.split(delimiter)
+    return author_string.split(" and ")
+
+# Names repeat across a bulk ingest and parsing doesn't depend on the
+# triplestore, so parses are memoized by the name as written
+@functools.lru_cache(maxsize=16384)
+def parse_name(name):
+    """Returns the AuthorName for one author as written in a citation
+
+    Args:
+        name(str): Author name, ex. Jane C. Doe, C. Jane Doe or J. Doe
+    """
+    cleaned = name.strip()
+    if cleaned.endswith("."):
+        cleaned = cleaned[:-1]
+    words = cleaned.split(" ")
+    # Every form has an initial, a name without one is used as written
+    match = NAME_RE.match(cleaned) if "." in cleaned else None
+    if match is None or match.lastgroup == "words":
+        given, family = words[0], words[-1]
+    else:
+        given_group, family_group = GROUPS[match.lastgroup]
+        given, family = match.group(given_group), match.group(family_group)
+    initials = ()
+    if "." in cleaned:
+        initials = tuple([word for word in words if word.endswith(".") and
+                          word != given and word != family])
+    return AuthorName(given, family, initials)
+
+def parse_authors(author_string):
+    """Returns an AuthorName for each author in a cite:authorString"""
+    return [parse_name(name) for name in split_authors(author_string)]
@@ -0,0 +1,466 @@
+"""Caches for Scholarship App, in-process and shared by the workers on a
+host"""
+__author__ = "Jeremy Nelson"
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_LOG = logging.getLogger("scholarship_graph.cache")
+
+# String literals are kept as they are, whitespace between tokens collapses
+QUERY_TOKENS_RE = re.compile(r'("""[\s\S]*?"""|"(?:[^"\\\n]|\\.)*"|'
+                             r"'(?:[^'\\\n]|\\.)*')|\s+")
+
+# A SELECT query after any comments, BASE and PREFIX declarations
+SELECT_RE = re.compile(r"^(?:\s+|#[^\n]*|BASE\s*<[^>]*>|"
+                       r"PREFIX\s+[\w.-]*:\s*<[^>]*>)*SELECT\b",
+                       re.IGNORECASE)
+
+
+class Generation(object):
+    """Monotonic counter for the triplestore, bumped whenever the datastore
+    is reloaded so that anything cached under an older generation is stale"""
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def bump(self):
+        with self.lock:
+            self.value += 1
+            return self.value
+
+DATASTORE_GENERATION = Generation()
+
+
+class LRUCache(object):
+    """Thread-safe least-recently-used cache bounded by number of entries
+    and by the total size of the cached values.
+
+    Args:
+        max_entries(int): Maximum number of cached values
+        max_bytes(int): Maximum total size of cached values, None for no limit
+        ttl(int): Seconds before an entry expires, None for no expiration
+        generation(Generation): Entries cached under an older generation are
+            treated as misses
+        sizeof(function): Returns the size of a value, defaults to the
+            encoded length of strings and sys.getsizeof for anything else
+    """
+
+    def __init__(self, max_entries=512, max_bytes=None, ttl=None,
+                 generation=DATASTORE_GENERATION, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = generation
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits, self.misses = 0, 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __sizeof_value__(self, value):
+        if self.sizeof is not None:
+            return self.sizeof(value)
+        if isinstance(value, str):
+            return len(value.encode())
+        return sys.getsizeof(value)
+
+    def __current_generation__(self):
+        if self.generation is None:
+            return None
+        return self.generation.value
+
+    def __remove__(self, key):
+        generation, expires, size, value = self.entries.pop(key)
+        self.current_bytes -= size
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            generation, expires, size, value = entry
+            if generation != self.__current_generation__() or \
+               (expires is not None and expires < time.time()):
+                self.__remove__(key)
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+        """Caches value under key
+
+        Args:
+            key: Cache key
+            value: Value to cache
+            generation(int): Datastore generation the value was computed
+                at, defaults to the current one
+        """
+        size = self.__sizeof_value__(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        if generation is None:
+            generation = self.__current_generation__()
+        with self.lock:
+            if key in self.entries:
+                self.__remove__(key)
+            self.entries[key] = (generation,
+                                 expires,
+                                 size,
+                                 value)
+            self.current_bytes += size
+            while len(self.entries) > self.max_entries or \
+                  (self.max_bytes is not None and \
+                   self.current_bytes > self.max_bytes):
+                oldest = next(iter(self.entries))
+                self.__remove__(oldest)
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.__remove__(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {"entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "hits": self.hits,
+                "misses": self.misses}
+
+
+def normalize_query(sparql):
+    """Collapses the whitespace of a SPARQL query outside of string
+    literals so queries that only differ in layout share a cache key"""
+    return QUERY_TOKENS_RE.sub(lambda match: match.group(1) or " ",
+                               sparql).strip()
+
+def is_select(sparql):
+    """True for SELECT queries, the only results worth caching"""
+    return isinstance(sparql, str) and SELECT_RE.match(sparql) is not None
+
+def query_key(sparql, *args, **kwargs):
+    """Cache key for a query and the arguments it is sent with"""
+    key = json.dumps([normalize_query(sparql), args, kwargs],
+                     sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class SharedStore(object):
+    """SQLite file of cached values shared by the workers on a host, every
+    value is stored under the shared datastore generation so a reload in
+    any worker invalidates it for all of them
+
+    Args:
+        path(str): SQLite database file
+        max_entries(int): Values kept, the oldest are pruned beyond this
+        ttl(int): Seconds before a value expires, None for no expiration
+        prune_every(int): Number of sets between prunes
+    """
+
+    def __init__(self, path, max_entries=100000, ttl=None, prune_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.sets = 0
+        self.local = threading.local()
+        db = self.__connect__()
+        db.execute("""CREATE TABLE IF NOT EXISTS cached_values (
+            key TEXT PRIMARY KEY,
+            generation INTEGER,
+            expires REAL,
+            stored REAL,
+            body BLOB)""")
+        db.execute("""CREATE TABLE IF NOT EXISTS generation (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            value INTEGER)""")
+        db.execute("INSERT OR IGNORE INTO generation VALUES (0, 0)")
+
+    def __connect__(self):
+        # Connections are per thread and are not used across a fork
+        pid, db = getattr(self.local, "connection", (None, None))
+        if pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = (os.getpid(), db)
+        return db
+
+    def generation(self):
+        return self.__connect__().execute(
+            "SELECT value FROM generation").fetchone()[0]
+
+    def bump(self):
+        db = self.__connect__()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("UPDATE generation SET value = value + 1")
+            generation = db.execute("SELECT value FROM generation").fetchone()[0]
+            db.execute("DELETE FROM cached_values WHERE generation < ?",
+                       (generation,))
+        return generation
+
+    def get(self, key, generation):
+        row = self.__connect__().execute(
+            "SELECT generation, expires, body FROM cached_values WHERE key = ?",
+            (key,)).fetchone()
+        if row is None or row[0] != generation or \
+           (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[2]
+
+    def set(self, key, generation, body):
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        db = self.__connect__()
+        db.execute("INSERT OR REPLACE INTO cached_values VALUES (?, ?, ?, ?, ?)",
+                   (key, generation, expires, time.time(), body))
+        self.sets += 1
+        if self.sets % self.prune_every == 0:
+            self.prune(generation)
+
+    def delete(self, key):
+        self.__connect__().execute("DELETE FROM cached_values WHERE key = ?",
+                                   (key,))
+
+    def prune(self, generation):
+        """Drops values from older generations, expired values and the
+        oldest values past max_entries"""
+        db = self.__connect__()
+        db.execute("DELETE FROM cached_values WHERE generation < ? OR expires < ?",
+                   (generation, time.time()))
+        db.execute("""DELETE FROM cached_values WHERE key IN (
+            SELECT key FROM cached_values ORDER BY stored DESC
+            LIMIT -1 OFFSET ?)""", (self.max_entries,))
+
+    def __len__(self):
+        return self.__connect__().execute(
+            "SELECT COUNT(*) FROM cached_values").fetchone()[0]
+
+
+class QueryCache(object):
+    """Triplestore query results by query_key, held in an in-process
+    LRUCache and, when a SharedStore is set, in a SQLite file shared by
+    every worker. Results cached under an older datastore generation are
+    misses; a reload in this process bumps the shared generation and a
+    shared bump seen by this process bumps its DATASTORE_GENERATION.
+
+    Both tiers hold the serialized bindings and every get returns newly
+    decoded rows, so callers may change the rows they are given.
+
+    Args:
+        local(LRUCache): In-process tier
+        shared(SharedStore): Shared tier, None for in-process only
+        max_value_bytes(int): Larger results are not cached
+        check_seconds(float): How often the shared generation is read
+    """
+
+    def __init__(self, local, shared=None, max_value_bytes=4 * 1024 * 1024,
+                 check_seconds=1.0):
+        self.local = local
+        self.shared = shared
+        self.max_value_bytes = max_value_bytes
+        self.check_seconds = check_seconds
+        self.local_generation = None
+        self.shared_generation = None
+        self.checked = 0
+        self.shared_hits, self.misses = 0, 0
+        self.lock = threading.Lock()
+
+    def __sync_generation__(self):
+        """Returns the shared generation after reconciling it with this
+        process's DATASTORE_GENERATION"""
+        with self.lock:
+            local = DATASTORE_GENERATION.value
+            if self.local_generation is None:
+                self.shared_generation = self.shared.generation()
+                self.local_generation = local
+                self.checked = time.time()
+            elif local != self.local_generation:
+                # The triplestore was reloaded or written by this process
+                self.shared_generation = self.shared.bump()
+                self.local_generation = local
+            elif time.time() - self.checked >= self.check_seconds:
+                self.checked = time.time()
+                shared = self.shared.generation()
+                if shared != self.shared_generation:
+                    self.shared_generation = shared
+                    self.local_generation = DATASTORE_GENERATION.bump()
+            return self.shared_generation
+
+    def sync(self):
+        """Brings this process's DATASTORE_GENERATION up to date with the
+        shared generation, so a reload in another worker also invalidates
+        the other in-process caches. Returns the shared generation, None
+        without a SharedStore or when it can't be read."""
+        if self.shared is None:
+            return None
+        try:
+            return self.__sync_generation__()
+        except sqlite3.Error as error:
+            CACHE_LOG.warning("Shared query cache read failed: %s", error)
+            return None
+
+    def generation(self):
+        """The (local, shared) generations to pass to set for a query about
+        to run, shared is None without a SharedStore"""
+        shared = self.sync()
+        return DATASTORE_GENERATION.value, shared
+
+    def get(self, key):
+        # A reload in another worker invalidates the local tier too
+        generation = self.sync()
+        body = self.local.get(key)
+        if body is not None:
+            return json.loads(body.decode())
+        if generation is not None:
+            try:
+                body = self.shared.get(key, generation)
+            except sqlite3.Error as error:
+                CACHE_LOG.warning("Shared query cache read failed: %s", error)
+                body = None
+            if body is not None:
+                self.local.set(key, body)
+                with self.lock:
+                    self.shared_hits += 1
+                return json.loads(body.decode())
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, rows, generation=None):
+        """Caches the rows of a query
+
+        Args:
+            key(str): query_key of the query
+            rows(list): SPARQL JSON result rows
+            generation(tuple): generation() read before the query ran,
+                rows from a query that a reload or write overlapped are
+                not cached
+        """
+        if generation is None:
+            generation = self.generation()
+        local, shared = generation
+        if local != DATASTORE_GENERATION.value:
+            return
+        body = json.dumps(rows).encode()
+        if len(body) > self.max_value_bytes:
+            return
+        self.local.set(key, body, local)
+        if self.shared is None or shared is None:
+            return
+        try:
+            self.shared.set(key, shared, body)
+        except sqlite3.Error as error:
+            CACHE_LOG.warning("Shared query cache write failed: %s", error)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        local = self.local.stats()
+        return {"entries": local["entries"],
+                "bytes": local["bytes"],
+                "hits": local["hits"] + self.shared_hits,
+                "local_hits": local["hits"],
+                "shared_hits": self.shared_hits,
+                "misses": self.misses}
+
+
+class UserStore(object):
+    """Logged-in users by id, held in an in-process LRUCache and, when a
+    SharedStore is set, saved in a SQLite file shared by every worker so a
+    login in one worker is known to the others. Users expire with the
+    caches' ttl and the least recently used are evicted past max_entries.
+
+    Args:
+        user_class: Users are its instances, with an as_dict method and a
+            from_dict class method for the shared tier
+        local(LRUCache): In-process tier, not tied to a datastore generation
+        shared(SharedStore): Shared tier, None for in-process only
+    """
+
+    def __init__(self, user_class, local, shared=None):
+        self.user_class = user_class
+        self.local = local
+        self.shared = shared
+        self.shared_hits, self.misses = 0, 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.local)
+
+    def get(self, user_id):
+        user = self.local.get(user_id)
+        if user is not None:
+            return user
+        body = None
+        if self.shared is not None:
+            try:
+                # Users don't depend on the triplestore, their file is
+                # never bumped past the first generation
+                body = self.shared.get(user_id, 0)
+            except sqlite3.Error as error:
+                CACHE_LOG.warning("Shared user store read failed: %s", error)
+        if body is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        user = self.user_class.from_dict(json.loads(body.decode()))
+        self.local.set(user_id, user)
+        with self.lock:
+            self.shared_hits += 1
+        return user
+
+    def set(self, user_id, user):
+        self.local.set(user_id, user)
+        if self.shared is None:
+            return
+        try:
+            self.shared.set(user_id, 0, json.dumps(user.as_dict()).encode())
+        except sqlite3.Error as error:
+            CACHE_LOG.warning("Shared user store write failed: %s", error)
+
+    def delete(self, user_id):
+        self.local.delete(user_id)
+        if self.shared is None:
+            return
+        try:
+            self.shared.delete(user_id)
+        except sqlite3.Error as error:
+            CACHE_LOG.warning("Shared user store write failed: %s", error)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        local = self.local.stats()
+        return {"entries": local["entries"],
+                "bytes": local["bytes"],
+                "hits": local["hits"] + self.shared_hits,
+                "local_hits": local["hits"],
+                "shared_hits": self.shared_hits,
+                "misses": self.misses}
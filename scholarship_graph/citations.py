@@ -0,0 +1,116 @@
+"""Citation formatting for Scholarship App templates"""
+__author__ = "Jeremy Nelson"
+
+from html import escape
+
+EMPTY = {"value": ""}
+
+def __value__(row, key):
+    return str(row.get(key, EMPTY).get("value", ""))
+
+def __title_link__(uri, title):
+    if uri.startswith("http"):
+        return "<a href='" + uri + "', target='_blank'>" + title + "</a>"
+    return title
+
+def article_link(citation):
+    url = __value__(citation, "url")
+    name = __value__(citation, "name")
+    if url.startswith("http"):
+        return "<a href='" + url + "' target='_blank'>" + name + "</a>"
+    return name
+
+def volume_issue(citation):
+    volume_number = __value__(citation, "volume_number")
+    issue_number = __value__(citation, "issue_number")
+    if volume_number != "":
+        if issue_number != "":
+            return "v." + volume_number + " no." + issue_number
+        return "v." + volume_number
+    if issue_number != "":
+        return "no." + issue_number
+    return ""
+
+def page_number(citation):
+    page_start = __value__(citation, "page_start")
+    page_end = __value__(citation, "page_end")
+    page_string = ""
+    if page_start != "":
+        page_string = "p." + page_start
+    if page_end != "":
+        page_string = page_string + "-" + page_end
+    if page_string != "":
+        page_string = page_string + "."
+    return page_string
+
+def book_title(book_citation):
+    return __title_link__(__value__(book_citation, "book"),
+                          __value__(book_citation, "title"))
+
+def creative_work_title(creative_work_citation):
+    return __title_link__(__value__(creative_work_citation, "creative_work"),
+                          __value__(creative_work_citation, "title"))
+
+def book_edition(book_citation):
+    edition = __value__(book_citation, "editionStatement")
+    if edition != "":
+        return edition + " ed. "
+    return ""
+
+
+def citation_html(citation):
+    """Renders the "In Review" row for a citation that has just been added or
+    edited, with the same markup generate_citation_html built with 
+    BeautifulSoup
+
+    Args:
+        citation(dict): Raw citation from __populate_citation__
+    """
+    citation_type = citation.get("ENTRYTYPE") or ""
+    html = ['<div class="row">', '<div class="col-1">']
+    if citation_type.startswith("article"):
+        html.append('<i class="fas fa-file-alt"></i>')
+    elif citation_type.endswith("book"):
+        html.append('<i class="fas fa-book"></i>')
+    html.append('<em>In Review</em></div><div class="col-7">')
+    name = citation.get("article_title", citation.get("title", ""))
+    if "url" in citation:
+        html.append('<a href="{}">{}</a>'.format(
+            escape(str(citation.get("url"))), escape(str(name))))
+    else:
+        html.append('<span>{}</span>'.format(escape(str(name))))
+    if "journal_title" in citation:
+        html.append('<em>{}</em>'.format(
+            escape(str(citation.get("journal_title")))))
+    if "year" in citation:
+        html.append('<span>({})</span>'.format(
+            escape(str(citation.get("year")))))
+    for key, template in [("volume_number", "v. {}"),
+                          ("issue_number", " no. {}"),
+                          ("page_start", "p. {}")]:
+        value = citation.get(key)
+        if value and len(value) > 0:
+            html.append('<span>{}</span>'.format(
+                escape(template.format(value))))
+    page_end = citation.get("page_end")
+    if page_end and len(page_end) > 0:
+        if "page_start" in citation:
+            page_string = "- {}."
+        else:
+            page_string = "{}."
+        html.append('<span>{}</span>'.format(
+            escape(page_string.format(page_end))))
+    html.append('</div><div class="col-4">')
+    iri = citation.get("iri")
+    edit_click, delete_click = "", ""
+    if iri:
+        edit_click = escape("editCitation('{}');".format(iri))
+        delete_click = escape("deleteCitation('{}');".format(iri))
+    html.append('<a class="btn btn-warning disabled" onclick="{}" '
+                'type="input"><i class="fas fa-edit"></i></a>'.format(
+                    edit_click))
+    html.append('<a class="btn btn-danger" onclick="{}" '
+                'type="input"><i class="fas fa-trash-alt"></i></a>'.format(
+                    delete_click))
+    html.append('</div></div>')
+    return "".join(html)
@@ -0,0 +1,237 @@
+"""LDAP directory access for Scholarship App, connections are pooled per
+process and user attributes are cached briefly after a login"""
+__author__ = "Jeremy Nelson"
+
+import logging
+import os
+import threading
+import time
+
+import ldap3
+from flask import current_app, g
+from flask_ldap3_login import LDAP3LoginManager, AuthenticationResponseStatus
+from ldap3.core.exceptions import LDAPException
+
+from .cache import LRUCache
+
+DIRECTORY_LOG = logging.getLogger("scholarship_graph.directory")
+
+
+class PooledConnection(ldap3.Connection):
+    """ldap3 connection kept open between binds. A pooled connection is
+    given the credentials of each caller; the service account's bind is
+    reused while it holds, users always bind so their password is checked"""
+    pool = None
+    keep_bind = False
+    bound_with = None
+
+    def credentials(self, user, password, authentication, keep_bind=False):
+        self.user = user
+        self.password = password
+        self.authentication = authentication
+        self.keep_bind = keep_bind
+
+    def bind(self, read_server_info=True, controls=None):
+        credentials = (self.user, self.password, self.authentication)
+        if self.keep_bind and self.bound and not self.closed and \
+           self.bound_with == credentials:
+            return True
+        self.bound_with = None
+        result = super(PooledConnection, self).bind(read_server_info, controls)
+        if result:
+            self.bound_with = credentials
+        return result
+
+
+class ConnectionPool(object):
+    """Open directory connections reused by a process, at most size of them
+    open at once. Idle connections are closed after max_idle seconds and a
+    forked worker starts with an empty pool.
+
+    Args:
+        factory(function): Opens a new PooledConnection
+        size(int): Maximum open connections
+        timeout(float): Seconds to wait for a connection when all are in use
+        max_idle(float): Seconds an idle connection is kept
+    """
+
+    def __init__(self, factory, size=10, timeout=10.0, max_idle=300.0):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle = []
+        self.open = 0
+        self.opened = 0
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+
+    def __check_pid__(self):
+        # Sockets inherited from the parent belong to it
+        if self.pid != os.getpid():
+            self.idle, self.open, self.pid = [], 0, os.getpid()
+
+    def __close__(self, connection):
+        try:
+            connection.unbind()
+        except LDAPException as error:
+            DIRECTORY_LOG.debug("Closing LDAP connection failed: %s", error)
+
+    def acquire(self):
+        deadline = time.time() + self.timeout
+        with self.condition:
+            self.__check_pid__()
+            while True:
+                while len(self.idle) > 0:
+                    released, connection = self.idle.pop()
+                    if connection.closed or \
+                       time.time() - released > self.max_idle:
+                        self.open -= 1
+                        self.__close__(connection)
+                        continue
+                    return connection
+                if self.open < self.size:
+                    self.open += 1
+                    self.opened += 1
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.condition.wait(remaining):
+                    raise LDAPException(
+                        "No LDAP connection free after {} seconds".format(
+                            self.timeout))
+        try:
+            return self.factory()
+        except Exception:
+            with self.condition:
+                self.open -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, connection):
+        with self.condition:
+            if self.pid != os.getpid():
+                return
+            if connection.closed:
+                self.open -= 1
+            else:
+                self.idle.append((time.time(), connection))
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {"idle": len(self.idle),
+                    "in_use": self.open - len(self.idle),
+                    "opened": self.opened}
+
+
+class PooledLDAP3LoginManager(LDAP3LoginManager):
+    """LDAP3LoginManager that takes its connections from ConnectionPools
+    instead of opening one per search or bind, and caches the attributes of
+    users who authenticated so user_loader doesn't ask the directory again.
+
+    Service account searches and user binds have separate pools: a search
+    bind holds a service connection while it binds as the user, so sharing
+    one pool would let concurrent logins wait on each other forever.
+
+    LDAP_POOL_SIZE sets the size of each pool, 0 opens a connection for
+    each use as flask_ldap3_login does; LDAP_POOL_TIMEOUT and LDAP_POOL_IDLE the seconds
+    to wait for a free connection and to keep an idle one;
+    LDAP_USER_INFO_TTL the seconds user attributes are cached. With
+    LDAP_MOCK_DATA, a JSON export of entries, connections use ldap3's
+    MOCK_SYNC strategy as a local stand-in for the directory."""
+
+    def __init__(self, app=None):
+        self.pools = dict()
+        self.user_info = LRUCache(max_entries=2048, ttl=300, generation=None)
+        super(PooledLDAP3LoginManager, self).__init__(app)
+
+    def init_app(self, app):
+        super(PooledLDAP3LoginManager, self).init_app(app)
+        self.user_info.ttl = app.config.get("LDAP_USER_INFO_TTL",
+            self.user_info.ttl)
+        self.pools = dict()
+        if app.config.get("LDAP_POOL_SIZE", 10) > 0:
+            for name in ["service", "bind"]:
+                self.pools[name] = ConnectionPool(lambda: self.__open__(app),
+                    size=app.config.get("LDAP_POOL_SIZE", 10),
+                    timeout=app.config.get("LDAP_POOL_TIMEOUT", 10.0),
+                    max_idle=app.config.get("LDAP_POOL_IDLE", 300.0))
+
+    def __open__(self, app):
+        mock_data = app.config.get("LDAP_MOCK_DATA")
+        if mock_data is None:
+            strategy = ldap3.SYNC
+            server = app.ldap3_login_manager_server_pool
+        else:
+            # MOCK_SYNC doesn't work with a ServerPool
+            strategy = ldap3.MOCK_SYNC
+            server = ldap3.Server("fake_server")
+        connection = PooledConnection(server=server,
+            read_only=app.config.get("LDAP_READONLY"),
+            client_strategy=strategy,
+            check_names=app.config.get("LDAP_CHECK_NAMES", True),
+            raise_exceptions=True)
+        if mock_data is not None:
+            if not os.path.isfile(mock_data):
+                mock_data = os.path.join(app.instance_path, mock_data)
+            connection.strategy.entries_from_json(mock_data)
+        return connection
+
+    def _make_connection(self, bind_user=None, bind_password=None,
+                         contextualise=True, **kwargs):
+        app = kwargs.pop("app", None) or current_app
+        if len(self.pools) < 1 or len(kwargs) > 0:
+            if app is not current_app:
+                kwargs["app"] = app
+            return super(PooledLDAP3LoginManager, self)._make_connection(
+                bind_user, bind_password, contextualise, **kwargs)
+        authentication = ldap3.ANONYMOUS
+        if bind_user:
+            authentication = getattr(ldap3,
+                app.config.get("LDAP_BIND_AUTHENTICATION_TYPE"))
+        service = bind_user == app.config.get("LDAP_BIND_USER_DN")
+        pool = self.pools["service" if service else "bind"]
+        connection = pool.acquire()
+        connection.pool = pool
+        connection.credentials(bind_user, bind_password, authentication,
+            keep_bind=service)
+        if contextualise:
+            self._contextualise_connection(connection)
+        return connection
+
+    def destroy_connection(self, connection):
+        if not isinstance(connection, PooledConnection):
+            return super(PooledLDAP3LoginManager, self).destroy_connection(
+                connection)
+        self._decontextualise_connection(connection)
+        connection.pool.release(connection)
+
+    def teardown(self, exception):
+        connection = getattr(g, "flask_ldap3_login_manager_main_connection",
+                             None)
+        if isinstance(connection, PooledConnection):
+            g.flask_ldap3_login_manager_main_connection = None
+            connection.pool.release(connection)
+        super(PooledLDAP3LoginManager, self).teardown(exception)
+
+    def authenticate(self, username, password):
+        response = super(PooledLDAP3LoginManager, self).authenticate(
+            username, password)
+        if response.status == AuthenticationResponseStatus.success and \
+           response.user_dn and response.user_info is not None:
+            self.user_info.set(response.user_dn, response.user_info)
+        return response
+
+    def get_user_info(self, dn, _connection=None):
+        data = self.user_info.get(dn)
+        if data is not None:
+            return data
+        data = super(PooledLDAP3LoginManager, self).get_user_info(dn,
+            _connection)
+        if data is not None:
+            self.user_info.set(dn, data)
+        return data
+
+    def stats(self):
+        """Idle, in use and total opened connections of each pool"""
+        return dict((name, pool.stats()) for name, pool in self.pools.items())
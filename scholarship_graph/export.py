@@ -0,0 +1,135 @@
+"""Bulk export of creative works, authors and subjects for Scholarship App"""
+__author__ = "Jeremy Nelson"
+
+import json
+import zlib
+
+from .indexes import parse_datetime
+from .sparql import EXPORT_AFTER, EXPORT_SINCE, EXPORT_TRIPLES
+
+# Classes of the entities exported, the triplestore types volumes and issues
+# with the property IRIs schema:volumeNumber and schema:issueNumber
+EXPORT_TYPES = ["bf:Book",
+                "bf:Person",
+                "bf:Topic",
+                "schema:Chapter",
+                "schema:CreativeWork",
+                "schema:issueNumber",
+                "schema:Periodical",
+                "schema:ScholarlyArticle",
+                "schema:volumeNumber"]
+
+FORMATS = {"ntriples": "application/n-triples",
+           "jsonl": "application/x-ndjson"}
+
+NT_ESCAPES = str.maketrans({"\\": "\\\\",
+                            '"': '\\"',
+                            "\n": "\\n",
+                            "\r": "\\r"})
+
+def export_sparql(since=None, after=None, limit=None):
+    """Returns the SELECT for the triples of the exported entities ordered
+    by subject, optionally only for entities generated or revised after
+    since, and for a page of limit entities whose IRIs sort after after
+
+    Args:
+        since(str): ISO dateTime, raises ValueError if it can't be parsed
+        after(str): IRI of the last entity of the previous page
+        limit(int): Number of entities
+    """
+    filters = ""
+    if since is not None:
+        filters += EXPORT_SINCE.format(parse_datetime(since).isoformat())
+    if after is not None:
+        filters += EXPORT_AFTER.format(after.translate(NT_ESCAPES))
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT {}".format(int(limit))
+    return EXPORT_TRIPLES.format(" ".join(EXPORT_TYPES), filters,
+                                 limit_clause)
+
+def export_rows(query, since=None, page_size=1000):
+    """Returns a generator of the exported rows, queried page_size entities
+    at a time with each page starting after the last entity of the one
+    before, so no page rescans the pages ahead of it and an entity's
+    triples are never split across pages
+
+    Args:
+        query(function): Runs a SELECT and returns its rows
+        since(str): ISO dateTime, raises ValueError here if it can't be
+            parsed
+        page_size(int): Entities per query
+    """
+    if since is not None:
+        since = parse_datetime(since).isoformat()
+    return __export_pages__(query, since, page_size)
+
+def __export_pages__(query, since, page_size):
+    after = None
+    while True:
+        entities = 0
+        for row in query(export_sparql(since, after, page_size)):
+            subject = row.get("s").get("value")
+            if subject != after:
+                entities += 1
+                after = subject
+            yield row
+        if entities < page_size:
+            break
+
+def nt_term(binding):
+    """Serializes a SPARQL JSON binding as an N-Triples term, returns None
+    for blank nodes since their labels are not stable across pages"""
+    term_type = binding.get("type")
+    value = binding.get("value")
+    if term_type == "uri":
+        return "<{}>".format(value)
+    if term_type in ("literal", "typed-literal"):
+        literal = '"{}"'.format(value.translate(NT_ESCAPES))
+        if "xml:lang" in binding:
+            return "{}@{}".format(literal, binding["xml:lang"])
+        if "datatype" in binding:
+            return "{}^^<{}>".format(literal, binding["datatype"])
+        return literal
+    return None
+
+def ntriples(rows):
+    """Generates one N-Triples line per row of s, p, o bindings"""
+    for row in rows:
+        terms = [nt_term(row.get(key)) for key in ("s", "p", "o")]
+        if None in terms:
+            continue
+        yield "{} {} {} .\n".format(*terms)
+
+def json_lines(rows):
+    """Generates one JSON object per entity, rows must be ordered by subject.
+    Each object has the entity's @id and a list of values per property"""
+    entity = None
+    for row in rows:
+        if row.get("o").get("type") == "bnode":
+            continue
+        subject = row.get("s").get("value")
+        if entity is None or entity["@id"] != subject:
+            if entity is not None:
+                yield json.dumps(entity) + "\n"
+            entity = {"@id": subject}
+        entity.setdefault(row.get("p").get("value"), []).append(
+            row.get("o").get("value"))
+    if entity is not None:
+        yield json.dumps(entity) + "\n"
+
+def serialize(rows, export_format):
+    """Generates the export lines for rows in ntriples or jsonl format"""
+    if export_format == "jsonl":
+        return json_lines(rows)
+    return ntriples(rows)
+
+def gzip_stream(chunks, level=6):
+    """Compresses a stream of str chunks into gzip bytes without buffering
+    the whole stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if len(data) > 0:
+            yield data
+    yield compressor.flush()
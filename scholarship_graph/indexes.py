@@ -0,0 +1,212 @@
+"""In-process indexes built from the triplestore for Scholarship App"""
+__author__ = "Jeremy Nelson"
+
+import bisect
+import datetime
+import re
+import threading
+
+from .cache import DATASTORE_GENERATION
+from .sparql import ACADEMIC_YEARS, CHANGES, PERSON_EMAILS
+
+TIMEZONE_RE = re.compile(r"(Z|[+-]\d{2}:?\d{2})$")
+
+def parse_datetime(value):
+    """Parses a xsd:dateTime or xsd:date string into a naive datetime,
+    dropping any timezone designator
+
+    Args:
+        value(str|datetime): Date string in ISO format
+    """
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None)
+    value = TIMEZONE_RE.sub("", str(value).strip())
+    for date_format in ["%Y-%m-%dT%H:%M:%S.%f",
+                        "%Y-%m-%dT%H:%M:%S",
+                        "%Y-%m-%dT%H:%M",
+                        "%Y-%m-%d"]:
+        try:
+            return datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError("Cannot parse {} as a dateTime".format(value))
+
+
+class GenerationIndex(object):
+    """Index loaded from the rows of a SPARQL query and rebuilt when the 
+    datastore generation changes, subclasses set sparql and load"""
+    sparql = None
+
+    def __init__(self):
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def load(self, rows):
+        raise NotImplementedError
+
+    def refresh(self, connection):
+        """Rebuilds the index from the triplestore if it is missing or was
+        built from an older datastore generation
+
+        Args:
+            connection: rdfframework connections with a datastore
+        """
+        if self.generation == DATASTORE_GENERATION.value:
+            return
+        with self.lock:
+            generation = DATASTORE_GENERATION.value
+            if self.generation == generation:
+                return
+            self.load(connection.datastore.query(self.sparql))
+            self.generation = generation
+
+
+class AcademicYearIndex(GenerationIndex):
+    """Sorted interval index of academic-year events, resolves the academic
+    year IRIs containing a date with a binary search instead of having the
+    triplestore compare every event's start and end dates.
+
+    The index is rebuilt when the datastore generation changes."""
+    sparql = ACADEMIC_YEARS
+
+    def __init__(self):
+        super(AcademicYearIndex, self).__init__()
+        self.starts = []
+        self.ends = []
+        self.max_ends = []
+        self.iris = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def load(self, rows):
+        """Builds the index from ACADEMIC_YEARS result rows
+
+        Args:
+            rows(list): SPARQL JSON rows with academic_year, start and end
+        """
+        intervals = dict()
+        for row in rows:
+            interval = (parse_datetime(row.get("start").get("value")),
+                        parse_datetime(row.get("end").get("value")))
+            intervals.setdefault(interval, []).append(
+                row.get("academic_year").get("value"))
+        starts, ends, max_ends, iris = [], [], [], []
+        for start, end in sorted(intervals):
+            starts.append(start)
+            ends.append(end)
+            if len(max_ends) > 0 and max_ends[-1] > end:
+                max_ends.append(max_ends[-1])
+            else:
+                max_ends.append(end)
+            iris.append(tuple(sorted(intervals[(start, end)])))
+        self.starts, self.ends = starts, ends
+        self.max_ends, self.iris = max_ends, iris
+
+    def years_for(self, date):
+        """Returns the academic year IRIs where start < date <= end
+
+        Args:
+            date(str|datetime): Date to look up
+        """
+        date = parse_datetime(date)
+        output = []
+        position = bisect.bisect_left(self.starts, date) - 1
+        # max_ends lets the scan stop at the first interval that cannot
+        # reach date, for non-overlapping years this is a single step
+        while position >= 0 and self.max_ends[position] >= date:
+            if self.ends[position] >= date:
+                output.extend(self.iris[position])
+            position -= 1
+        return output
+
+    def values(self, date):
+        """Returns the academic year IRIs containing date formatted for a
+        SPARQL VALUES block"""
+        return " ".join(["<{}>".format(iri) for iri in self.years_for(date)])
+
+
+class ChangeIndex(GenerationIndex):
+    """Every prov generation and revision time in the triplestore sorted by
+    time then entity, finds the changes after a point with a binary search.
+
+    The index is rebuilt when the datastore generation changes."""
+    sparql = CHANGES
+
+    def __init__(self):
+        super(ChangeIndex, self).__init__()
+        self.keys = []
+        self.kinds = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def load(self, rows):
+        """Builds the index from CHANGES result rows
+
+        Args:
+            rows(list): SPARQL JSON rows with entity, kind and changed
+        """
+        changes = set()
+        for row in rows:
+            changes.add((parse_datetime(row.get("changed").get("value")),
+                         row.get("entity").get("value"),
+                         row.get("kind").get("value")))
+        changes = sorted(changes)
+        self.keys = [(changed, entity) for changed, entity, kind in changes]
+        self.kinds = [kind for changed, entity, kind in changes]
+
+    def changes_after(self, since=None, after=None, limit=100):
+        """Returns up to limit (changed, entity, kind) tuples ordered by time
+        that are later than since, or later than the (since, after) cursor
+        for a change at the same time
+
+        Args:
+            since(str|datetime): Date to start after, None for all changes
+            after(str): Entity IRI of the last change already returned,
+                raises ValueError without since
+            limit(int): Maximum number of changes
+        """
+        if after is not None and since is None:
+            raise ValueError("An after cursor needs the since it was given with")
+        position = 0
+        if since is not None:
+            # Without an entity cursor skip every change at since, the 
+            # largest code point sorts after any IRI
+            position = bisect.bisect_right(self.keys,
+                (parse_datetime(since), after or chr(0x10FFFF)))
+        return [self.keys[i] + (self.kinds[i],)
+                for i in range(position, min(position + limit, len(self.keys)))]
+
+
+class EmailIndex(GenerationIndex):
+    """Person IRIs by lower-cased email, so looking up a user's profile is
+    a dictionary lookup instead of a query over every email.
+
+    The index is rebuilt when the datastore generation changes."""
+    sparql = PERSON_EMAILS
+
+    def __init__(self):
+        super(EmailIndex, self).__init__()
+        self.people = dict()
+
+    def __len__(self):
+        return len(self.people)
+
+    def load(self, rows):
+        """Builds the index from PERSON_EMAILS result rows, the first person
+        in IRI order wins for an email shared by several
+
+        Args:
+            rows(list): SPARQL JSON rows with person and email
+        """
+        people = dict()
+        for row in sorted(rows, key=lambda x: x.get("person").get("value")):
+            email = row.get("email").get("value").strip().lower()
+            people.setdefault(email, row.get("person").get("value"))
+        self.people = people
+
+    def person(self, email):
+        """Returns the IRI of the person with an email, matched ignoring
+        case, None if there isn't one"""
+        return self.people.get(email.strip().lower())
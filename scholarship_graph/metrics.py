@@ -0,0 +1,187 @@
+"""In-process metrics in the Prometheus text exposition format for
+Scholarship App"""
+__author__ = "Jeremy Nelson"
+
+import bisect
+import threading
+import time
+
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+def __escape__(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\n", "\\n")
+
+def __labels__(names, values, extra=None):
+    pairs = ['{}="{}"'.format(name, __escape__(value))
+             for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(*extra))
+    if len(pairs) < 1:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+def __number__(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(object):
+    """Base for a metric family with a fixed set of label names"""
+    metric_type = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+
+    def __key__(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def header(self):
+        return ["# HELP {} {}".format(self.name, self.help_text),
+                "# TYPE {} {}".format(self.name, self.metric_type)]
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super(Counter, self).__init__(name, help_text, labels)
+        self.values = dict()
+
+    def inc(self, amount=1, **labels):
+        key = self.__key__(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def expose(self):
+        lines = self.header()
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            lines.append("{}{} {}".format(
+                self.name, __labels__(self.labels, key), __number__(value)))
+        return lines
+
+
+class Histogram(Metric):
+    """Cumulative bucket histogram, percentiles are computed from the
+    buckets by the scraper"""
+    metric_type = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = dict()
+
+    def observe(self, value, **labels):
+        key = self.__key__(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+            if position < len(self.buckets):
+                series[0][position] += 1
+            series[1] += 1
+            series[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the seconds spent in a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def expose(self):
+        lines = self.header()
+        with self.lock:
+            values = sorted((key, (list(series[0]), series[1], series[2]))
+                            for key, series in self.values.items())
+        for key, (counts, count, total) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append("{}_bucket{} {}".format(
+                    self.name,
+                    __labels__(self.labels, key, ("le", __number__(bound))),
+                    cumulative))
+            lines.append("{}_bucket{} {}".format(
+                self.name,
+                __labels__(self.labels, key, ("le", "+Inf")),
+                count))
+            lines.append("{}_sum{} {}".format(
+                self.name, __labels__(self.labels, key), __number__(total)))
+            lines.append("{}_count{} {}".format(
+                self.name, __labels__(self.labels, key), count))
+        return lines
+
+
+class CallbackMetric(Metric):
+    """Gauge or counter read from existing state when scraped, callback
+    returns a list of (label values, value) pairs"""
+
+    def __init__(self, name, help_text, labels=(), callback=None,
+                 metric_type="gauge"):
+        super(CallbackMetric, self).__init__(name, help_text, labels)
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def expose(self):
+        lines = self.header()
+        for key, value in self.callback():
+            lines.append("{}{} {}".format(
+                self.name, __labels__(self.labels, key), __number__(value)))
+        return lines
+
+
+class Registry(object):
+    """Metric families by name, getting a registered name returns the
+    existing metric"""
+
+    def __init__(self):
+        self.metrics = dict()
+        self.lock = threading.Lock()
+
+    def __register__(self, metric_class, name, *args, **kwargs):
+        with self.lock:
+            if not name in self.metrics:
+                self.metrics[name] = metric_class(name, *args, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help_text, labels=()):
+        return self.__register__(Counter, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.__register__(Histogram, name, help_text, labels, buckets)
+
+    def callback(self, name, help_text, labels=(), callback=None,
+                 metric_type="gauge"):
+        return self.__register__(CallbackMetric, name, help_text, labels,
+                                 callback, metric_type)
+
+    def expose(self):
+        """Returns every metric in the text exposition format"""
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].expose())
+        return "\n".join(lines) + "\n"
+
+METRICS = Registry()
+
+GITHUB_CALLS = METRICS.counter("github_requests_total",
+    "GitHub API calls made by profile updates",
+    labels=("operation",))
+SMTP_SECONDS = METRICS.histogram("smtp_send_seconds",
+    "Time to send an email through SMTP",
+    labels=("message",))
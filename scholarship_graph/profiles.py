@@ -2,7 +2,6 @@
 __author__ = "Jeremy Nelson"
 
 import base64
-import bibcat
 import datetime
 import hashlib
 import io
@@ -19,13 +18,13 @@ import mimetypes
 
 import click
 import rdflib
-import requests
-from bs4 import BeautifulSoup
 from flask import current_app
-from github import Github, GithubException
 
-import utilities
-from .sparql import EMAIL_LOOKUP, SUBJECTS_IRI, RESEARCH_STMT_IRI
+from .cache import DATASTORE_GENERATION
+from .citations import citation_html
+from .indexes import EmailIndex
+from .metrics import GITHUB_CALLS, SMTP_SECONDS
+from .sparql import SUBJECTS_IRI, RESEARCH_STMT_IRI
 from .sparql import add_qualified_generation, add_qualified_revision 
 
 BF = rdflib.Namespace("http://id.loc.gov/ontologies/bibframe/")
@@ -33,13 +32,18 @@ CITE = rdflib.Namespace("https://www.coloradocollege.edu/library/ns/citation/")
 PROV = rdflib.Namespace("http://www.w3.org/ns/prov#")
 SCHEMA = rdflib.Namespace("http://schema.org/")
 
+# Person IRIs by email for resolving logged in users, rebuilt after reloads
+EMAIL_INDEX = EmailIndex()
+
 class GitProfile(object):
 
     def __init__(self, config):
+        from github import Github
         self.graph_hashes = {}
         cc_github = Github(config.get("GITHUB_USER"),
                            config.get("GITHUB_PWD"))
         self.triplestore_url = config.get("TRIPLESTORE_URL")
+        GITHUB_CALLS.inc(operation="get_organization")
         self.tutt_github = cc_github.get_organization("Tutt-Library")
         # Start retrieving and parsing latest RDF for current academic year
         # and CC people
@@ -54,7 +58,9 @@ class GitProfile(object):
                 start_year, end_year)
         self.current_year = rdflib.Graph()
         self.cc_people = rdflib.Graph()
+        GITHUB_CALLS.inc(operation="get_repo")
         self.tiger_repo = self.tutt_github.get_repo("tiger-catalog")
+        GITHUB_CALLS.inc(operation="get_dir_contents")
         for content in self.tiger_repo.get_dir_contents("/KnowledgeGraph/"):
             raw_turtle = self.__get_content__("tiger_repo",
                                               content)
@@ -76,7 +82,9 @@ class GitProfile(object):
         self.creative_works = rdflib.Graph()
         self.research_statements = rdflib.Graph()
         self.fast_subjects = rdflib.Graph()
+        GITHUB_CALLS.inc(operation="get_repo")
         self.scholarship_repo = self.tutt_github.get_repo("cc-scholarship-graph")
+        GITHUB_CALLS.inc(operation="get_dir_contents")
         for content in self.scholarship_repo.get_dir_contents("/data/"):
             raw_turtle = self.__get_content__("scholarship_repo",
                                               content)
@@ -103,11 +111,13 @@ class GitProfile(object):
             self.fast_subjects.serialize(format='n3')).hexdigest()
 
     def __get_content__(self, repo_name, content):
+        from github import GithubException
         raw_turtle = None
         try:
             raw_turtle = content.decoded_content
         except GithubException:
             repo = getattr(self, repo_name)
+            GITHUB_CALLS.inc(operation="get_git_blob")
             blob = repo.get_git_blob(content.sha)
             raw_turtle = base64.b64decode(blob.content)
         return raw_turtle
@@ -123,6 +133,7 @@ class GitProfile(object):
         if graph_sha1 == self.graph_hashes[graph_name]:
             return
         git_graph = getattr(self, "{}_git".format(graph_name))
+        GITHUB_CALLS.inc(operation="update_file")
         if branch:
             git_repo.update_file(file_path,
                 message,
@@ -178,25 +189,31 @@ class GitProfile(object):
             result = subprocess.run(['git', 'pull', 'origin', 'master'])
             click.echo(result.returncode, result.stdout)
         config_mgr.conns.datastore.mgr.reset()
+        DATASTORE_GENERATION.bump()
 
 class ProfileUpdateThread(threading.Thread):
 
     def __init__(self, **kwargs):
+        from github import Github, GithubException
         threading.Thread.__init__(self)
         config = kwargs.get("config")
         cc_github = Github(config.get("GITHUB_USER"),
                            config.get("GITHUB_PWD"))
+        GITHUB_CALLS.inc(operation="get_organization")
         self.tutt_github = cc_github.get_organization("Tutt-Library")
         self.statement_msg = kwargs.get("msg")
         self.person_iri = kwargs.get("person")
         self.research_statements = rdflib.Graph()
         self.fast_subjects = rdflib.Graph()
         self.profile = kwargs.get("profile")
+        GITHUB_CALLS.inc(operation="get_repo")
         self.scholarship_repo = self.tutt_github.get_repo("cc-scholarship-graph")
+        GITHUB_CALLS.inc(operation="get_dir_contents")
         for content in self.scholarship_repo.get_dir_contents("/data/"):
             try:
                 raw_turtle = content.decoded_content
             except GithubException:
+                GITHUB_CALLS.inc(operation="get_git_blob")
                 blob = self.scholarship_repo.get_git_blob(content.sha)
                 raw_turtle = base64.b64decode(blob.content)
             if content.name.startswith("cc-research-statements"):
@@ -218,6 +235,7 @@ class ProfileUpdateThread(threading.Thread):
         graph = getattr(self, graph_name)
         message = kwargs.get("message", "Updating {}".format(graph_name))
         git_graph = getattr(self, "{}_git".format(graph_name))
+        GITHUB_CALLS.inc(operation="update_file")
         if branch:
             self.scholarship_repo.update_file(file_path,
                 message,
@@ -317,37 +335,43 @@ class EmailProfile(object):
         self.email = config.get("EMAIL")
         self.recipients = config.get("ADMINS")
         self.person_iri = person_iri
+        # Called before sending, returns False when the email was already
+        # sent by an earlier attempt at the same submission
+        self.before_send = None
 
 
     def __send_email__(self, subject, body):
         """Sends email to administrators with attached profile graph"""
+        if self.before_send is not None and not self.before_send():
+            return
         message = MIMEMultipart()
         message["From"] = self.email.get("user")
         message["To"] = ",".join(["<{0}>".format(r) for r in self.recipients])
         message["Subject"] = subject
-        email_server = smtplib.SMTP(
-            self.email.get("host"),
-            self.email.get("port"))
-        email_server.ehlo()
-        if self.email.get("tls"):
-            email_server.starttls()
-        body = MIMEText(body, _charset="UTF-8")
-        message.attach(body)
-        graph_turtle = io.StringIO(
-            self.graph.serialize(format='turtle').decode())
-        attachment = MIMEText(graph_turtle.read())
-        attachment.add_header('Content-Disposition', 
-            'attachment',
-            filename='profile.ttl')
-        message.attach(attachment)
-        email_server.login(
-            self.email.get("user"),
-            self.email.get("password"))
-        recipients = list(set(self.recipients)) # Quick dedup
-        email_server.sendmail(self.email.get("user"), 
-            recipients, 
-            message.as_string())
-        email_server.close()
+        with SMTP_SECONDS.time(message="profile"):
+            email_server = smtplib.SMTP(
+                self.email.get("host"),
+                self.email.get("port"))
+            email_server.ehlo()
+            if self.email.get("tls"):
+                email_server.starttls()
+            body = MIMEText(body, _charset="UTF-8")
+            message.attach(body)
+            graph_turtle = io.StringIO(
+                self.graph.serialize(format='turtle').decode())
+            attachment = MIMEText(graph_turtle.read())
+            attachment.add_header('Content-Disposition', 
+                'attachment',
+                filename='profile.ttl')
+            message.attach(attachment)
+            email_server.login(
+                self.email.get("user"),
+                self.email.get("password"))
+            recipients = list(set(self.recipients)) # Quick dedup
+            email_server.sendmail(self.email.get("user"), 
+                recipients, 
+                message.as_string())
+            email_server.close()
 
     def __add_article__(self, work_iri, work_form):
         """Article specific data added to creative work
@@ -566,98 +590,52 @@ def __email_work__(**kwargs):
         message.attach(attachment)
         
     #try:
-    server = smtplib.SMTP(config.get('EMAIL')['host'],
-                          config.get('EMAIL')['port'])
-
-    server.ehlo()
-    if config.get('EMAIL')['tls']:
-        server.starttls()
-    server.ehlo()
-    server.login(sender,
-                 config.get("EMAIL")["password"])
-    recipients = list(set(recipients)) # Quick dedup
-    server.sendmail(sender, recipients, message.as_string())
-    server.close()
-
+    with SMTP_SECONDS.time(message="work"):
+        server = smtplib.SMTP(config.get('EMAIL')['host'],
+                              config.get('EMAIL')['port'])
+
+        server.ehlo()
+        if config.get('EMAIL')['tls']:
+            server.starttls()
+        server.ehlo()
+        server.login(sender,
+                     config.get("EMAIL")["password"])
+        recipients = list(set(recipients)) # Quick dedup
+        server.sendmail(sender, recipients, message.as_string())
+        server.close()
+
+
+def lookup_person(connection, email):
+    """Returns the IRI of the person with an email, None if there isn't
+    one
+
+    Args:
+        connection: rdfframework connections with a datastore
+        email(str): Email address, matched ignoring case
+    """
+    if not email:
+        return None
+    EMAIL_INDEX.refresh(connection)
+    person_iri = EMAIL_INDEX.person(email)
+    if person_iri is None:
+        return None
+    return rdflib.URIRef(person_iri)
+
+def person_for_user(connection, current_user):
+    """Returns the logged in user's person IRI, resolved at login or looked
+    up from their email and remembered on the user"""
+    person_iri = getattr(current_user, "person_iri", None)
+    if person_iri is None:
+        person_iri = lookup_person(connection, current_user.data.get("mail"))
+        if person_iri is not None and hasattr(current_user, "person_iri"):
+            current_user.person_iri = person_iri
+    return person_iri
 
 def generate_citation_html(citation):
-    soup = BeautifulSoup("", 'lxml')
-    div = soup.new_tag("div", **{"class": "row"})
-    col_1 = soup.new_tag("div", **{"class": "col-1"})
-    citation_type = citation.get("ENTRYTYPE")
-    if citation_type.startswith("article"):
-       col_1.append(soup.new_tag("i", **{"class": "fas fa-file-alt"}))
-    elif citation_type.endswith("book"):
-        col_1.append(soup.new_tag("i", **{"class": "fas fa-book"}))
-    under_review = soup.new_tag("em")
-    under_review.string = "In Review"
-    col_1.append(under_review)
-    div.append(col_1)  
-    col_2 = soup.new_tag("div", **{"class": "col-7"})
-    if "article_title" in citation:
-        name = citation.get("article_title")
-    elif "title" in citation:
-        name = citation.get("title")
-    if "url" in citation:
-        work_link = soup.new_tag("a", href=citation.get("url"))
-        work_link.string = name
-        col_2.append(work_link)
-    else:
-        span = soup.new_tag("span")
-        span.string = name
-        col_2.append(span)
-    if "journal_title" in citation:
-        em = soup.new_tag("em")
-        em.string = citation.get("journal_title")
-        col_2.append(em)
-    if "year" in citation:
-        span = soup.new_tag("span")
-        span.string = "({0})".format(citation.get("year"))
-        col_2.append(span)
-    vol_number = citation.get("volume_number")
-    if vol_number and len(vol_number) > 0:
-        span = soup.new_tag("span")
-        span.string = "v. {}".format(vol_number)
-        col_2.append(span)
-    issue_number = citation.get("issue_number")
-    if issue_number and len(issue_number ) > 0:
-        span = soup.new_tag("span")
-        span.string = " no. {}".format(issue_number)
-        col_2.append(span)
-    page_start = citation.get("page_start")
-    if page_start and len(page_start) > 0:
-        span = soup.new_tag("span")
-        span.string = "p. {}".format(page_start)
-        col_2.append(span)
-    page_end = citation.get("page_end")
-    if page_end and len(page_end) > 0:
-        span = soup.new_tag("span")
-        if "page_start" in citation: 
-            page_string = "- {}."
-        else:
-            page_string = "{}."
-        span.string = page_string.format(page_end)
-        col_2.append(span)
-    div.append(col_2)
-    col_3 = soup.new_tag("div", **{"class": "col-4"})
-    iri = citation.get("iri")
-    if iri:
-        edit_click = "editCitation('{}');".format(iri)
-        delete_click = "deleteCitation('{}');".format(iri)
-    edit_a = soup.new_tag("a", **{"class": "btn btn-warning disabled",
-                                 "onclick": edit_click,
-                                 "type=": "input"})
-    edit_a.append(soup.new_tag("i", **{"class": "fas fa-edit"}))
-    col_3.append(edit_a)
-    delete_a = soup.new_tag("a", **{"class": "btn btn-danger",
-                                   "onclick": delete_click,
-                                   "type=": "input"})
-    delete_a.append(soup.new_tag("i", **{"class": "fas fa-trash-alt"}))
-    col_3.append(delete_a)
-    div.append(col_3)
-    return div.prettify()
+    return citation_html(citation)
  
 def __reconcile_article__(work_graph, connection):
+    import bibcat
     SCHEMA = rdflib.Namespace("http://schema.org/")
     for row in work_graph.query(
         """SELECT ?entity ?label WHERE { ?entity rdf:type schema:Periodical ;
@@ -727,6 +705,7 @@ def add_creative_work(**kwargs):
     """Calls utilities to populate and save to datastore"""
     config = kwargs.get("config")
     profile = EmailProfile(config)
+    profile.before_send = kwargs.get("before_send")
     current_user = kwargs.get("current_user")
     config_manager = kwargs.get('config_manager')
     connection = config_manager.conns
@@ -734,12 +713,9 @@ def add_creative_work(**kwargs):
     work_form = kwargs.get("work_form")
     BF = config_manager.nsm.bf
     SCHEMA = config_manager.nsm.schema
-    sparql = EMAIL_LOOKUP.format(
-            current_user.data.get('mail').lower())
-    email_results = connection.datastore.query(sparql)
-    if len(email_results) > 0:
-        generated_by = rdflib.URIRef(
-            email_results[0].get("person").get('value'))
+    person_iri = person_for_user(connection, current_user)
+    if person_iri is not None:
+        generated_by = person_iri
     work_iri = rdflib.URIRef(profile.add(work_form, generated_by))
     #profile.update("Added or Updated Creative Work")
     return {"message": "New work has been submitted for review",
@@ -757,16 +733,11 @@ def add_profile(**kwargs):
     current_user = kwargs.get("current_user")
     config_manager = kwargs.get('config_manager')
     profile = EmailProfile(config)
+    profile.before_send = kwargs.get("before_send")
     connection = config_manager.conns
     BF = config_manager.nsm.bf
     SCHEMA = config_manager.nsm.schema
-    results = connection.datastore.query(
-        EMAIL_LOOKUP.format(
-            current_user.data.get('mail').lower()))
-    if len(results) > 0:
-        generated_by = rdflib.URIRef(results[0].get("person").get('value'))
-    else:
-        generated_by = None
+    generated_by = person_for_user(connection, current_user)
     form = kwargs.get("form")
     if form.get("orcid"):
         person_uri = form.get("orcid")
@@ -892,6 +863,7 @@ def delete_creative_work(**kwargs):
  
 
 def edit_creative_work(**kwargs):
+    import utilities
     config = kwargs.get("config")
     git_profile = GitProfile(config)
     current_user_email = kwargs.get("current_user_email")
@@ -901,12 +873,7 @@ def edit_creative_work(**kwargs):
     raw_citation = kwargs.get("citation")
     work_type = kwargs.get("work_type", "article")
     if revised_by is None and current_user_email:
-        sparql = EMAIL_LOOKUP.format(
-                current_user_email.lower())
-        email_results = connection.datastore.query(sparql)
-        if len(email_results) > 0:
-            revised_by = rdflib.URIRef(
-                email_results[0].get("person").get('value'))
+        revised_by = lookup_person(connection, current_user_email)
     temp_work = rdflib.Graph()
     temp_work.namespace_manager.bind("cite",
         rdflib.Namespace("https://www.coloradocollege.edu/library/ns/citation/"))
@@ -959,12 +926,8 @@ def update_profile(**kwargs):
     person_iri = rdflib.URIRef(form.get("iri"))
     profile = EmailProfile(config_manager, person_iri) 
     msg = ""
-    results = connection.datastore.query(
-        EMAIL_LOOKUP.format(
-            current_user.data.get('mail').lower()))
-    if len(results) > 0:
-        generated_by = rdflib.URIRef(results[0].get("person").get('value'))
-    else:
+    generated_by = person_for_user(connection, current_user)
+    if generated_by is None:
         generated_by = person_iri
     msg = "{} made the following changes to {}'s academic profile:\n".format(
         generated_by,
@@ -0,0 +1,225 @@
+"""SPARQL query profiling for Scholarship App"""
+__author__ = "Jeremy Nelson"
+
+import functools
+import logging
+import string
+import threading
+import time
+
+from collections import namedtuple
+
+from flask import g, has_request_context, request
+
+from . import sparql as sparql_templates
+from .cache import DATASTORE_GENERATION, is_select, query_key
+
+SLOW_QUERY_LOG = logging.getLogger("scholarship_graph.slow_queries")
+
+# cached is True for results served from the query cache, which took no
+# triplestore time
+QueryProfile = namedtuple("QueryProfile",
+                          ["template", "elapsed", "rows", "bytes", "cached"],
+                          defaults=[False])
+
+# rdfframework datastore methods that change the triplestore
+WRITE_PREFIXES = ("create", "delete", "load", "reset", "update")
+
+def static_prefix(template):
+    """Returns the text of a str.format template before its first
+    replacement field, which every query formatted from it starts with.
+    Queries that are not format templates are returned whole."""
+    prefix = []
+    try:
+        for literal_text, field_name, spec, conversion in \
+            string.Formatter().parse(template):
+            prefix.append(literal_text)
+            if field_name is not None:
+                break
+    except ValueError:
+        return template
+    return "".join(prefix)
+
+def __load_templates__():
+    templates = []
+    for name in dir(sparql_templates):
+        template = getattr(sparql_templates, name)
+        if name.isupper() and isinstance(template, str) and \
+           template.startswith(sparql_templates.PREFIX) and \
+           template != sparql_templates.PREFIX:
+            templates.append((static_prefix(template), name))
+    # Longest prefixes first so the most specific template matches
+    return sorted(templates, key=lambda x: len(x[0]), reverse=True)
+
+TEMPLATES = __load_templates__()
+
+def template_name(sparql):
+    """Returns the name of the sparql.py template a query was formatted from
+    or "adhoc" for queries built in place"""
+    for prefix, name in TEMPLATES:
+        if sparql.startswith(prefix):
+            return name
+    return "adhoc"
+
+def result_bytes(rows):
+    """Size of the bound values in a result set, a close approximation of
+    the response size without serializing it again"""
+    size = 0
+    for row in rows:
+        for binding in row.values():
+            size += len(binding.get("value", ""))
+    return size
+
+def request_queries():
+    """Profiles of the queries run by the current request"""
+    if not has_request_context():
+        return []
+    return g.get("sparql_queries", [])
+
+def server_timing(profiles):
+    """Formats query profiles as a Server-Timing header with the total and
+    the time spent in each template"""
+    templates = dict()
+    for profile in profiles:
+        templates[profile.template] = templates.get(profile.template, 0) + \
+            profile.elapsed
+    cached = len([profile for profile in profiles if profile.cached])
+    timings = ['sparql;dur={:.1f};desc="{} queries, {} cached"'.format(
+        sum(templates.values()) * 1000, len(profiles), cached)]
+    for name, elapsed in sorted(templates.items(), key=lambda x: -x[1]):
+        timings.append("sparql-{};dur={:.1f}".format(name, elapsed * 1000))
+    return ", ".join(timings)
+
+def debug_footer(profiles):
+    """Returns a HTML footer listing each query of a request"""
+    lines = ["{:<28}{:>10}{:>8}{:>10}{:>8}".format(
+        "template", "ms", "rows", "bytes", "cached")]
+    for profile in profiles:
+        lines.append("{:<28}{:>10.1f}{:>8}{:>10}{:>8}".format(
+            profile.template,
+            profile.elapsed * 1000,
+            profile.rows,
+            profile.bytes,
+            "yes" if profile.cached else ""))
+    return '<footer class="sparql-profile"><pre>{}</pre></footer>'.format(
+        "\n".join(lines))
+
+def log_slow_query(profile, sparql, path):
+    SLOW_QUERY_LOG.warning("%s took %.1f ms, %s rows, %s bytes, %s\n%s",
+        profile.template,
+        profile.elapsed * 1000,
+        profile.rows,
+        profile.bytes,
+        path,
+        sparql)
+
+
+def __bumps_generation__(method):
+    @functools.wraps(method)
+    def __write__(*args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        finally:
+            DATASTORE_GENERATION.bump()
+    return __write__
+
+
+class ProfiledDatastore(object):
+    """Wraps a rdfframework datastore connection, timing every query and
+    recording its template, row count and size on the current request.
+    Queries slower than slow_seconds are written to the slow query log.
+    SELECT results are served from and stored in cache when one is set,
+    and writes through the wrapper bump the datastore generation."""
+
+    def __init__(self, datastore, slow_seconds=1.0, listeners=None,
+                 cache=None):
+        self.datastore = datastore
+        self.slow_seconds = slow_seconds
+        self.listeners = listeners if listeners is not None else []
+        self.cache = cache
+
+    def __getattr__(self, name):
+        attribute = getattr(self.datastore, name)
+        if name.startswith(WRITE_PREFIXES) and callable(attribute):
+            return __bumps_generation__(attribute)
+        return attribute
+
+    def __record__(self, profile, sparql):
+        if has_request_context():
+            g.setdefault("sparql_queries", []).append(profile)
+        if not profile.cached and self.slow_seconds is not None and \
+           profile.elapsed >= self.slow_seconds:
+            log_slow_query(profile, sparql,
+                request.path if has_request_context() else "background")
+        for listener in self.listeners:
+            listener(profile)
+
+    def query(self, sparql, *args, use_cache=True, **kwargs):
+        """Runs a query, use_cache=False skips the cache for results that
+        are read once, like export pages"""
+        key, generation = None, None
+        if use_cache and self.cache is not None and is_select(sparql):
+            key = query_key(sparql, *args, **kwargs)
+            # Read before the query so a reload while it runs isn't
+            # cached as current
+            generation = self.cache.generation()
+            results = self.cache.get(key)
+            if results is not None:
+                self.__record__(QueryProfile(template_name(sparql),
+                                             0.0,
+                                             len(results),
+                                             result_bytes(results),
+                                             True),
+                                sparql)
+                return results
+        start = time.perf_counter()
+        results = self.datastore.query(sparql, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        rows = results if isinstance(results, list) else []
+        self.__record__(QueryProfile(template_name(sparql),
+                                     elapsed,
+                                     len(rows),
+                                     result_bytes(rows)),
+                        sparql)
+        if key is not None and isinstance(results, list):
+            self.cache.set(key, results, generation)
+        return results
+
+
+class ProfiledConnections(object):
+    """rdfframework connections where the datastore is a ProfiledDatastore,
+    every other attribute is passed through. When conns is None, loader is
+    called on first use to set them."""
+
+    def __init__(self, conns, slow_seconds=1.0, cache=None, loader=None):
+        self.conns = conns
+        self.slow_seconds = slow_seconds
+        self.listeners = []
+        self.cache = cache
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.__datastore__ = None
+
+    def __connections__(self):
+        if self.conns is None and self.loader is not None:
+            with self.lock:
+                if self.conns is None:
+                    self.loader()
+        return self.conns
+
+    def __getattr__(self, name):
+        return getattr(self.__connections__(), name)
+
+    @property
+    def datastore(self):
+        datastore = self.__connections__().datastore
+        # The wrapper follows the connection if rdfframework replaces it
+        # and the cache if it is turned on or off
+        if self.__datastore__ is None or \
+           self.__datastore__.datastore is not datastore or \
+           self.__datastore__.cache is not self.cache:
+            self.__datastore__ = ProfiledDatastore(datastore,
+                self.slow_seconds,
+                self.listeners,
+                self.cache)
+        return self.__datastore__
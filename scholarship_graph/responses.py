@@ -0,0 +1,79 @@
+"""Cacheable, compressed HTTP responses for Scholarship App"""
+__author__ = "Jeremy Nelson"
+
+import gzip
+import hashlib
+import json
+
+from flask import Response, request
+
+from .cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Serialized JSON bodies and their ETags, dropped when the triplestore reloads
+JSON_RESPONSES = LRUCache(max_entries=2048,
+                          max_bytes=64 * 1024 * 1024,
+                          sizeof=lambda entry: len(entry[1]))
+
+def accepted_encoding():
+    """The best content encoding the client accepts, Brotli when the brotli
+    package is installed, otherwise gzip, None for neither"""
+    if brotli is not None and "br" in request.accept_encodings:
+        return "br"
+    if "gzip" in request.accept_encodings:
+        return "gzip"
+    return None
+
+def compress(body, encoding):
+    """Compresses body with a content encoding from accepted_encoding"""
+    if encoding == "br":
+        return brotli.compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body)
+    return body
+
+def json_response(key, build, max_age=300, min_compress=512):
+    """Returns a JSON response with an ETag, Cache-Control and compression,
+    or a 304 when the client's If-None-Match matches. The body is built
+    once per datastore generation and then served from memory.
+
+    Args:
+        key: Cache key for the body, usually the route and arguments
+        build(function): Returns the JSON serializable payload, returning
+            None responds with 404
+        max_age(int): Seconds clients and proxies may cache the response
+        min_compress(int): Smallest body in bytes worth compressing
+    """
+    entry = JSON_RESPONSES.get(key)
+    if entry is None:
+        payload = build()
+        if payload is None:
+            return Response(json.dumps({"message": "Not found"}),
+                            status=404,
+                            mimetype="application/json")
+        body = json.dumps(payload, sort_keys=True).encode()
+        entry = (hashlib.sha1(body).hexdigest(), body)
+        JSON_RESPONSES.set(key, entry)
+    etag, body = entry
+    encoding = None
+    if len(body) >= min_compress:
+        encoding = accepted_encoding()
+    if encoding is not None:
+        # Each encoding's bytes are a different representation, so they
+        # need their own ETag
+        etag = "{}-{}".format(etag, encoding)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(compress(body, encoding),
+                            mimetype="application/json")
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age={}".format(max_age)
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
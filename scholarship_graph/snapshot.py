@@ -0,0 +1,167 @@
+"""Read-only snapshot of the triplestore for Scholarship App, built once in
+the gunicorn master when preloading and shared copy-on-write by forked
+workers. A worker that sees a newer datastore generation rebuilds its own
+copy, which is then private to that worker.
+
+Strings are packed into one bytes blob with array offsets and rows are
+arrays of string ids, so the snapshot is a handful of large objects
+instead of millions of small ones. Reading it doesn't change reference
+counts on the shared pages and the garbage collector has nothing to scan,
+so workers don't copy the pages they read."""
+__author__ = "Jeremy Nelson"
+
+import bisect
+import threading
+
+from array import array
+
+from .cache import DATASTORE_GENERATION
+from .sparql import ORG_LISTING, PREFIX
+
+SUBJECTS_SNAPSHOT = PREFIX + """
+SELECT DISTINCT ?subject ?label
+WHERE {
+    ?subject rdf:type bf:Topic ;
+             rdfs:label ?label .
+}"""
+
+class StringTable(object):
+    """Immutable list of strings stored as one UTF-8 blob and an array of
+    offsets, items are decoded when read"""
+
+    def __init__(self, strings):
+        offsets = array("Q", [0])
+        chunks = []
+        for string in strings:
+            encoded = string.encode("utf-8")
+            chunks.append(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+        self.blob = b"".join(chunks)
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        return self.blob[self.offsets[position]:
+                         self.offsets[position + 1]].decode("utf-8")
+
+    def nbytes(self):
+        return len(self.blob) + self.offsets.itemsize * len(self.offsets)
+
+
+class RowIndex(object):
+    """Rows of strings grouped by a key, keys are kept sorted for a binary
+    search and each row is a slice of an array of string ids
+
+    Args:
+        rows(iterable): (key, fields) pairs, fields is a tuple of strings of
+            width; rows for a key keep their order
+        width(int): Number of fields in every row
+    """
+
+    def __init__(self, rows, width):
+        self.width = width
+        grouped, ids, strings = dict(), dict(), []
+        for key, fields in rows:
+            row = []
+            for field in fields:
+                if not field in ids:
+                    ids[field] = len(strings)
+                    strings.append(field)
+                row.append(ids[field])
+            grouped.setdefault(key, []).extend(row)
+        keys = sorted(grouped)
+        starts, values = array("Q", [0]), array("I")
+        for key in keys:
+            values.extend(grouped[key])
+            starts.append(len(values))
+        self.keys = StringTable(keys)
+        self.starts = starts
+        self.values = values
+        self.strings = StringTable(strings)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, key, default=None):
+        """Returns the list of row tuples for key"""
+        position = bisect.bisect_left(self.keys, key)
+        if position >= len(self.keys) or self.keys[position] != key:
+            return default
+        output = []
+        for offset in range(self.starts[position], self.starts[position + 1],
+                            self.width):
+            output.append(tuple(self.strings[self.values[i]]
+                                for i in range(offset, offset + self.width)))
+        return output
+
+    def nbytes(self):
+        return self.keys.nbytes() + self.strings.nbytes() + \
+            self.starts.itemsize * len(self.starts) + \
+            self.values.itemsize * len(self.values)
+
+
+class GraphSnapshot(object):
+    """Subjects and the org listing as compact read-only indexes, rebuilt
+    when the datastore generation it was built at is no longer current"""
+
+    def __init__(self):
+        self.generation = None
+        self.subjects = None
+        self.orgs = None
+        self.lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self.generation == DATASTORE_GENERATION.value
+
+    def __load__(self, connection):
+        generation = DATASTORE_GENERATION.value
+        query = connection.datastore.query
+        self.subjects = RowIndex(
+            [(row.get("subject").get("value"),
+              (row.get("label").get("value"),))
+             for row in query(SUBJECTS_SNAPSHOT)], 1)
+        self.orgs = RowIndex(
+            [("", (row.get("iri").get("value"), row.get("label").get("value")))
+             for row in query(ORG_LISTING)], 2)
+        self.generation = generation
+
+    def build(self, connection):
+        """Queries the triplestore and builds every index
+
+        Args:
+            connection: rdfframework connections with a datastore
+        """
+        with self.lock:
+            self.__load__(connection)
+        return self
+
+    def refresh(self, connection):
+        """Rebuilds the snapshot if it was built from an older datastore
+        generation, returns False if it was never built
+
+        Args:
+            connection: rdfframework connections with a datastore
+        """
+        if self.generation is None:
+            return False
+        if not self.current:
+            with self.lock:
+                if not self.current:
+                    self.__load__(connection)
+        return True
+
+    def org_listing(self):
+        return self.orgs.get("", [])
+
+    def subject_label(self, subject_iri):
+        rows = self.subjects.get(subject_iri)
+        if rows is None:
+            return None
+        return rows[0][0]
+
+    def nbytes(self):
+        indexes = [self.subjects, self.orgs]
+        return sum(index.nbytes() for index in indexes if index is not None)
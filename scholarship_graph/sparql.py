@@ -129,8 +129,27 @@ WHERE {{
 	OPTIONAL {{?creative_work bf:note ?note.}}
 	OPTIONAL {{?creative_work schema:url ?url.}}
 	}}
-"""
+	ORDER BY DESC(?publicationDate) ?creative_work"""
 	
+ACADEMIC_YEARS = PREFIX + """
+SELECT DISTINCT ?academic_year ?start ?end
+WHERE {
+    ?event schema:superEvent ?academic_year .
+    ?academic_year schema:startDate ?start ;
+                   schema:endDate ?end .
+}"""
+
+CHANGES = PREFIX + """
+SELECT DISTINCT ?entity ?kind ?changed
+WHERE {
+    { ?entity prov:qualifiedGeneration ?change .
+      BIND("generation" as ?kind) }
+    UNION
+    { ?entity prov:qualifiedRevision ?change .
+      BIND("revision" as ?kind) }
+    ?change prov:atTime ?changed .
+}"""
+
 COUNT_ARTICLES = PREFIX + """
 SELECT (COUNT(?article) as ?count)
 WHERE {
@@ -180,22 +199,34 @@ EMAIL_LOOKUP = PREFIX + """SELECT ?person
 WHERE {{ ?person schema:email ?email .
        FILTER(CONTAINS(?email, "{0}")) 
 }}"""
- 
 
-ORG_INFO = PREFIX + """
-SELECT DISTINCT ?label ?year ?year_label
+# Every person's emails, loaded into profiles.EMAIL_INDEX
+PERSON_EMAILS = PREFIX + """SELECT ?person ?email
+WHERE { ?person schema:email ?email . }"""
+
+EXPORT_TRIPLES = PREFIX + """
+SELECT ?s ?p ?o
 WHERE {{
-    
-    ?org rdfs:label ?label .
-    ?year schema:organizer ?org ;
-          rdfs:label ?year_label ;
-          schema:superEvent ?academic_year .
-    ?academic_year schema:startDate ?start ;
-                   schema:endDate ?end . 
-    FILTER(?start < "{1}"^^xsd:dateTime)
-    FILTER(?end >= "{1}"^^xsd:dateTime) 
-    FILTER(?org = <{0}>)
-}}"""
+    {{ SELECT DISTINCT ?s ?key
+       WHERE {{
+           VALUES ?type {{ {0} }}
+           ?s rdf:type ?type .
+           BIND(STR(?s) as ?key)
+           {1}
+       }}
+       ORDER BY ?key
+       {2} }}
+    ?s ?p ?o .
+}}
+ORDER BY ?key ?p ?o"""
+
+EXPORT_AFTER = """FILTER(?key > "{0}")"""
+
+EXPORT_SINCE = """FILTER EXISTS {{
+        ?s prov:qualifiedGeneration|prov:qualifiedRevision ?change .
+        ?change prov:atTime ?changed .
+        FILTER(xsd:dateTime(str(?changed)) > "{0}"^^xsd:dateTime) }}"""
+ 
 
 ORG_LISTING = PREFIX + """
 
@@ -243,16 +274,53 @@ PERSON_HISTORY = PREFIX + """
 
 SELECT ?org ?event ?year_label ?rank ?end
 WHERE {{
+    VALUES ?year_event {{ {1} }}
     ?event ?rank_iri ?person ;
            schema:organizer ?org ;
            rdfs:label ?year_label ;
            schema:superEvent ?year_event .
-    ?year_event schema:endDate ?end ;
-                schema:startDate ?start .
+    ?year_event schema:endDate ?end .
     ?rank_iri rdfs:label ?rank .
     FILTER(<{0}> = ?person)
-    FILTER (?start < "{1}"^^xsd:dateTime)
-    FILTER (?end > "{1}"^^xsd:dateTime)
+}} ORDER BY ?end"""
+
+ORG_YEARS_PEOPLE = PREFIX + """
+SELECT DISTINCT ?label ?year ?year_label ?person ?name ?family ?rank ?statement
+WHERE {{
+    BIND(<{0}> as ?org)
+    VALUES ?academic_year {{ {1} }}
+    ?org rdfs:label ?label .
+    ?year schema:organizer ?org ;
+          rdfs:label ?year_label ;
+          schema:superEvent ?academic_year .
+    OPTIONAL {{
+        ?year ?rank_iri ?person .
+        ?rank_iri rdfs:label ?rank .
+        ?person rdf:type bf:Person ;
+                schema:familyName ?family ;
+                rdfs:label ?name .
+        OPTIONAL {{ ?stmt_iri schema:accountablePerson ?person ;
+                              schema:description ?statement . }}
+    }}
+}}"""
+
+PEOPLE_PREFETCH = PREFIX + """
+
+SELECT ?person ?org ?event ?year_label ?rank ?end ?statement
+WHERE {{
+    VALUES ?person {{ {0} }}
+    {{
+        VALUES ?year_event {{ {1} }}
+        ?event ?rank_iri ?person ;
+               schema:organizer ?org ;
+               rdfs:label ?year_label ;
+               schema:superEvent ?year_event .
+        ?year_event schema:endDate ?end .
+        ?rank_iri rdfs:label ?rank .
+    }} UNION {{
+        ?stmt_iri schema:accountablePerson ?person ;
+                  schema:description ?statement .
+    }}
 }} ORDER BY ?end"""
 
 PERSON_INFO = PREFIX + """
@@ -322,6 +390,21 @@ WHERE {{
     FILTER (?person = <{0}>)
 }}"""
 
+SUBJECT_LABEL = PREFIX + """
+SELECT ?label
+WHERE {{
+    BIND(<{0}> as ?subject)
+    ?subject rdfs:label ?label .
+}}"""
+
+SUBJECT_PEOPLE = PREFIX + """
+SELECT ?person
+WHERE {{
+    BIND(<{0}> as ?subject)
+    ?stmt schema:about ?subject ;
+          schema:accountablePerson ?person .
+}}"""
+
 WORK_INFO = PREFIX + """
 SELECT * 
 WHERE {{
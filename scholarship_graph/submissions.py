@@ -0,0 +1,225 @@
+"""Write-behind submissions for Scholarship App. New works and profiles are
+validated in the request, saved to a SQLite file and processed by a
+background thread, so the email lookup, graph build and SMTP notification
+happen after the response; clients poll the submission's status."""
+__author__ = "Jeremy Nelson"
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+SUBMISSION_LOG = logging.getLogger("scholarship_graph.submissions")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class SubmissionStore(object):
+    """SQLite file of submitted forms and their status, shared by the
+    workers on a host. A submission is claimed by one worker, so any worker
+    may pick up the queued submissions left by a worker that stopped.
+
+    Args:
+        path(str): SQLite database file
+        keep_seconds(int): Finished submissions are kept this long for
+            status polling
+        stale_seconds(int): Running submissions not finished after this
+            long are queued again, or marked done if their email was sent
+    """
+
+    def __init__(self, path, keep_seconds=7 * 86400, stale_seconds=900):
+        self.path = path
+        self.keep_seconds = keep_seconds
+        self.stale_seconds = stale_seconds
+        self.local = threading.local()
+        self.__connect__().execute("""CREATE TABLE IF NOT EXISTS submissions (
+            id TEXT PRIMARY KEY,
+            kind TEXT,
+            status TEXT,
+            user TEXT,
+            form TEXT,
+            result TEXT,
+            error TEXT,
+            created REAL,
+            updated REAL,
+            sent REAL)""")
+
+    def __connect__(self):
+        # Connections are per thread and are not used across a fork
+        pid, db = getattr(self.local, "connection", (None, None))
+        if pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = (os.getpid(), db)
+        return db
+
+    def add(self, kind, user, form):
+        """Saves a submission and returns its id
+
+        Args:
+            kind(str): Handler for the submission
+            user(dict): Submitter's id and attributes
+            form(list): (name, value) pairs of the submitted form
+        """
+        submission_id = uuid.uuid4().hex
+        now = time.time()
+        self.__connect__().execute(
+            "INSERT INTO submissions VALUES "
+            "(?, ?, ?, ?, ?, NULL, NULL, ?, ?, NULL)",
+            (submission_id, kind, QUEUED, json.dumps(user), json.dumps(form),
+             now, now))
+        return submission_id
+
+    def claim(self, submission_id):
+        """Marks a queued submission as running and returns it, None when
+        another worker has it"""
+        cursor = self.__connect__().execute(
+            "UPDATE submissions SET status = ?, updated = ? "
+            "WHERE id = ? AND status = ?",
+            (RUNNING, time.time(), submission_id, QUEUED))
+        if cursor.rowcount < 1:
+            return None
+        return self.get(submission_id)
+
+    def mark_sent(self, submission_id):
+        """Records that a submission's email is being sent, returns False
+        when an earlier attempt already sent it"""
+        cursor = self.__connect__().execute(
+            "UPDATE submissions SET sent = ? WHERE id = ? AND sent IS NULL",
+            (time.time(), submission_id))
+        return cursor.rowcount > 0
+
+    def finish(self, submission_id, result):
+        self.__connect__().execute(
+            "UPDATE submissions SET status = ?, result = ?, updated = ? "
+            "WHERE id = ?",
+            (DONE, json.dumps(result), time.time(), submission_id))
+
+    def fail(self, submission_id, error):
+        self.__connect__().execute(
+            "UPDATE submissions SET status = ?, error = ?, updated = ? "
+            "WHERE id = ?",
+            (FAILED, error, time.time(), submission_id))
+
+    def get(self, submission_id):
+        row = self.__connect__().execute(
+            "SELECT id, kind, status, user, form, result, error, created, "
+            "updated, sent FROM submissions WHERE id = ?",
+            (submission_id,)).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0],
+                "kind": row[1],
+                "status": row[2],
+                "user": json.loads(row[3]),
+                "form": json.loads(row[4]),
+                "result": None if row[5] is None else json.loads(row[5]),
+                "error": row[6],
+                "created": row[7],
+                "updated": row[8],
+                "sent": row[9]}
+
+    def pending(self):
+        """Queues stale running submissions again, drops old finished ones
+        and returns the ids of queued submissions, oldest first"""
+        now = time.time()
+        db = self.__connect__()
+        # A stale submission whose email went out isn't run again, the
+        # administrators already have it
+        db.execute("UPDATE submissions SET status = ?, updated = ? "
+                   "WHERE status = ? AND updated < ? AND sent IS NOT NULL",
+                   (DONE, now, RUNNING, now - self.stale_seconds))
+        db.execute("UPDATE submissions SET status = ? "
+                   "WHERE status = ? AND updated < ?",
+                   (QUEUED, RUNNING, now - self.stale_seconds))
+        db.execute("DELETE FROM submissions "
+                   "WHERE status IN (?, ?) AND updated < ?",
+                   (DONE, FAILED, now - self.keep_seconds))
+        return [row[0] for row in db.execute(
+            "SELECT id FROM submissions WHERE status = ? ORDER BY created",
+            (QUEUED,))]
+
+    def counts(self):
+        return dict(self.__connect__().execute(
+            "SELECT status, COUNT(*) FROM submissions GROUP BY status"))
+
+
+class SubmissionWorker(threading.Thread):
+    """Runs a process's submissions one at a time"""
+
+    def __init__(self, submissions):
+        threading.Thread.__init__(self, daemon=True)
+        self.submissions = submissions
+        self.queue = queue.Queue()
+
+    def run(self):
+        while True:
+            submission_id = self.queue.get()
+            if submission_id is None:
+                break
+            self.submissions.process(submission_id)
+
+
+class Submissions(object):
+    """Saves submissions to a SubmissionStore and hands them to a worker
+    thread. The thread is started on first use in each process, so a
+    gunicorn master that preloads the app doesn't fork it away, and picks
+    up whatever was left queued when it starts.
+
+    Args:
+        store(SubmissionStore): Saved submissions
+        handlers(dict): Function for each kind of submission, called with
+            the saved submission and returning a JSON-serializable result.
+            The submission's "mark_sent" is called before its email is
+            sent and returns False when it already was.
+    """
+
+    def __init__(self, store, handlers):
+        self.store = store
+        self.handlers = handlers
+        self.worker = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def __worker__(self):
+        with self.lock:
+            if self.pid != os.getpid() or not self.worker.is_alive():
+                self.worker = SubmissionWorker(self)
+                self.pid = os.getpid()
+                for submission_id in self.store.pending():
+                    self.worker.queue.put(submission_id)
+                self.worker.start()
+        return self.worker
+
+    def submit(self, kind, user, form):
+        """Saves a submission for the background worker and returns its
+        id"""
+        submission_id = self.store.add(kind, user, form)
+        self.__worker__().queue.put(submission_id)
+        return submission_id
+
+    def status(self, submission_id):
+        self.__worker__()
+        return self.store.get(submission_id)
+
+    def process(self, submission_id):
+        submission = self.store.claim(submission_id)
+        if submission is None:
+            return
+        submission["mark_sent"] = lambda: self.store.mark_sent(submission_id)
+        try:
+            result = self.handlers[submission["kind"]](submission)
+            self.store.finish(submission_id, result)
+        except Exception as error:
+            SUBMISSION_LOG.exception("Submission %s failed", submission_id)
+            self.store.fail(submission_id, str(error))
+
+    def stop(self):
+        if self.worker is not None and self.pid == os.getpid():
+            self.worker.queue.put(None)
+            self.worker.join()
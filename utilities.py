@@ -3,15 +3,13 @@ __author__ = "Diane Westerfield"
 import uuid
 import click
 import codecs
-import re
 import sys
 import pdb
 from sys import exit
 import rdflib
 from rdflib import RDFS
-import bibtexparser
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.customization import convert_to_unicode
+
+from scholarship_graph.authors import parse_authors
 
 # tip: export citations from RefWorks. Direct export from Web of Science does not work.
 BF = rdflib.Namespace("http://id.loc.gov/ontologies/bibframe/")
@@ -230,74 +228,15 @@ class Citation(object):
         # to do: account for multiple CC authors. Currently this will take the last match.
         # to do: what happens if there are no matches?
         self.cc_authors=[]
-        default = " and "
-        delimiters = [";", ","]
-        delimiters.append(default)
-        for row in delimiters:
-            if row in self.raw_citation["author"]:
-                default = row
-                break 
-        for name in self.raw_citation["author"].split(default):
-            family_name=""
-            given_name=""
-            name_parsed=""
-            author_name_parsed=""
-            author_iri=""
-
-            #to do: regex expression that covers all parsing
-            #import pdb;pdb.set_trace()
-            name = name.strip()
-            if name.endswith("."):
-                name = name[:-1]
-            if "." in name:
-                try:
-                    # GivenName Initial FamilyName ex. Jane C. Doe
-                    name_parsed = re.search(r"(\w+)\s\w?\.\s(\w+\-?\w+)",name).groups()
-                except:
-                    # Initial GivenName FamilyName ex. C. Jane Doe
-                    if re.search(r"w?\.\s(\w+)\s(\w+\-?\w+)",name) != None:
-                        name_parsed = re.search(r"w?\.\s(\w+)\s(\w+\-?\w+)",name).groups()
-                    # Initial Initial FamilyName ex. J. C. Doe
-                    elif re.search(r"(\w+\.)\s(\w+\.)\s(\w+)",name) != None:
-                        name_parsed = re.search(r"(\w+\.)\s(\w+\.)\s(\w+)",name).groups()
-                    # GivenName Initial Initial Family Name ex. Jane C. D. Doe
-                    elif re.search(r"(\w+)\s\w?\.\s\w?\.\s(\w+\-?\w+)",name) !=None:
-                        name_parsed = re.search(r"(\w+)\s\w?\.\s\w?\.\s(\w+\-?\w+)",name).groups()       
-                    # Initial FamilyName ex. J. Doe
-                    elif re.search(r"(\w+\.)\s(\w+)",name) != None:
-                        name_parsed = re.search(r"(\w+\.)\s(\w+)",name).groups()
-                else:
-                    name_parsed = []
-                    for word in name.split(" "):
-                        word = word.strip()
-                        if word != None or word != "":
-                            name_parsed.append(word)
-
-                    
-            else: # GivenName [middle name] FamilyName ex. Jane Doe or Jane Carla Doe
-                name_parsed = []
-                for word in name.split(" "):
-                    name_parsed.append(word)
-            # print("The name is",name_parsed,"for ",self.raw_citation["title"])
-
-            given_name = name_parsed[0]
-            family_name = name_parsed[len(name_parsed)-1]
-            author_name_parsed = given_name + " " + family_name            
-            author_name_parsed = author_name_parsed.strip()
-
-
-            if author_lookup(self.people, author_name_parsed) != None:
-                author_iri=author_lookup(self.people, author_name_parsed)
-                # print("Author",author_name_parsed,"found in author lookup")
-                self.cc_authors.append(author_iri)
-            elif alternate_author_lookup(self.people, author_name_parsed) != None:
-                author_iri=alternate_author_lookup(self.people, author_name_parsed)
-                # print("Author",author_name_parsed,"found in alternate author lookup")
-                self.cc_authors.append(author_iri)
+        for author_name in parse_authors(self.raw_citation["author"]):
+            author_name_parsed = author_name.label
+            author_iri = author_lookup(self.people, author_name_parsed)
+            if author_iri is None:
+                author_iri = alternate_author_lookup(self.people,
+                    author_name_parsed)
             #to do: code to search on family name plus initial first letter of givenname?
-            else:
-                # print("Author",author_name_parsed,"not found")
-                pass
+            if author_iri is not None:
+                self.cc_authors.append(author_iri)
                
         # attempt to salvage a citation with no matched CC authors        
         if self.cc_authors == [] and self.is_interactive:
@@ -898,6 +837,7 @@ class Book_Chapter_Citation(Book_Citation):
         
             
 def load_citations(bibtext_filepath, creative_works_path):
+    import bibtexparser
     # Take the bibparse data and load it into the creative_works knowledge graph
     with open(bibtext_filepath) as bibtex_file:
         bibtex_str = bibtex_file.read()